@@ -0,0 +1,40 @@
+# app/api/middleware.py
+# ASGI middleware of the app.
+# - MetricsMiddleware times every HTTP request in http_request_duration_seconds, labeled with the route template
+#   (/users/{username}/projects, not the username: one series per route) and the status code
+
+
+import time
+from app.core.config import settings
+from app.core.metrics import HTTP_REQUEST_DURATION
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI (no BaseHTTPMiddleware): the streamed responses pass through untouched and are timed to their last chunk.
+    - the route is set in the scope by the router once it matched, "unmatched" for the 404s of unknown paths
+    - a request failing with an unhandled exception is counted as a 500
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, scope["method"], route, status)
@@ -0,0 +1,27 @@
+# app/api/responses.py
+# Response classes of the fast read path (settings.FAST_READS).
+# The repositories return plain rows for these responses, they are serialized as they are: no response_model
+# validation and no model instance per row. orjson is used when it is installed (poetry install -E fast-json).
+
+
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> str:
+    # datetimes, as orjson and the response_model path write them
+    return value.isoformat()
+
+
+class FastJSONResponse(JSONResponse):
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
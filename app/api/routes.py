@@ -2,17 +2,38 @@
 # ALL EXCEPTIONS WILL BE CAUGHT BY THE EXCEPTION HANDLERS IN THE MAIN.PY FILE
 
 
-from fastapi import APIRouter, HTTPException, Path
-from typing import List
-from app.models import User, Project
+import json
+from fastapi import APIRouter, Header, HTTPException, Path, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Literal, Optional
+from app.core.config import settings
+from app.api.responses import FastJSONResponse
+from app.models import User, Project, ScrapeJob, BatchScrapeRequest, USERNAME_PATTERN
 from app.services.user_service import Service
 from app.core.exceptions import NotFoundError, DatabaseError, ExternalAPIError
 
 router = APIRouter()
 
-@router.get("/users/{username}/projects", response_model=List[Project])
+NDJSON = "application/x-ndjson"
+
+
+def job_accepted(job: ScrapeJob) -> JSONResponse:
+    # the scrape runs in the background, polled at the Location
+    return JSONResponse(status_code=202, content=jsonable_encoder(job), headers={"Location": f"/jobs/{job.id}"})
+
+
+@router.get("/users/{username}/projects", response_model=List[Project], responses={202: {"model": ScrapeJob}})
 async def get_user_projects(
-    username: str = Path(..., pattern=r"^[a-zA-Z0-9-]{1,39}$", description="GitHub username")
+    request: Request,
+    response: Response,
+    username: str = Path(..., pattern=USERNAME_PATTERN, description="GitHub username"),
+    prefer: Optional[str] = Header(None, description='"respond-async" to get a scrape job instead of waiting for GitHub'),
+    accept: Optional[str] = Header(None, description='"application/x-ndjson" to stream the projects, one JSON object per line'),
+    sort: Optional[Literal["stars", "forks", "name"]] = Query(None, description="Sort by stars, forks (descending) or name"),
+    limit: Optional[int] = Query(None, gt=0, le=100, description="Projects per page"),
+    after: Optional[str] = Query(None, max_length=200, description="Cursor of the next page, from the Link header of the previous one"),
+    min_stars: Optional[int] = Query(None, ge=0, description="Only the projects with at least this many stars")
 ):
     """
     fetches projects for a given user.
@@ -23,12 +44,74 @@ async def get_user_projects(
         a. if the user has no projects in the database, the api should return an empty list
         b. if the user has projects in the database, the api should return the projects
     3. Allow other errors to propagate from the service such as DatabaseError and ExternalAPIError
+    4. with JOBS_ENABLED or "Prefer: respond-async", a user not in the database is scraped by a job in the background:
+       the api returns 202 with the job (and its url in Location), GET /jobs/{id} tells when the projects are stored
+    5. with "Accept: application/x-ndjson", the projects are streamed as NDJSON while they are read from the database,
+       instead of being validated and serialized as one JSON array
+    6. with FAST_READS, the projects are read as plain rows and serialized without the response_model validation
+    7. with any of sort, limit, after or min_stars, a page of the projects is returned (sorted by stars and
+       PROJECTS_PAGE_SIZE long by default); the next page is in the Link header (rel="next"), absent on the last page
     """
+    queue = settings.JOBS_ENABLED or "respond-async" in (prefer or "")
+    if any(param is not None for param in (sort, limit, after, min_stars)):
+        result = await Service.get_user_projects_page_service(
+            username, sort or "stars", limit or settings.PROJECTS_PAGE_SIZE, after, min_stars, queue=queue
+        )
+        if isinstance(result, ScrapeJob):
+            return job_accepted(result)
+        projects, next_cursor = result
+        if next_cursor is not None:
+            response.headers["Link"] = f'<{request.url.include_query_params(after=next_cursor)}>; rel="next"'
+        return projects
+    if NDJSON in (accept or ""):
+        result = await Service.stream_user_projects_service(username, queue=queue)
+        if isinstance(result, ScrapeJob):
+            return job_accepted(result)
+
+        async def ndjson():
+            async for batch in result:
+                yield "".join(json.dumps(project) + "\n" for project in batch)
+
+        return StreamingResponse(ndjson(), media_type=NDJSON)
+    if queue:
+        result = await Service.get_user_projects_or_job(username)
+        if isinstance(result, ScrapeJob):
+            return job_accepted(result)
+        return result
+    if settings.FAST_READS:
+        return FastJSONResponse(await Service.get_user_projects_service(username, rows=True))
     projects = await Service.get_user_projects_service(username)
     # Do not raise NotFoundError for empty project lists!!!
     return projects
 
 
+@router.post("/users/batch")
+async def scrape_users_batch(batch: BatchScrapeRequest):
+    """
+    stores the projects of many users at once, streamed back as NDJSON (one JSON object per line) as each user is done.
+    1. users already in the database are not fetched again from the Github API
+    2. each line is {"username", "status", "projects"}: status is "stored", "scraped", "not_found" or "error" (with a "detail"),
+       a failed user does not fail the batch
+    3. lines come in completion order, not in the order of the usernames
+    """
+    async def ndjson():
+        async for result in Service.scrape_batch(batch.usernames):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(ndjson(), media_type=NDJSON)
+
+
+@router.get("/jobs/{job_id}", response_model=ScrapeJob)
+async def get_job(job_id: str = Path(..., max_length=32, description="Scrape job id")):
+    """
+    status of a scrape job queued by a cold miss
+    1. status is "queued", "running", then "done", "not_found" or "error" (with a detail)
+    2. if the job doesn't exist or was finished more than JOB_RETENTION_SECONDS ago, the service should raise a NotFoundError
+    """
+    job = await Service.get_job_service(job_id)
+    return job
+
+
 @router.get("/users/recent/{n}", response_model=List[User])
 async def get_most_recent_users(
     n: int = Path(..., gt=0, le=100, description="Number of recent users to retrieve")
@@ -37,7 +120,10 @@ async def get_most_recent_users(
     retrieve the n most recent users
     1. if there are no users in the database, the api should return an empty list
     2. Allow other errors to propagate from the service such as DatabaseError
+    3. with FAST_READS, the rows are serialized without the response_model validation
     """
+    if settings.FAST_READS:
+        return FastJSONResponse(await Service.get_most_recent_users_service(n, rows=True))
     users = await Service.get_most_recent_users_service(n)
     return users
 
@@ -50,7 +136,10 @@ async def get_most_starred_projects(
     retrieve the n most starred projects
     1. if there are no projects in the database, the api should return an empty list
     2. Allow other errors to propagate from the service such as DatabaseError
+    3. with FAST_READS, the rows are serialized without the response_model validation
     """
+    if settings.FAST_READS:
+        return FastJSONResponse(await Service.get_most_starred_projects_service(n, rows=True))
     projects = await Service.get_most_starred_projects_service(n)
     # Do not raise NotFoundError for empty project lists!!!
     return projects
@@ -0,0 +1,78 @@
+# app/core/circuit_breaker.py
+# Fail fast while an upstream service is down, instead of making every caller wait for a slow failure.
+# - closed: calls go through, failure_threshold consecutive failures open the circuit
+# - open: calls fail right away with CircuitOpenError, for reset_timeout seconds
+# - half-open: one call (the probe) goes through, the others keep failing fast; the probe closes the circuit
+#   if it succeeds and opens it again if it fails
+
+
+import logging
+import time
+from app.core.logging_config import *
+from app.core.exceptions import CircuitOpenError
+
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# what callers are told to wait while a probe is in flight
+PROBE_RETRY_AFTER = 1.0
+
+
+class CircuitBreaker:
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0 # consecutive
+        self._opened_at = 0.0
+        self._probing = False
+
+    def acquire(self) -> bool:
+        """
+        Ask to make a call. Raises CircuitOpenError if the call must not be made.
+        - returns True if the call is the half-open probe, it must end with success(), failure() or release()
+        """
+        if self.state == CLOSED:
+            return False
+        now = time.monotonic()
+        if self.state == OPEN:
+            retry_after = self._opened_at + self.reset_timeout - now
+            if retry_after > 0:
+                raise CircuitOpenError(f"{self.name} circuit is open.", OPEN, retry_after)
+            self.state = HALF_OPEN
+            logger.info(f"{self.name} circuit is half-open, probing.")
+        if self._probing:
+            raise CircuitOpenError(f"{self.name} circuit is half-open, a probe is in flight.", HALF_OPEN, PROBE_RETRY_AFTER)
+        self._probing = True
+        return True
+
+    def success(self):
+        if self.state != CLOSED:
+            logger.info(f"{self.name} circuit is closed again.")
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.error(f"{self.name} circuit is open after {self.failures} failures, failing fast for {self.reset_timeout} seconds.")
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self):
+        """
+        The probe ended without telling whether the upstream is back (eg. it was cancelled), let the next call probe.
+        """
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {"name": self.name, "state": self.state, "failures": self.failures}
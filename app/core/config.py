@@ -4,10 +4,103 @@
 
 from pydantic_settings import BaseSettings
 from pydantic import ConfigDict
+from typing import Optional
 
 class Settings(BaseSettings):
     # An async SQLite driver is needed
     DATABASE_URL: str = "sqlite+aiosqlite:///./test.db"
+    DATABASE_PROFILE: str = "dev" # engine options (see app/data_access/database.py): "dev", "prod" or "bench"
+    DATABASE_ECHO: Optional[bool] = None # log the SQL statements (see app/core/logging_config.py), only with the dev profile if None
+    DATABASE_POOL_SIZE: Optional[int] = None # connections kept open, set by the profile if None
+    DATABASE_MAX_OVERFLOW: Optional[int] = None # connections opened on top of the pool under load, set by the profile if None
+    DATABASE_REPLICA_URL: str = "" # a read replica of DATABASE_URL, the reads go to the primary if empty
+    DATABASE_REPLICA_LAG_SECONDS: float = 5.0 # how long the reads of a user just written go to the primary
+
+    # GitHub API client
+    GITHUB_API_BASE_URL: str = "https://api.github.com"
+    GITHUB_PER_PAGE: int = 100 # maximum allowed by GitHub
+    GITHUB_PAGE_FANOUT: int = 4 # pages of one user fetched concurrently
+    GITHUB_FETCHER: str = "rest" # "rest", or "graphql" to fetch many users per request (needs GITHUB_API_TOKENS)
+    GITHUB_GRAPHQL_USERS_PER_QUERY: int = 25 # pages (of any users) sent in one GraphQL query
+    GITHUB_GRAPHQL_BATCH_WINDOW: float = 0.01 # seconds the page requests are collected before a query is sent
+
+    # Rate limits (see app/external_services/token_pool.py)
+    GITHUB_API_TOKENS: str = "" # comma separated personal access tokens, unauthenticated requests if empty
+    GITHUB_RATE_LIMIT_RESERVE: float = 0.05 # share of every token's hourly limit left unused
+    GITHUB_RATE_LIMIT_MAX_WAIT: float = 10.0 # seconds a request may wait for quota before failing
+
+    # Retries of failed GitHub requests (timeouts, connection errors, 5xx) and the circuit breaker
+    GITHUB_RETRY_ATTEMPTS: int = 3 # attempts per request, 1 disables retries
+    GITHUB_RETRY_BASE_DELAY: float = 0.1 # seconds, decorrelated jitter between base and 3x the previous delay
+    GITHUB_RETRY_MAX_DELAY: float = 2.0
+    GITHUB_BREAKER_FAILURE_THRESHOLD: int = 5 # consecutive failed requests that open the circuit
+    GITHUB_BREAKER_RESET_TIMEOUT: float = 30.0 # seconds the circuit stays open before a probe request
+
+    # Connection pool of the shared httpx client (one per app, reused across requests)
+    GITHUB_HTTP_MAX_CONNECTIONS: int = 100
+    GITHUB_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    GITHUB_HTTP_KEEPALIVE_EXPIRY: float = 30.0 # seconds an idle connection is kept open
+    GITHUB_HTTP2: bool = True # needs the 'h2' package, falls back to HTTP/1.1 without it
+
+    # Timeouts (seconds) for GitHub requests
+    GITHUB_HTTP_CONNECT_TIMEOUT: float = 5.0
+    GITHUB_HTTP_READ_TIMEOUT: float = 10.0
+    GITHUB_HTTP_WRITE_TIMEOUT: float = 10.0
+    GITHUB_HTTP_POOL_TIMEOUT: float = 5.0 # waiting for a free connection in the pool
+
+    # POST /users/batch
+    BATCH_MAX_USERNAMES: int = 5000 # per request, the CLI splits longer lists
+    BATCH_CONCURRENCY: int = 8 # users looked up / scraped at a time per batch
+
+    # Fast read path: the list endpoints serialize plain rows (with orjson if installed) instead of validated models
+    FAST_READS: bool = False
+
+    # Pages of /users/{username}/projects (?sort=&limit=&after=&min_stars=)
+    PROJECTS_PAGE_SIZE: int = 30 # when only sort, after or min_stars is given
+
+    # Streamed responses (Accept: application/x-ndjson)
+    STREAM_BATCH_SIZE: int = 500 # rows fetched from the database cursor and written to the response at a time
+
+    # Scrape jobs: cold misses answered with 202 and a job to poll (see app/services/job_queue.py)
+    JOBS_ENABLED: bool = False # for every cold miss, otherwise only for requests sent with "Prefer: respond-async"
+    JOB_BACKEND: str = "memory" # "memory" (per worker) or "database" (the scrape_job table, shared by all workers)
+    JOB_WORKERS: int = 4 # scrapes run at a time per app
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0 # how often idle workers poll the jobs (a query each with "database"), from the first job without JOBS_ENABLED
+    JOB_RUNNING_TIMEOUT_SECONDS: float = 600.0 # "database" backend: a job still running after this is run again
+    JOB_RETENTION_SECONDS: float = 3600.0 # finished jobs can be polled for this long
+
+    # Cache of repository reads (TTLs in seconds, 0 disables caching of that query)
+    CACHE_ENABLED: bool = True
+    CACHE_BACKEND: str = "memory" # "memory" (per worker) or "redis" (shared by all workers)
+    CACHE_MAX_ENTRIES: int = 10000 # memory backend only
+    REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_KEY_PREFIX: str = "ghscraper"
+    CACHE_TTL_USER_PROJECTS: float = 300.0 # /users/{username}/projects
+    CACHE_TTL_RECENT_USERS: float = 5.0 # /users/recent/{n}
+    CACHE_TTL_MOST_STARRED: float = 30.0 # /projects/most-starred/{n}
+
+    # Materialized most starred leaderboard
+    LEADERBOARD_SIZE: int = 100 # the largest n served by /projects/most-starred/{n}
+    LEADERBOARD_RELOAD_SECONDS: float = 5.0 # how long a worker may miss the writes of the other workers
+
+    # Background refresh of stored users (see app/services/refresh_scheduler.py)
+    REFRESH_ENABLED: bool = True
+    REFRESH_STALE_AFTER_SECONDS: float = 3600.0 # a user's projects are refreshed once they are older than this
+    REFRESH_INTERVAL_SECONDS: float = 30.0 # how often the scheduler looks for stale users
+    REFRESH_REQUESTS_PER_HOUR: float = 30.0 # GitHub requests the refreshes of all the app workers may spend, the rest is left to cold misses
+    WEB_CONCURRENCY: int = 1 # app worker processes (the uvicorn --workers default), each one spends its share of the refresh budget
+    REFRESH_BATCH_SIZE: int = 20 # stale users considered per run
+
+    # Logging (see app/core/logging_config.py)
+    LOG_LEVEL: str = "INFO"
+    LOG_QUEUE: bool = True # records written by a background thread, False writes them on the logging thread
+    LOG_QUEUE_SIZE: int = 10000 # records waiting to be written, the records logged while it is full are dropped
+    LOG_DIR: str = "logs" # one app_YYYY-MM-DD.log per day
+    LOG_BACKUP_DAYS: int = 0 # days of log files kept, 0 keeps them all
+    LOG_SAMPLE_RATES: str = "sqlalchemy.engine=0.1" # comma separated logger=share of INFO records kept, warnings are all kept
+
+    # Metrics (see app/core/metrics.py)
+    METRICS_ENABLED: bool = True # collect the metrics served by GET /metrics
 
     # Use ConfigDict to load environment variables from the .env file
     model_config = ConfigDict(env_file=".env")
@@ -13,3 +13,22 @@ class ExternalAPIError(Exception):
     """Raised when there is an issue with external API"""
     pass
 
+
+class NotModifiedError(Exception):
+    """Raised when a conditional request to an external API finds nothing changed since the last fetch"""
+    pass
+
+class RateLimitError(ExternalAPIError):
+    """Raised when every GitHub token is out of quota for longer than a request may wait"""
+    pass
+
+class CircuitOpenError(ExternalAPIError):
+    """Raised without calling the external API while its circuit breaker is open (or half-open and probing)"""
+    def __init__(self, message: str, state: str, retry_after: float):
+        super().__init__(message)
+        self.state = state
+        self.retry_after = retry_after
+
+class InvalidCursorError(Exception):
+    """Raised when a pagination cursor can't be decoded or was made for another sort order"""
+    pass
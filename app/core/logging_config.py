@@ -1,13 +1,192 @@
+# app/core/logging_config.py
+# Logging of the app, configured once when the first module imports it (with `from app.core.logging_config import *`).
+# - LOG_QUEUE: the records are put on a bounded queue and written to the console and the log file by a
+#   background thread (QueueListener), so that logging never waits for the disk on the event loop;
+#   a record that finds the queue full is dropped (and counted) instead of blocking the request
+# - the log file is logs/app_YYYY-MM-DD.log of the day the record was logged, a new file is started at midnight
+#   and the files older than LOG_BACKUP_DAYS are deleted
+# - the SQL statements are logged (INFO records of sqlalchemy.engine) with DATABASE_ECHO, by default with the dev
+#   DATABASE_PROFILE
+# - LOG_SAMPLE_RATES keeps only a share of the INFO and DEBUG records of high volume loggers (eg. the SQL
+#   statements of sqlalchemy.engine), their warnings and errors are always kept
+
+
+import atexit
+import itertools
 import logging
-from datetime import datetime
+import logging.handlers
+import os
+import queue
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from app.core.config import settings
+
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+
+class DailyFileHandler(logging.FileHandler):
+    """
+    Writes to <directory>/<prefix>_YYYY-MM-DD.log, the day the record was created.
+    - rolls to the next file with the first record logged after midnight
+    - backup_days: the files of the days before that are deleted when rolling, 0 keeps them all
+    """
+
+    def __init__(self, directory: str, prefix: str = "app", backup_days: int = 0, encoding: Optional[str] = "utf-8"):
+        self.directory = directory
+        self.prefix = prefix
+        self.backup_days = backup_days
+        self.day = datetime.now().date()
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(self.filename(self.day), encoding=encoding, delay=True)
+
+    def filename(self, day) -> str:
+        return os.path.join(self.directory, f"{self.prefix}_{day.strftime('%Y-%m-%d')}.log")
+
+    def emit(self, record: logging.LogRecord):
+        day = datetime.fromtimestamp(record.created).date()
+        # a record queued just before midnight doesn't reopen the file of the day before
+        if day > self.day:
+            self.roll(day)
+        super().emit(record)
+
+    def roll(self, day):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        self.day = day
+        self.baseFilename = os.path.abspath(self.filename(day))
+        if self.backup_days > 0:
+            self.delete_old_files()
+
+    def delete_old_files(self):
+        oldest = (self.day - timedelta(days=self.backup_days)).strftime('%Y-%m-%d')
+        for name in os.listdir(self.directory):
+            if not (name.startswith(f"{self.prefix}_") and name.endswith(".log")):
+                continue
+            # the dates sort like their names
+            if name[len(self.prefix) + 1:-len(".log")] < oldest:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one INFO / DEBUG record in 1 / rate of the sampled loggers (and their children), every WARNING and above.
+    - rates: logger name -> share of the records kept (0 drops them all), the longest matching name applies
+    - deterministic (every n-th record), so a burst of statements is thinned evenly
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.every: Dict[str, int] = {}
+        for name, rate in rates.items():
+            self.every[name] = 0 if rate <= 0 else max(1, round(1 / rate))
+        self._names = sorted(self.every, key=len, reverse=True)
+        self._counters = {name: itertools.count() for name in self.every}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for name in self._names:
+            if record.name == name or record.name.startswith(f"{name}."):
+                every = self.every[name]
+                # next() on itertools.count is atomic, records of several threads are counted once
+                return every > 0 and next(self._counters[name]) % every == 0
+        return True
+
 
-log_filename = f"logs/app_{datetime.now().strftime('%Y-%m-%d')}.log"
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """
+    "sqlalchemy.engine=0.1, httpx=0.5" -> {"sqlalchemy.engine": 0.1, "httpx": 0.5}
+    """
+    rates = {}
+    for entry in value.split(","):
+        if entry.strip():
+            name, rate = entry.split("=")
+            rates[name.strip()] = float(rate)
+    return rates
 
-logging.basicConfig(
-    level=logging.INFO,  
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[
-        logging.StreamHandler(), 
-        logging.FileHandler(log_filename)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts the records on a bounded queue without ever waiting, the records that find it full are dropped.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    """
+    Waits for room on a full queue to stop, the records queued before stop() are all written.
+    """
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+# the handlers of the root logger, and the listener writing the queued records (None without LOG_QUEUE)
+_handlers: List[logging.Handler] = []
+_listener: Optional[DrainingQueueListener] = None
+
+
+def configure_sql_logging():
+    """
+    Turn the SQL statements logger on with DATABASE_ECHO (None: with the dev DATABASE_PROFILE), for every engine of
+    the process; the engines are created without echo, so they never change the logging configuration themselves.
+    """
+    echo = settings.DATABASE_ECHO
+    if echo is None:
+        echo = settings.DATABASE_PROFILE == "dev"
+    if echo:
+        logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+
+def configure_logging():
+    """
+    Attach the console and daily file handlers to the root logger, behind a queue with settings.LOG_QUEUE.
+    Runs once, the next calls do nothing.
+    """
+    global _listener
+    if _handlers:
+        return
+    sampling = SamplingFilter(parse_sample_rates(settings.LOG_SAMPLE_RATES))
+    formatter = logging.Formatter(LOG_FORMAT)
+    outputs = [
+        logging.StreamHandler(),
+        DailyFileHandler(settings.LOG_DIR, backup_days=settings.LOG_BACKUP_DAYS),
     ]
-)
\ No newline at end of file
+    for output in outputs:
+        output.setFormatter(formatter)
+
+    if settings.LOG_QUEUE:
+        queue_handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+        # sampled before the record is formatted and queued, the dropped records cost almost nothing
+        queue_handler.addFilter(sampling)
+        _handlers.append(queue_handler)
+        _listener = DrainingQueueListener(queue_handler.queue, *outputs, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+    else:
+        for output in outputs:
+            output.addFilter(sampling)
+            _handlers.append(output)
+
+    root = logging.getLogger()
+    root.setLevel(settings.LOG_LEVEL)
+    for handler in _handlers:
+        root.addHandler(handler)
+    configure_sql_logging()
+
+
+configure_logging()
@@ -0,0 +1,330 @@
+# app/core/metrics.py
+# Counters, gauges and histograms of the app, served by GET /metrics in the Prometheus text format.
+# - kept in memory per app worker (Prometheus scrapes every worker, or sums them), no dependency
+# - the layers are timed by instrumented() on their classes (Service, the repositories), the requests by
+#   MetricsMiddleware (app/api/middleware.py), the GitHub calls by GitHubAPIClient._send
+# - the SQL statements are counted by the engine hooks of count_statements(), per repository method
+# - the GitHub rate limits and circuit breaker are read from the objects tracked by the app lifespan when rendered
+# - METRICS_ENABLED=false stops the collection
+
+
+import bisect
+import inspect
+import time
+from contextlib import asynccontextmanager, aclosing, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+from sqlalchemy import event
+from app.core.config import settings
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# the default buckets of the Prometheus clients, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        super().__init__(name, description, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{format_labels(self.labels, key)} {value}" for key, value in self.values.items()]
+
+    def reset(self):
+        self.values.clear()
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    @contextmanager
+    def track(self, *labels: str) -> Iterator[None]:
+        """
+        Count the block as in progress while it runs.
+        """
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [count per bucket (not cumulative, the last one is +Inf), sum]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self.values.get(labels)
+        return sum(series[0]) if series is not None else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+    def reset(self):
+        self.values.clear()
+
+
+class LiveGauge(Metric):
+    """
+    A gauge read from the objects it tracks when the metrics are rendered, nothing is collected in between.
+    - read(source) yields (label values, value) for a tracked source
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str], read: Callable[[Any], Iterable[Tuple[Tuple[str, ...], float]]]):
+        super().__init__(name, description, labels)
+        self.read = read
+        self.sources: List[Any] = []
+
+    def track(self, source):
+        self.sources.append(source)
+
+    def untrack(self, source):
+        if source in self.sources:
+            self.sources.remove(source)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labels, key)} {value}"
+            for source in self.sources for key, value in self.read(source)
+        ]
+
+    def reset(self):
+        pass
+
+
+REGISTRY: List[Metric] = []
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def reset():
+    for metric in REGISTRY:
+        metric.reset()
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Latency of the HTTP requests, by route template.", ("method", "route", "status")
+)
+SERVICE_CALL_DURATION = Histogram(
+    "service_call_duration_seconds", "Latency of the Service methods.", ("method", "outcome")
+)
+REPOSITORY_CALL_DURATION = Histogram(
+    "repository_call_duration_seconds", "Latency of the repository methods, cache hits included.", ("method", "outcome")
+)
+DB_STATEMENTS = Counter(
+    "db_statements_total", "SQL statements sent to the database, by the repository method sending them.", ("method",)
+)
+GITHUB_REQUEST_DURATION = Histogram(
+    "github_request_duration_seconds", "Latency of the HTTP requests to GitHub, by status code.", ("method", "status")
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Repository cache lookups, by namespace and result (hit or miss).", ("namespace", "result")
+)
+SCRAPES_IN_FLIGHT = Gauge(
+    "scrapes_in_flight", "GitHub scrapes running (scrape: users not stored yet, refresh: stored users).", ("kind",)
+)
+
+
+def token_remaining(tokens):
+    # what the last response told, the whole limit again once its reset has passed (see TokenBudget.headroom)
+    now = time.time()
+    return [
+        ((stats["token"],), stats["limit"] if stats["reset_at"] and now >= stats["reset_at"] else stats["remaining"])
+        for stats in tokens.stats()
+    ]
+
+
+# the rate limit of every token of a TokenPool, see TokenPool.stats()
+GITHUB_RATE_LIMIT_REMAINING = LiveGauge(
+    "github_rate_limit_remaining", "Requests left to every GitHub token until its reset.", ("token",), token_remaining
+)
+GITHUB_RATE_LIMIT = LiveGauge(
+    "github_rate_limit", "Requests allowed per rate limit window of every GitHub token.", ("token",),
+    lambda tokens: [((stats["token"],), stats["limit"]) for stats in tokens.stats()]
+)
+GITHUB_RATE_LIMIT_RESET = LiveGauge(
+    "github_rate_limit_reset_timestamp_seconds", "When the rate limit of every GitHub token resets (epoch, 0 unknown).",
+    ("token",), lambda tokens: [((stats["token"],), stats["reset_at"]) for stats in tokens.stats()]
+)
+
+# see CircuitBreaker.stats()
+CIRCUIT_STATES = {"closed": 0, "half-open": 1, "open": 2}
+CIRCUIT_BREAKER_STATE = LiveGauge(
+    "circuit_breaker_state", "State of the circuit breakers: 0 closed, 1 half-open, 2 open.", ("name",),
+    lambda breaker: [((breaker.name,), CIRCUIT_STATES[breaker.stats()["state"]])]
+)
+CIRCUIT_BREAKER_FAILURES = LiveGauge(
+    "circuit_breaker_failures", "Consecutive failures counted by the circuit breakers.", ("name",),
+    lambda breaker: [((breaker.name,), breaker.stats()["failures"])]
+)
+
+def track_github_client(github_client, tracked: bool = True):
+    """
+    Export the rate limits of the tokens and the circuit breaker state of the (shared) GitHub client, or stop.
+    """
+    for gauge in (GITHUB_RATE_LIMIT_REMAINING, GITHUB_RATE_LIMIT, GITHUB_RATE_LIMIT_RESET):
+        gauge.track(github_client.tokens) if tracked else gauge.untrack(github_client.tokens)
+    for gauge in (CIRCUIT_BREAKER_STATE, CIRCUIT_BREAKER_FAILURES):
+        gauge.track(github_client.breaker) if tracked else gauge.untrack(github_client.breaker)
+
+# the repository method running in this context, the label of the statements it sends
+current_method: ContextVar[str] = ContextVar("current_method", default="other")
+
+
+def count_statements(engine):
+    """
+    Count the statements sent through the (async) engine in DB_STATEMENTS.
+    """
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if settings.METRICS_ENABLED:
+            DB_STATEMENTS.inc(current_method.get())
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def instrumented(histogram: Histogram, statements: bool = False):
+    """
+    Class decorator: the async static methods of the class are timed in the histogram, labeled
+    "<Class>.<method>" and "ok" / "error".
+    - coroutines, async generators (from the first item to the last) and async context managers (the block included)
+    - statements: label the SQL statements sent by the coroutines with their method (see count_statements)
+    """
+    def decorate(cls):
+        for name, attribute in list(vars(cls).items()):
+            if isinstance(attribute, staticmethod) and not name.startswith("__"):
+                wrapped = timed(attribute.__func__, histogram, f"{cls.__name__}.{name}", statements)
+                if wrapped is not None:
+                    setattr(cls, name, staticmethod(wrapped))
+        return cls
+    return decorate
+
+
+def timed(func, histogram: Histogram, method: str, statements: bool = False):
+    """
+    The function timed in the histogram, None if it is not async.
+    """
+    if inspect.iscoroutinefunction(func):
+        @wraps(func)
+        async def coroutine(*args, **kwargs):
+            if not settings.METRICS_ENABLED:
+                return await func(*args, **kwargs)
+            token = current_method.set(method) if statements else None
+            start, outcome = time.perf_counter(), "error"
+            try:
+                result = await func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                histogram.observe(time.perf_counter() - start, method, outcome)
+                if token is not None:
+                    current_method.reset(token)
+        return coroutine
+
+    if inspect.isasyncgenfunction(getattr(func, "__wrapped__", None)):
+        # an @asynccontextmanager: the exceptions of the block must reach the original context manager
+        @asynccontextmanager
+        async def context(*args, **kwargs):
+            start, outcome = time.perf_counter(), "error"
+            try:
+                async with func(*args, **kwargs) as value:
+                    yield value
+                outcome = "ok"
+            finally:
+                if settings.METRICS_ENABLED:
+                    histogram.observe(time.perf_counter() - start, method, outcome)
+        return wraps(func)(context)
+
+    if inspect.isasyncgenfunction(func):
+        @wraps(func)
+        async def generator(*args, **kwargs):
+            start, outcome = time.perf_counter(), "error"
+            try:
+                # closed with the wrapper when the consumer stops early
+                async with aclosing(func(*args, **kwargs)) as items:
+                    async for item in items:
+                        yield item
+                outcome = "ok"
+            except GeneratorExit:
+                outcome = "ok"
+                raise
+            finally:
+                if settings.METRICS_ENABLED:
+                    histogram.observe(time.perf_counter() - start, method, outcome)
+        return generator
+
+    return None
+
+
+def observe_since(histogram: Histogram, start: float, *labels: str):
+    if settings.METRICS_ENABLED:
+        histogram.observe(time.perf_counter() - start, *labels)
+
+
+def record_cache_lookup(namespace: str, hit: bool):
+    if settings.METRICS_ENABLED:
+        CACHE_REQUESTS.inc(namespace, "hit" if hit else "miss")
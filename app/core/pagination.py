@@ -0,0 +1,44 @@
+# app/core/pagination.py
+# Opaque cursors of the keyset pagination of /users/{username}/projects.
+# A cursor holds the sort of the page and the (sort value, id) of its last project, the next page starts after it:
+#   WHERE (stars, id) < (:stars, :id) ORDER BY stars DESC, id DESC LIMIT :limit
+
+
+import base64
+import json
+from typing import Any, Optional, Tuple
+from app.core.exceptions import InvalidCursorError
+
+
+# sort -> (Project field, descending)
+PROJECT_SORTS = {
+    "stars": ("stars", True),
+    "forks": ("forks", True),
+    "name": ("name", False),
+}
+
+
+def encode_cursor(sort: str, value: Any, id: int) -> str:
+    payload = json.dumps([sort, value, id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], sort: str) -> Optional[Tuple[Any, int]]:
+    """
+    The (sort value, id) after which the page starts, None for the first page.
+    Raises InvalidCursorError for a malformed cursor, or a cursor of another sort.
+    """
+    if cursor is None:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, id = json.loads(payload)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"Malformed cursor: {e}")
+    if cursor_sort != sort:
+        raise InvalidCursorError(f"Cursor of sort '{cursor_sort}' used with sort '{sort}'.")
+    field, _ = PROJECT_SORTS[sort]
+    expected = str if field == "name" else int
+    if not isinstance(value, expected) or isinstance(value, bool) or not isinstance(id, int) or isinstance(id, bool):
+        raise InvalidCursorError("Cursor values of the wrong type.")
+    return value, id
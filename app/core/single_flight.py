@@ -0,0 +1,59 @@
+# app/core/single_flight.py
+# Coalesce concurrent calls for the same key into one execution (a.k.a. "single-flight").
+
+
+import asyncio
+import logging
+from app.core.logging_config import *
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    The first caller for a key starts the call, callers arriving while it is running
+    await the same call and get its result or its exception.
+    Once the call finishes, the next caller for the key starts a new one (nothing is cached).
+    - a cancelled caller (eg. the client disconnected) leaves the call running for the others, the call is
+      cancelled with its last caller: nobody is left to get its result
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {} # callers awaiting every running call
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            logger.info(f"Joining in-flight call for '{key}'.")
+        self._waiters[call] = self._waiters.get(call, 0) + 1
+        try:
+            # a caller that gets cancelled must not cancel the call the others are waiting on
+            return await asyncio.shield(call)
+        except asyncio.CancelledError:
+            if self._waiters[call] == 1 and not call.done():
+                logger.info(f"Cancelling the call for '{key}', its last caller was cancelled.")
+                call.cancel()
+            raise
+        finally:
+            self._waiters[call] -= 1
+            if not self._waiters[call]:
+                del self._waiters[call]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, done: asyncio.Future):
+        if self._calls.get(key) is done:
+            del self._calls[key]
+        # mark the exception as retrieved, even if every waiter was cancelled
+        if not done.cancelled():
+            done.exception()
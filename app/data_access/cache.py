@@ -0,0 +1,323 @@
+# app/data_access/cache.py
+# Cache for the results of the hot repository reads.
+# - MemoryCacheBackend: in-process TTL + LRU cache, one per worker
+# - RedisCacheBackend: shared by every worker through a Redis-protocol server (needs the optional 'redis' package)
+
+
+import json
+import logging
+import time
+from app.core.logging_config import *
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple, Union
+from sqlmodel import SQLModel
+from app.core.config import settings
+from app.core.metrics import record_cache_lookup
+from app.models import Project, User
+
+
+logger = logging.getLogger(__name__)
+
+
+# namespaces of the cached repository reads
+USER_BY_USERNAME = "user_by_username"   # UserRepository.get_by_username, keyed by username
+PROJECTS_BY_USER = "projects_by_user"   # ProjectRepository.get_by_user_id, keyed by user id
+RECENT_USERS = "recent_users"           # UserRepository.get_most_recent, keyed by n
+MOST_STARRED = "most_starred"           # ProjectRepository.get_most_starred, keyed by n
+
+# plain rows of the fast read path (settings.FAST_READS), dropped together with the namespace of the same query
+USER_ID_BY_USERNAME = "user_id_by_username"     # UserRepository.get_id_by_username, never invalidated (ids don't change)
+PROJECT_ROWS_BY_USER = "project_rows_by_user"   # ProjectRepository.get_rows_by_username, keyed by user id
+RECENT_USER_ROWS = "recent_user_rows"           # UserRepository.get_most_recent_rows, keyed by n
+MOST_STARRED_ROWS = "most_starred_rows"         # ProjectRepository.get_most_starred_rows, keyed by n
+ROWS_NAMESPACES = {
+    PROJECTS_BY_USER: PROJECT_ROWS_BY_USER,
+    RECENT_USERS: RECENT_USER_ROWS,
+    MOST_STARRED: MOST_STARRED_ROWS,
+}
+
+
+class TTLCache:
+    """
+    A bounded cache where every entry expires after its own TTL, and the least recently used
+    entry is evicted once maxsize entries are stored.
+    - entries are grouped by namespace so that a write can drop every cached result of a query at once
+    - None is never stored, get() returns None on a miss
+    - not thread-safe, it is only used from the event loop
+    """
+
+    def __init__(self, maxsize: int, enabled: bool = True):
+        self.maxsize = maxsize
+        self.enabled = enabled and maxsize > 0
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, Any]]" = OrderedDict()
+        self._keys_by_namespace: Dict[str, Set[Hashable]] = defaultdict(set)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0 # LRU evictions because the cache was full
+        self.expirations = 0
+
+    def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        entry = self._entries.get((namespace, key))
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(namespace, key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end((namespace, key))
+        self.hits += 1
+        return value
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float):
+        if not self.enabled or value is None or ttl <= 0:
+            return
+        self._entries[(namespace, key)] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end((namespace, key))
+        self._keys_by_namespace[namespace].add(key)
+        while len(self._entries) > self.maxsize:
+            (old_namespace, old_key), _ = self._entries.popitem(last=False)
+            self._keys_by_namespace[old_namespace].discard(old_key)
+            self.evictions += 1
+
+    def delete(self, namespace: str, key: Hashable):
+        self._remove(namespace, key)
+
+    def invalidate(self, namespace: str):
+        """
+        Drop every entry of a namespace.
+        """
+        for key in self._keys_by_namespace.pop(namespace, set()):
+            self._entries.pop((namespace, key), None)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_namespace.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+    def _remove(self, namespace: str, key: Hashable):
+        if self._entries.pop((namespace, key), None) is not None:
+            self._keys_by_namespace[namespace].discard(key)
+
+
+class CacheBackend:
+    """
+    Interface of the cache backends used by QueryCache.
+    - values are a model (User, Project) or a list of models, None is never stored
+    """
+
+    async def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, namespace: str, key: Hashable, value: Any, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, namespace: str, key: Hashable):
+        raise NotImplementedError
+
+    async def invalidate(self, namespace: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Keeps the model instances themselves in a TTLCache of this process.
+    """
+
+    def __init__(self, cache: Optional[TTLCache] = None):
+        self.cache = cache if cache is not None else TTLCache(maxsize=settings.CACHE_MAX_ENTRIES, enabled=settings.CACHE_ENABLED)
+
+    async def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        value = self.cache.get(namespace, key)
+        # a copy, so that callers can't change the cached list
+        return list(value) if isinstance(value, list) else value
+
+    async def set(self, namespace: str, key: Hashable, value: Any, ttl: float):
+        self.cache.set(namespace, key, list(value) if isinstance(value, list) else value, ttl)
+
+    async def delete(self, namespace: str, key: Hashable):
+        self.cache.delete(namespace, key)
+
+    async def invalidate(self, namespace: str):
+        self.cache.invalidate(namespace)
+
+    def stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+
+# models that can be stored in a shared cache, by name
+CACHEABLE_MODELS = {"User": User, "Project": Project}
+
+
+def serialize(value: Union[SQLModel, List[SQLModel], Any]) -> str:
+    many = isinstance(value, list)
+    items = value if many else [value]
+    if not all(isinstance(item, SQLModel) for item in items):
+        # plain rows and ids, datetimes are stored as the ISO strings the API responds with
+        return json.dumps({"value": value}, default=lambda v: v.isoformat())
+    model = type(items[0]).__name__ if items else None
+    return json.dumps({"model": model, "many": many, "items": [item.model_dump(mode="json") for item in items]})
+
+
+def deserialize(payload: Union[str, bytes]) -> Union[SQLModel, List[SQLModel]]:
+    data = json.loads(payload)
+    if "value" in data:
+        return data["value"]
+    items = []
+    if data["items"]:
+        model = CACHEABLE_MODELS[data["model"]]
+        items = [model.model_validate(item) for item in data["items"]]
+    return items if data["many"] else items[0]
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Stores serialized models in a Redis-protocol server, so that every worker shares one cache.
+    - keys are versioned per namespace: <prefix>:<namespace>:v<version>:<key>
+    - invalidate() increments the namespace version (INCR is atomic across workers), the old keys are
+      never read again and expire with their TTL
+    - hit/miss counters are per worker
+    """
+
+    def __init__(self, url: str = None, prefix: str = None, client=None):
+        if client is None:
+            try:
+                import redis.asyncio as redis
+            except ImportError as e:
+                raise RuntimeError("CACHE_BACKEND=redis needs the 'redis' package (poetry install -E redis).") from e
+            client = redis.Redis.from_url(url or settings.REDIS_URL)
+        self.client = client
+        self.prefix = prefix or settings.CACHE_KEY_PREFIX
+        self.hits = 0
+        self.misses = 0
+
+    def _version_key(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}:version"
+
+    async def _key(self, namespace: str, key: Hashable) -> str:
+        version = await self.client.get(self._version_key(namespace))
+        return f"{self.prefix}:{namespace}:v{int(version or 0)}:{key}"
+
+    async def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        payload = await self.client.get(await self._key(namespace, key))
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return deserialize(payload)
+
+    async def set(self, namespace: str, key: Hashable, value: Any, ttl: float):
+        if value is None or ttl <= 0:
+            return
+        await self.client.set(await self._key(namespace, key), serialize(value), px=int(ttl * 1000))
+
+    async def delete(self, namespace: str, key: Hashable):
+        await self.client.delete(await self._key(namespace, key))
+
+    async def invalidate(self, namespace: str):
+        await self.client.incr(self._version_key(namespace))
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_cache_backend() -> CacheBackend:
+    """
+    Build the backend selected by settings.CACHE_BACKEND ("memory" or "redis").
+    """
+    if settings.CACHE_BACKEND == "redis":
+        return RedisCacheBackend()
+    if settings.CACHE_BACKEND != "memory":
+        logger.warning(f"Unknown CACHE_BACKEND '{settings.CACHE_BACKEND}'. Using the in-memory cache.")
+    return MemoryCacheBackend()
+
+
+class QueryCache:
+    """
+    The cache used by the repositories, in front of a swappable backend.
+    - a failing backend (eg. the Redis server is down) never fails a request: reads become misses,
+      writes and invalidations are skipped and the error is logged
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.errors = 0
+
+    def use(self, backend: CacheBackend):
+        self.backend = backend
+
+    async def get(self, namespace: str, key: Hashable) -> Optional[Any]:
+        if not settings.CACHE_ENABLED:
+            return None
+        try:
+            value = await self.backend.get(namespace, key)
+        except Exception as e:
+            self._failed("get", e)
+            return None
+        record_cache_lookup(namespace, value is not None)
+        return value
+
+    async def set(self, namespace: str, key: Hashable, value: Any, ttl: float):
+        if not settings.CACHE_ENABLED:
+            return
+        try:
+            await self.backend.set(namespace, key, value, ttl)
+        except Exception as e:
+            self._failed("set", e)
+
+    async def delete(self, namespace: str, key: Hashable):
+        """
+        Drop a cached result, and the rows of the same query (see ROWS_NAMESPACES).
+        """
+        for name in (namespace, ROWS_NAMESPACES.get(namespace)):
+            if name is None:
+                continue
+            try:
+                await self.backend.delete(name, key)
+            except Exception as e:
+                self._failed("delete", e)
+
+    async def invalidate(self, namespace: str):
+        """
+        Drop every cached result of a namespace, and the rows of the same query (see ROWS_NAMESPACES).
+        """
+        for name in (namespace, ROWS_NAMESPACES.get(namespace)):
+            if name is None:
+                continue
+            try:
+                await self.backend.invalidate(name)
+            except Exception as e:
+                self._failed("invalidate", e)
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.backend.stats(), "errors": self.errors}
+
+    def _failed(self, operation: str, e: Exception):
+        self.errors += 1
+        logger.warning(f"Cache {operation} failed, continuing without the cache: {e}")
+
+
+# shared by the repositories, the app lifespan installs the configured backend
+query_cache = QueryCache(MemoryCacheBackend())
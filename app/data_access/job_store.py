@@ -0,0 +1,202 @@
+# app/data_access/job_store.py
+# Where the scrape jobs wait for the job workers (see app/services/job_queue.py).
+# - MemoryJobStore: in this process, a job can only be polled on the app worker that queued it
+# - DatabaseJobStore: the scrape_job table, shared by every app worker; a job whose worker died is run again
+
+
+import logging
+from app.core.logging_config import *
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import select
+from app.core.config import settings
+from app.core.exceptions import DatabaseError
+from app.data_access.database import async_session
+from app.models import ScrapeJob
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+UNFINISHED = (QUEUED, RUNNING)
+
+
+class JobStore:
+    """
+    Interface of the job stores used by JobQueue.
+    """
+
+    async def submit(self, username: str) -> ScrapeJob:
+        """
+        Queue a scrape of the user, or return its job if one is already queued or running.
+        """
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[ScrapeJob]:
+        raise NotImplementedError
+
+    async def claim(self) -> Optional[ScrapeJob]:
+        """
+        Take the oldest queued job and mark it running, None if there is nothing to run.
+        """
+        raise NotImplementedError
+
+    async def finish(self, job: ScrapeJob, status: str, projects: Optional[int] = None, detail: Optional[str] = None):
+        raise NotImplementedError
+
+    async def prune(self, before: datetime) -> int:
+        """
+        Drop the jobs finished before the given time, returns how many.
+        """
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+
+    def __init__(self):
+        self.jobs: Dict[str, ScrapeJob] = {}
+        self._queued: "OrderedDict[str, ScrapeJob]" = OrderedDict() # by job id, oldest first
+        self._unfinished: Dict[str, ScrapeJob] = {} # by username
+
+    async def submit(self, username: str) -> ScrapeJob:
+        job = self._unfinished.get(username)
+        if job is None:
+            job = ScrapeJob(username=username)
+            self.jobs[job.id] = job
+            self._queued[job.id] = job
+            self._unfinished[username] = job
+        return job
+
+    async def get(self, job_id: str) -> Optional[ScrapeJob]:
+        return self.jobs.get(job_id)
+
+    async def claim(self) -> Optional[ScrapeJob]:
+        if not self._queued:
+            return None
+        _, job = self._queued.popitem(last=False)
+        job.status = RUNNING
+        job.updated_at = datetime.utcnow()
+        return job
+
+    async def finish(self, job: ScrapeJob, status: str, projects: Optional[int] = None, detail: Optional[str] = None):
+        job.status, job.projects, job.detail = status, projects, detail
+        job.updated_at = datetime.utcnow()
+        self._unfinished.pop(job.username, None)
+
+    async def prune(self, before: datetime) -> int:
+        finished = [
+            job_id for job_id, job in self.jobs.items()
+            if job.status not in UNFINISHED and job.updated_at < before
+        ]
+        for job_id in finished:
+            del self.jobs[job_id]
+        return len(finished)
+
+
+class DatabaseJobStore(JobStore):
+    """
+    - two app workers submitting the same user at the same moment may both queue a job, the second one to run
+      finds the user stored and is done right away
+    """
+
+    async def submit(self, username: str) -> ScrapeJob:
+        try:
+            async with async_session() as session:
+                statement = (
+                    select(ScrapeJob)
+                    .where(ScrapeJob.username == username)
+                    .where(ScrapeJob.status.in_(UNFINISHED))
+                    .limit(1)
+                )
+                job = (await session.execute(statement)).scalars().first()
+                if job is None:
+                    job = ScrapeJob(username=username)
+                    session.add(job)
+                    await session.commit()
+                return job
+        except SQLAlchemyError as e:
+            logger.error(f"Job store error in submit: {e}")
+            raise DatabaseError("SQLAlchemyError queuing scrape job.")
+
+    async def get(self, job_id: str) -> Optional[ScrapeJob]:
+        try:
+            async with async_session() as session:
+                return await session.get(ScrapeJob, job_id)
+        except SQLAlchemyError as e:
+            logger.error(f"Job store error in get: {e}")
+            raise DatabaseError("SQLAlchemyError fetching scrape job.")
+
+    async def claim(self) -> Optional[ScrapeJob]:
+        """
+        - the claim is a conditional UPDATE, a job taken by another app worker since it was read is skipped
+        - a job still running after JOB_RUNNING_TIMEOUT_SECONDS is taken again (its app worker stopped or died)
+        """
+        abandoned = datetime.utcnow() - timedelta(seconds=settings.JOB_RUNNING_TIMEOUT_SECONDS)
+        claimable = or_(
+            ScrapeJob.status == QUEUED,
+            (ScrapeJob.status == RUNNING) & (ScrapeJob.updated_at < abandoned),
+        )
+        try:
+            async with async_session() as session:
+                while True:
+                    statement = select(ScrapeJob).where(claimable).order_by(ScrapeJob.created_at).limit(1)
+                    job = (await session.execute(statement)).scalars().first()
+                    if job is None:
+                        return None
+                    now = datetime.utcnow()
+                    result = await session.execute(
+                        update(ScrapeJob)
+                        .where(ScrapeJob.id == job.id)
+                        .where(ScrapeJob.status == job.status)
+                        .where(ScrapeJob.updated_at == job.updated_at)
+                        .values(status=RUNNING, updated_at=now)
+                    )
+                    await session.commit()
+                    if result.rowcount == 1:
+                        job.status, job.updated_at = RUNNING, now
+                        return job
+        except SQLAlchemyError as e:
+            logger.error(f"Job store error in claim: {e}")
+            raise DatabaseError("SQLAlchemyError claiming scrape job.")
+
+    async def finish(self, job: ScrapeJob, status: str, projects: Optional[int] = None, detail: Optional[str] = None):
+        try:
+            async with async_session() as session:
+                await session.execute(
+                    update(ScrapeJob)
+                    .where(ScrapeJob.id == job.id)
+                    .values(status=status, projects=projects, detail=detail, updated_at=datetime.utcnow())
+                )
+                await session.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"Job store error in finish: {e}")
+            raise DatabaseError("SQLAlchemyError finishing scrape job.")
+
+    async def prune(self, before: datetime) -> int:
+        try:
+            async with async_session() as session:
+                result = await session.execute(
+                    delete(ScrapeJob)
+                    .where(ScrapeJob.status.not_in(UNFINISHED))
+                    .where(ScrapeJob.updated_at < before)
+                )
+                await session.commit()
+                return result.rowcount
+        except SQLAlchemyError as e:
+            logger.error(f"Job store error in prune: {e}")
+            raise DatabaseError("SQLAlchemyError pruning scrape jobs.")
+
+
+def create_job_store() -> JobStore:
+    """
+    Build the store selected by settings.JOB_BACKEND ("memory" or "database").
+    """
+    if settings.JOB_BACKEND == "database":
+        return DatabaseJobStore()
+    if settings.JOB_BACKEND != "memory":
+        logger.warning(f"Unknown JOB_BACKEND '{settings.JOB_BACKEND}'. Using the in-memory job store.")
+    return MemoryJobStore()
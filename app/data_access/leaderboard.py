@@ -0,0 +1,265 @@
+# app/data_access/leaderboard.py
+# Materialized top-N most starred projects, so that /projects/most-starred/{n} never sorts the projects table.
+# - the leaderboard_entry table holds the top LEADERBOARD_SIZE projects, it is updated in the same transaction
+#   as every project insert, so it is always consistent with the projects table
+# - every worker serves the leaderboard from a sorted copy in memory, updated after its own writes and reloaded
+#   from the table (LEADERBOARD_SIZE rows) every LEADERBOARD_RELOAD_SECONDS to pick up the writes of other workers
+# - whether a written project ranks is decided against the table, in the writer's transaction, never against the
+#   copy in memory: another worker may have lowered or deleted the projects of the copy
+# - a refresh that rewrites the projects of a ranking user recomputes the table (LEADERBOARD_SIZE rows) in its transaction
+# - check() compares the table with the projects table and rebuild() recomputes it from scratch:
+#       python -m app.data_access.leaderboard [--rebuild]
+
+
+import asyncio
+import bisect
+import logging
+import sys
+import time
+from app.core.logging_config import *
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from app.core.config import settings
+from app.data_access.database import async_session
+from app.models import LeaderboardEntry, Project
+
+
+logger = logging.getLogger(__name__)
+
+
+def rank_key(project: Project) -> Tuple[int, int]:
+    """
+    Sort key of the leaderboard: most stars first, ties broken by the newest project (highest id),
+    the same order as ORDER BY stars DESC, id DESC.
+    """
+    return (-project.stars, -project.id)
+
+
+def to_entry_row(project: Project) -> dict:
+    return {
+        "project_id": project.id,
+        "name": project.name,
+        "description": project.description,
+        "stars": project.stars,
+        "forks": project.forks,
+        "user_id": project.user_id,
+    }
+
+
+def to_project_row(project: Project) -> dict:
+    """
+    A project as the API returns it, for the fast read path.
+    """
+    return {
+        "id": project.id,
+        "name": project.name,
+        "description": project.description,
+        "stars": project.stars,
+        "forks": project.forks,
+        "user_id": project.user_id,
+    }
+
+
+def from_entry(entry: LeaderboardEntry) -> Project:
+    return Project(
+        id=entry.project_id,
+        name=entry.name,
+        description=entry.description,
+        stars=entry.stars,
+        forks=entry.forks,
+        user_id=entry.user_id,
+    )
+
+
+class Leaderboard:
+
+    def __init__(self):
+        self._keys: List[Tuple[int, int]] = [] # rank keys, sorted
+        self._projects: List[Project] = [] # in the order of _keys
+        self._rows: Optional[List[dict]] = None # _projects as plain dicts, built when first asked for
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def size(self) -> int:
+        return settings.LEADERBOARD_SIZE
+
+    async def top(self, n: int) -> List[Project]:
+        """
+        The n (<= size) most starred projects, from memory.
+        """
+        if self._loaded_at is None or time.monotonic() - self._loaded_at >= settings.LEADERBOARD_RELOAD_SECONDS:
+            await self.load()
+        return self._projects[:n]
+
+    async def top_rows(self, n: int) -> List[dict]:
+        """
+        The n (<= size) most starred projects as plain dicts (see to_project_row), from memory.
+        """
+        await self.top(n)
+        if self._rows is None:
+            self._rows = [to_project_row(p) for p in self._projects]
+        return self._rows[:n]
+
+    async def load(self):
+        """
+        Replace the copy in memory with the leaderboard_entry table.
+        - read from the primary even with a replica: a lagging replica would drop this worker's own writes
+          from the copy until the next reload
+        """
+        async with self._lock:
+            async with async_session() as session:
+                statement = (
+                    select(LeaderboardEntry)
+                    .order_by(LeaderboardEntry.stars.desc(), LeaderboardEntry.project_id.desc())
+                    .limit(self.size)
+                )
+                entries = (await session.execute(statement)).scalars().all()
+            self._set([from_entry(entry) for entry in entries])
+
+    async def record(self, session: AsyncSession, projects: List[Project]):
+        """
+        Add newly inserted projects to the leaderboard_entry table, in the caller's transaction.
+        - only the projects that rank against the table are written (see ranking()), then the table is trimmed back to size
+        - call merge() with the same projects once the transaction is committed
+        """
+        candidates = sorted(await self.ranking(session, projects), key=rank_key)[:self.size]
+        if not candidates:
+            return
+        await session.execute(insert(LeaderboardEntry).execution_options(render_nulls=True), [to_entry_row(p) for p in candidates])
+        keep = (
+            select(LeaderboardEntry.project_id)
+            .order_by(LeaderboardEntry.stars.desc(), LeaderboardEntry.project_id.desc())
+            .limit(self.size)
+        )
+        await session.execute(delete(LeaderboardEntry).where(LeaderboardEntry.project_id.not_in(keep)))
+
+    def merge(self, projects: Iterable[Project]):
+        """
+        Add committed projects to the copy in memory.
+        """
+        for project in projects:
+            key = rank_key(project)
+            # the project may already be there if the table was reloaded since the commit
+            if (len(self._keys) >= self.size and key >= self._keys[-1]) or any(p.id == project.id for p in self._projects):
+                continue
+            index = bisect.bisect_left(self._keys, key)
+            self._keys.insert(index, key)
+            self._projects.insert(index, project)
+        del self._keys[self.size:]
+        del self._projects[self.size:]
+        self._rows = None
+
+    async def check(self) -> bool:
+        """
+        Consistency checker: True if the leaderboard_entry table matches the top projects of the projects table.
+        """
+        async with async_session() as session:
+            expected = await self._compute(session)
+            statement = (
+                select(LeaderboardEntry)
+                .order_by(LeaderboardEntry.stars.desc(), LeaderboardEntry.project_id.desc())
+                .limit(self.size)
+            )
+            stored = (await session.execute(statement)).scalars().all()
+        consistent = [to_entry_row(p) for p in expected] == [to_entry_row(from_entry(e)) for e in stored]
+        if not consistent:
+            logger.warning("The leaderboard_entry table does not match the projects table.")
+        return consistent
+
+    async def remove_user(self, session: AsyncSession, user_id: int) -> bool:
+        """
+        Remove the projects of a user from the leaderboard_entry table, in the caller's transaction,
+        before the projects themselves are deleted or rewritten.
+        - returns True if the user had ranking projects: the leaderboard must then be recomputed (recompute())
+          before the commit, since the projects below them may now rank
+        """
+        result = await session.execute(delete(LeaderboardEntry).where(LeaderboardEntry.user_id == user_id))
+        return result.rowcount > 0
+
+    async def recompute(self, session: AsyncSession) -> List[Project]:
+        """
+        Rewrite the leaderboard_entry table from the projects table, in the caller's transaction.
+        - call replace() with the returned projects once the transaction is committed
+        """
+        projects = await self._compute(session)
+        await session.execute(delete(LeaderboardEntry))
+        if projects:
+            await session.execute(insert(LeaderboardEntry).execution_options(render_nulls=True), [to_entry_row(p) for p in projects])
+        return projects
+
+    def replace(self, projects: List[Project]):
+        """
+        Replace the copy in memory with committed projects returned by recompute().
+        """
+        self._set(projects)
+
+    async def rebuild(self):
+        """
+        Recompute the leaderboard from the projects table, replace the table and the copy in memory.
+        """
+        async with self._lock:
+            async with async_session() as session:
+                projects = await self.recompute(session)
+                await session.commit()
+            self.replace(projects)
+        logger.info(f"Leaderboard rebuilt with {len(projects)} projects.")
+
+    async def ensure_consistent(self):
+        """
+        Rebuild if the table doesn't match the projects table (eg. a database written by an older version), then load.
+        """
+        if await self.check():
+            await self.load()
+        else:
+            await self.rebuild()
+
+    def reset(self):
+        self._set([])
+        self._loaded_at = None
+
+    async def _compute(self, session: AsyncSession) -> List[Project]:
+        statement = select(Project).order_by(Project.stars.desc(), Project.id.desc()).limit(self.size)
+        return list((await session.execute(statement)).scalars().all())
+
+    async def ranking(self, session: AsyncSession, projects: Iterable[Project]) -> List[Project]:
+        """
+        The projects that would enter the leaderboard_entry table, read in the caller's transaction.
+        - the last row of a full table is locked (FOR UPDATE, where supported) until the commit, so that concurrent
+          writers near the bottom of the leaderboard take turns
+        """
+        statement = (
+            select(LeaderboardEntry.stars, LeaderboardEntry.project_id)
+            .order_by(LeaderboardEntry.stars.desc(), LeaderboardEntry.project_id.desc())
+            .offset(self.size - 1)
+            .limit(1)
+            .with_for_update()
+        )
+        last = (await session.execute(statement)).first()
+        if last is None:
+            return list(projects)
+        cutoff = (-last.stars, -last.project_id)
+        return [p for p in projects if rank_key(p) < cutoff]
+
+    def _set(self, projects: List[Project]):
+        self._projects = projects
+        self._keys = [rank_key(p) for p in projects]
+        self._rows = None
+        self._loaded_at = time.monotonic()
+
+
+# shared by the repositories
+leaderboard = Leaderboard()
+
+
+async def main(rebuild: bool):
+    if rebuild or not await leaderboard.check():
+        await leaderboard.rebuild()
+    else:
+        logger.info("The leaderboard is consistent.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main("--rebuild" in sys.argv))
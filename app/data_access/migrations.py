@@ -0,0 +1,69 @@
+# app/data_access/migrations.py
+# Bring an existing database up to the current models.
+# SQLModel.metadata.create_all only creates missing tables, it never touches a table that already exists,
+# so columns and indexes added to the models later are created here.
+
+
+import logging
+from app.core.logging_config import *
+from sqlalchemy import Text, cast, inspect, text, update
+from sqlalchemy.engine import Connection
+from sqlmodel import SQLModel
+from app.models import User
+
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns(conn: Connection):
+    """
+    Add every column declared on the models that an existing table does not have yet (ALTER TABLE ... ADD COLUMN).
+    - only nullable columns can be added, the existing rows get NULL
+    """
+    inspector = inspect(conn)
+    preparer = conn.dialect.identifier_preparer
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                raise RuntimeError(f"Cannot add the NOT NULL column '{column.name}' to the existing table '{table.name}'.")
+            logger.info(f"Adding column '{column.name}' to '{table.name}'.")
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(
+                f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}"
+            ))
+
+
+def create_missing_indexes(conn: Connection):
+    """
+    Create every index declared on the models that the database does not have yet.
+    """
+    inspector = inspect(conn)
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info(f"Creating index '{index.name}' on '{table.name}'.")
+                index.create(conn)
+
+
+def null_json_nulls(conn: Connection):
+    """
+    The users stored before github_validators kept None as SQL NULL hold the JSON 'null' instead.
+    """
+    column = User.__table__.c.github_validators
+    result = conn.execute(update(User.__table__).where(cast(column, Text) == "null").values(github_validators=None))
+    if result.rowcount:
+        logger.info(f"Replaced the JSON null github_validators of {result.rowcount} users with NULL.")
+
+
+def upgrade_schema(conn: Connection):
+    """
+    Run every migration step, each one is a no-op on an up-to-date database.
+    Call it with a connection on which the tables already exist (after create_all).
+    """
+    add_missing_columns(conn)
+    create_missing_indexes(conn)
+    null_json_nulls(conn)
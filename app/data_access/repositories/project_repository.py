@@ -3,28 +3,70 @@
 
 import logging
 from app.core.logging_config import *
-from app.data_access.database import async_session
-from app.models import Project
+from app.data_access.database import async_session, read_session, pin_to_primary
+from app.data_access.cache import (
+    query_cache, USER_BY_USERNAME, PROJECTS_BY_USER, MOST_STARRED, USER_ID_BY_USERNAME, PROJECT_ROWS_BY_USER, MOST_STARRED_ROWS
+)
+from app.data_access.leaderboard import leaderboard
+from app.core.config import settings
+from app.core.metrics import REPOSITORY_CALL_DURATION, instrumented
+from app.models import Project, User
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
 from sqlmodel import select
+from sqlalchemy import delete, insert, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.exceptions import DatabaseError
+from app.core.pagination import PROJECT_SORTS
 
 
 
 logger = logging.getLogger(__name__)
 
+# the fields of the Project API model, in order, and their columns for the row queries
+PROJECT_FIELDS = ("id", "name", "description", "stars", "forks", "user_id")
+PROJECT_COLUMNS = tuple(getattr(Project, field) for field in PROJECT_FIELDS)
+
+# the INSERT constructs with ON CONFLICT, by dialect
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+# dialects whose multi-row INSERT ... RETURNING may return the rows in any order: the RETURNING is sorted by
+# parameter order (batched with a sentinel column); SQLite returns them as inserted, and would insert one row
+# per statement with sort_by_parameter_order
+UNORDERED_RETURNING = {"postgresql"}
+
+# ids per DELETE ... WHERE id IN (...), under the bound parameter limits
+DELETE_BATCH_SIZE = 500
+
+@instrumented(REPOSITORY_CALL_DURATION, statements=True)
 class ProjectRepository:
     @staticmethod
     async def get_most_starred(n: int) -> Optional[List[Project]]:
         """
         Get n most starred projects
+        - served from the materialized leaderboard when n <= LEADERBOARD_SIZE
         """
+        if n <= leaderboard.size:
+            try:
+                return await leaderboard.top(n)
+            except SQLAlchemyError as e:
+                logger.error(f"Project repository error in get_most_starred: {e}")
+                raise DatabaseError("SQLAlchemyError fetching most starred projects.")
+            except Exception as e:
+                logger.error(f"An unexpected project repository error occurred: {e}")
+                raise DatabaseError("Error fetching most starred projects.")
+
+        cached = await query_cache.get(MOST_STARRED, n)
+        if cached is not None:
+            return cached
         try:
-            async with async_session() as session:
-                statement = select(Project).order_by(Project.stars.desc()).limit(n)
+            async with read_session() as session:
+                statement = select(Project).order_by(Project.stars.desc(), Project.id.desc()).limit(n)
                 result = await session.execute(statement)
-                return result.scalars().all()
+                projects = result.scalars().all()
+                await query_cache.set(MOST_STARRED, n, projects, settings.CACHE_TTL_MOST_STARRED)
+                return projects
         except SQLAlchemyError as e:
             logger.error(f"Project repository error in get_most_starred: {e}")
             raise DatabaseError("SQLAlchemyError fetching most starred projects.")
@@ -38,12 +80,17 @@ class ProjectRepository:
         """
         Get all projects by user id
         """
+        cached = await query_cache.get(PROJECTS_BY_USER, user_id)
+        if cached is not None:
+            return cached
         try:
-            async with async_session() as session:
+            async with read_session(user_id) as session:
                 statement = select(Project).where(Project.user_id == user_id)
                 result = await session.execute(statement)
                 # could be empty
-                return result.scalars().all()
+                projects = result.scalars().all()
+                await query_cache.set(PROJECTS_BY_USER, user_id, projects, settings.CACHE_TTL_USER_PROJECTS)
+                return projects
         except SQLAlchemyError as e:
             logger.error(f"Project repository error in get_by_user_id: {e}")
             raise DatabaseError("SQLAlchemyError fetching projects by user id.")
@@ -51,6 +98,162 @@ class ProjectRepository:
             logger.error(f"An unexpected project repository error occurred: {e}")
             raise DatabaseError("Error fetching projects by user id.")
     
+    @staticmethod
+    async def get_rows_by_username(username: str) -> Optional[List[dict]]:
+        """
+        Like get_by_username, but the projects are plain dicts (the fields of the Project API model) built from
+        the row tuples, without a Project instance per row. For responses that are not validated again.
+        """
+        user_id = await query_cache.get(USER_ID_BY_USERNAME, username)
+        if user_id is not None:
+            cached = await query_cache.get(PROJECT_ROWS_BY_USER, user_id)
+            if cached is not None:
+                return cached
+        try:
+            async with read_session(username) as session:
+                statement = (
+                    select(User.id, *PROJECT_COLUMNS)
+                    .select_from(User)
+                    .outerjoin(Project, Project.user_id == User.id)
+                    .where(User.username == username)
+                )
+                rows = (await session.execute(statement)).all()
+            if not rows:
+                return None
+            user_id = rows[0][0]
+            # a user without projects comes back as a single row with NULL project columns
+            projects = [dict(zip(PROJECT_FIELDS, row[1:])) for row in rows if row[1] is not None]
+            await query_cache.set(USER_ID_BY_USERNAME, username, user_id, settings.CACHE_TTL_USER_PROJECTS)
+            await query_cache.set(PROJECT_ROWS_BY_USER, user_id, projects, settings.CACHE_TTL_USER_PROJECTS)
+            return projects
+        except SQLAlchemyError as e:
+            logger.error(f"Project repository error in get_rows_by_username: {e}")
+            raise DatabaseError("SQLAlchemyError fetching project rows by username.")
+        except Exception as e:
+            logger.error(f"An unexpected project repository error occurred: {e}")
+            raise DatabaseError("Error fetching project rows by username.")
+
+    @staticmethod
+    async def get_most_starred_rows(n: int) -> List[dict]:
+        """
+        Like get_most_starred, but the projects are plain dicts (the fields of the Project API model).
+        """
+        try:
+            if n <= leaderboard.size:
+                return await leaderboard.top_rows(n)
+            cached = await query_cache.get(MOST_STARRED_ROWS, n)
+            if cached is not None:
+                return cached
+            async with read_session() as session:
+                statement = select(*PROJECT_COLUMNS).order_by(Project.stars.desc(), Project.id.desc()).limit(n)
+                rows = (await session.execute(statement)).all()
+            projects = [dict(zip(PROJECT_FIELDS, row)) for row in rows]
+            await query_cache.set(MOST_STARRED_ROWS, n, projects, settings.CACHE_TTL_MOST_STARRED)
+            return projects
+        except SQLAlchemyError as e:
+            logger.error(f"Project repository error in get_most_starred_rows: {e}")
+            raise DatabaseError("SQLAlchemyError fetching most starred project rows.")
+        except Exception as e:
+            logger.error(f"An unexpected project repository error occurred: {e}")
+            raise DatabaseError("Error fetching most starred project rows.")
+
+    @staticmethod
+    async def get_page(
+        user_id: int,
+        sort: str = "stars",
+        limit: int = 30,
+        after: Optional[Tuple[Any, int]] = None,
+        min_stars: Optional[int] = None,
+    ) -> List[Project]:
+        """
+        One page of a user's projects, sorted by stars or forks (descending) or name (ascending), ties broken by id.
+        - keyset pagination: after is the (sort value, id) of the last project of the previous page, the page
+          is a range scan of the (user_id, <sort>, id) index however deep it is
+        - min_stars keeps the projects with at least that many stars
+        """
+        field, descending = PROJECT_SORTS[sort]
+        column = getattr(Project, field)
+        statement = select(Project).where(Project.user_id == user_id)
+        if min_stars is not None:
+            statement = statement.where(Project.stars >= min_stars)
+        if after is not None:
+            key = tuple_(column, Project.id)
+            statement = statement.where(key < tuple_(*after) if descending else key > tuple_(*after))
+        if descending:
+            statement = statement.order_by(column.desc(), Project.id.desc())
+        else:
+            statement = statement.order_by(column, Project.id)
+        try:
+            async with read_session(user_id) as session:
+                result = await session.execute(statement.limit(limit))
+                return result.scalars().all()
+        except SQLAlchemyError as e:
+            logger.error(f"Project repository error in get_page: {e}")
+            raise DatabaseError("SQLAlchemyError fetching a page of projects.")
+        except Exception as e:
+            logger.error(f"An unexpected project repository error occurred: {e}")
+            raise DatabaseError("Error fetching a page of projects.")
+
+    @staticmethod
+    async def stream_by_user_id(user_id: int, batch_size: Optional[int] = None) -> AsyncIterator[List[dict]]:
+        """
+        Yield the projects of a user as plain dicts (the fields of the Project API model), batch_size rows at a time.
+        - the rows are read with a server-side cursor (session.stream), only one batch is in memory at a time
+        - no ORM instances are built and nothing is cached, this is meant for users with many projects
+        - the session stays open until the iteration is done, a DatabaseError can be raised after the first batch
+        """
+        batch_size = batch_size or settings.STREAM_BATCH_SIZE
+        try:
+            async with read_session(user_id) as session:
+                statement = (
+                    select(*PROJECT_COLUMNS)
+                    .where(Project.user_id == user_id)
+                    .order_by(Project.id)
+                    .execution_options(yield_per=batch_size)
+                )
+                result = await session.stream(statement)
+                async for rows in result.mappings().partitions():
+                    yield [dict(row) for row in rows]
+        except SQLAlchemyError as e:
+            logger.error(f"Project repository error in stream_by_user_id: {e}")
+            raise DatabaseError("SQLAlchemyError streaming projects by user id.")
+
+    @staticmethod
+    async def get_by_username(username: str) -> Optional[List[Project]]:
+        """
+        Get all projects of a user by username in a single query (user LEFT JOIN projects).
+        - returns None if the user is not in the database, and an empty list if the user has no projects
+        - replaces UserRepository.get_by_username + get_by_user_id (two sessions, three round trips) on the read path
+        """
+        user = await query_cache.get(USER_BY_USERNAME, username)
+        if user is not None:
+            cached = await query_cache.get(PROJECTS_BY_USER, user.id)
+            if cached is not None:
+                return cached
+        try:
+            async with read_session(username) as session:
+                statement = (
+                    select(User, Project)
+                    .outerjoin(Project, Project.user_id == User.id)
+                    .where(User.username == username)
+                )
+                result = await session.execute(statement)
+                rows = result.all()
+                if not rows:
+                    return None
+                user = rows[0][0]
+                # a user without projects comes back as a single row with a NULL project
+                projects = [project for _, project in rows if project is not None]
+                await query_cache.set(USER_BY_USERNAME, username, user, settings.CACHE_TTL_USER_PROJECTS)
+                await query_cache.set(PROJECTS_BY_USER, user.id, projects, settings.CACHE_TTL_USER_PROJECTS)
+                return projects
+        except SQLAlchemyError as e:
+            logger.error(f"Project repository error in get_by_username: {e}")
+            raise DatabaseError("SQLAlchemyError fetching projects by username.")
+        except Exception as e:
+            logger.error(f"An unexpected project repository error occurred: {e}")
+            raise DatabaseError("Error fetching projects by username.")
+
     @staticmethod
     async def create_projects(user_id: int, projects_data: List[dict]) -> Optional[List[Project]]:
         """
@@ -60,22 +263,148 @@ class ProjectRepository:
             if not projects_data:
                 return []
             async with async_session() as session:
-                projects = []
-                for data in projects_data:
-                    project = Project(
-                        name=data['name'],
-                        description=data.get('description'),
-                        stars=data.get('stargazers_count', 0),
-                        forks=data.get('forks_count', 0),
-                        user_id=user_id
-                    )
-                    session.add(project)
-                    projects.append(project)
+                projects, owners = await ProjectRepository.insert_projects(session, user_id, projects_data)
                 await session.commit()
-                return projects
+            pin_to_primary(user_id)
+            if owners:
+                await leaderboard.load()
+                await ProjectRepository.transferred(owners)
+            else:
+                leaderboard.merge(projects)
+            await query_cache.delete(PROJECTS_BY_USER, user_id)
+            await query_cache.invalidate(MOST_STARRED)
+            return projects
         except SQLAlchemyError as e:
             logger.error(f"Project repository error in create_projects: {e}")
             raise DatabaseError("SQLAlchemyError creating projects.")
         except Exception as e:
             logger.error(f"An unexpected project repository error occurred: {e}")
-            raise DatabaseError("Error creating projects.")
\ No newline at end of file
+            raise DatabaseError("Error creating projects.")
+
+    @staticmethod
+    async def insert_projects(session: AsyncSession, user_id: int, projects_data: List[dict]) -> Tuple[List[Project], Dict[int, str]]:
+        """
+        Bulk insert projects in the caller's session and transaction (nothing is committed).
+        - one multi-row INSERT ... ON CONFLICT (github_id) DO UPDATE ... RETURNING per batch instead of the ORM unit
+          of work (one INSERT and id fetch per project): a repository stored under another user (transferred on
+          GitHub) moves to this one
+        - render_nulls keeps rows with and without a description in the same batch
+        - returns the projects and the users they were moved from (see take_over())
+        - the projects that rank are added to the leaderboard in the same transaction, call leaderboard.merge()
+          with the returned projects after the commit; if projects were moved, the leaderboard is recomputed
+          instead, call leaderboard.load() and transferred() after the commit
+        """
+        if not projects_data:
+            return [], {}
+        rows = [ProjectRepository.to_row(user_id, data) for data in projects_data]
+        owners = await ProjectRepository.take_over(session, user_id, [row["github_id"] for row in rows if row["github_id"] is not None])
+        projects = await ProjectRepository.upsert_rows(session, rows)
+        if owners:
+            await leaderboard.recompute(session)
+        else:
+            await leaderboard.record(session, projects)
+        return projects, owners
+
+    @staticmethod
+    def to_row(user_id: int, data: dict) -> dict:
+        """
+        The project row of a repository as GitHub returns it.
+        """
+        return {
+            "name": data['name'],
+            "description": data.get('description'),
+            "stars": data.get('stargazers_count', 0),
+            "forks": data.get('forks_count', 0),
+            "user_id": user_id,
+            "github_id": data.get('id'),
+        }
+
+    @staticmethod
+    async def upsert_rows(session: AsyncSession, rows: List[dict]) -> List[Project]:
+        """
+        Insert project rows, or update the project with the same github_id, in the caller's session and transaction.
+        - one multi-row INSERT ... ON CONFLICT (github_id) DO UPDATE ... RETURNING, a repository transferred from
+          another user moves to this one
+        - rows without a github_id never conflict, they are inserted
+        - the leaderboard is not touched, see UserRepository.refresh_projects
+        """
+        if not rows:
+            return []
+        statement = ProjectRepository.upsert_statement(session.bind.dialect.name)
+        result = await session.scalars(statement, rows)
+        return result.all()
+
+    @staticmethod
+    def upsert_statement(dialect: str):
+        """
+        The INSERT ... ON CONFLICT (github_id) DO UPDATE ... RETURNING of upsert_rows, for the dialect's name.
+        """
+        if dialect not in UPSERT_INSERTS:
+            raise DatabaseError(f"Upserts are not supported on '{dialect}'.")
+        statement = UPSERT_INSERTS[dialect](Project)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Project.github_id],
+            set_={field: statement.excluded[field] for field in ("name", "description", "stars", "forks", "user_id")},
+        )
+        in_order = dialect in UNORDERED_RETURNING
+        return statement.returning(Project, sort_by_parameter_order=in_order).execution_options(
+            render_nulls=True, populate_existing=True
+        )
+
+    @staticmethod
+    async def take_over(session: AsyncSession, user_id: int, github_ids: Iterable[int], replaced_ids: Iterable[int] = ()) -> Dict[int, str]:
+        """
+        Prepare the move of GitHub repositories stored under other users (transferred on GitHub) to user_id, in the
+        caller's session and transaction.
+        - github_ids are moved by the upserts that follow (ON CONFLICT (github_id)), the other users' projects of
+          replaced_ids are deleted: a project of user_id stored without a GitHub id is about to take it
+        - returns the previous owners (id -> username), whose leaderboard entries are removed: the leaderboard must
+          be recomputed before the commit, and transferred() called after it
+        """
+        github_ids, replaced_ids = list(github_ids), list(replaced_ids)
+        if not github_ids and not replaced_ids:
+            return {}
+        statement = (
+            select(User.id, User.username)
+            .join(Project, Project.user_id == User.id)
+            .where(Project.github_id.in_(github_ids + replaced_ids), Project.user_id != user_id)
+            .distinct()
+        )
+        owners = dict((await session.execute(statement)).all())
+        if not owners:
+            return {}
+        for owner_id in owners:
+            await leaderboard.remove_user(session, owner_id)
+        if replaced_ids:
+            await session.execute(delete(Project).where(Project.github_id.in_(replaced_ids), Project.user_id != user_id))
+        logger.info(f"Moving repositories of users {sorted(owners.values())} to user {user_id}.")
+        return owners
+
+    @staticmethod
+    async def transferred(owners: Dict[int, str]):
+        """
+        Once the move prepared by take_over() is committed: the stored projects of the previous owners changed.
+        """
+        for owner_id, username in owners.items():
+            pin_to_primary(username, owner_id)
+            await query_cache.delete(USER_BY_USERNAME, username)
+            await query_cache.delete(PROJECTS_BY_USER, owner_id)
+
+    @staticmethod
+    async def update_rows(session: AsyncSession, rows: List[dict]) -> List[Project]:
+        """
+        Update projects by primary key (every row has its "id"), in the caller's session and transaction.
+        """
+        if not rows:
+            return []
+        await session.execute(update(Project), rows)
+        return [Project(**row) for row in rows]
+
+    @staticmethod
+    async def delete_by_ids(session: AsyncSession, ids: List[int]):
+        """
+        Delete projects by primary key, in the caller's session and transaction.
+        - their leaderboard entries must be gone first (see Leaderboard.remove_user)
+        """
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            await session.execute(delete(Project).where(Project.id.in_(ids[start:start + DELETE_BATCH_SIZE])))
@@ -4,25 +4,43 @@
 
 import logging 
 from app.core.logging_config import *
-from app.data_access.database import async_session
-from app.models import User
+from app.data_access.database import async_session, read_session, pin_to_primary
+from app.data_access.cache import query_cache, USER_BY_USERNAME, RECENT_USERS, PROJECTS_BY_USER, MOST_STARRED, USER_ID_BY_USERNAME, RECENT_USER_ROWS
+from app.data_access.repositories.project_repository import ProjectRepository
+from app.data_access.leaderboard import leaderboard
+from app.core.config import settings
+from app.core.metrics import REPOSITORY_CALL_DURATION, instrumented
+from app.models import User, Project
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from sqlmodel import select
-from typing import Optional, List
+from sqlalchemy import or_, update
+from datetime import datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, Optional, List
+from contextlib import asynccontextmanager
 from app.core.exceptions import DatabaseError
 
 
 logger = logging.getLogger(__name__)
 
+# the fields of the User API model, in order, and their columns for the row queries
+USER_FIELDS = ("id", "username", "created_at", "last_fetched_at")
+USER_COLUMNS = tuple(getattr(User, field) for field in USER_FIELDS)
 
+
+@instrumented(REPOSITORY_CALL_DURATION, statements=True)
 class UserRepository:
     @staticmethod
     async def get_by_username(username: str) -> Optional[User]:
         """
         Retrieve a user by their username.
+        - only existing users are cached, a missing user is looked up again on the next call
         """
+        cached = await query_cache.get(USER_BY_USERNAME, username)
+        if cached is not None:
+            return cached
         try:
-            async with async_session() as session:
+            async with read_session(username) as session:
                 statement = select(User).where(User.username == username)
                 result = await session.execute(statement)
                 # it should't retrieve more than one user and could be None
@@ -36,6 +54,7 @@ class UserRepository:
                 """
                 if user:
                     await session.refresh(user, attribute_names=["projects"])
+                    await query_cache.set(USER_BY_USERNAME, username, user, settings.CACHE_TTL_USER_PROJECTS)
                 return user
         except SQLAlchemyError as e:
             logger.error(f"User repository error in get_by_username: {e}")
@@ -54,10 +73,15 @@ class UserRepository:
             async with async_session() as session:
                 session.add(user)
                 await session.commit()
-                return user
+            pin_to_primary(user.username, user.id)
+            await query_cache.delete(USER_BY_USERNAME, user.username)
+            await query_cache.invalidate(RECENT_USERS)
+            return user
         except IntegrityError as e:
             # User already exists, retrieve the user
             logger.warning(f"User '{user.username}' already exists. Retrieving existing user.")
+            # the replica may not have it yet
+            pin_to_primary(user.username)
             async with async_session() as session:
                 statement = select(User).where(User.username == user.username)
                 result = await session.execute(statement)
@@ -75,18 +99,370 @@ class UserRepository:
             logger.error(f"An unexpected user repository error occurred: {e}")
             raise DatabaseError("Error creating user.")
 
+    @staticmethod
+    @asynccontextmanager
+    async def create_with_projects(user: User) -> AsyncIterator["ProjectWriter"]:
+        """
+        Create a new user and their projects in a single transaction.
+
+            async with UserRepository.create_with_projects(User(username=username)) as writer:
+                await writer.add(page) # for every page of projects
+            projects = writer.projects
+
+        - the user is inserted (flushed) on enter, every add() bulk inserts its projects, everything is committed on exit
+        - an exception in the block (eg. a failed GitHub page) rolls back the user and the projects written so far
+        - if the same user was created concurrently (IntegrityError), nothing is written, add() does nothing
+          and writer.projects holds the stored projects of the existing user
+        - repositories stored under another user (transferred on GitHub) move to this one, see ProjectRepository.take_over
+        """
+        session = None
+        try:
+            session = async_session()
+            session.add(user)
+            await session.flush()
+            writer = ProjectWriter(session, user)
+        except IntegrityError:
+            await session.close()
+            logger.warning(f"User '{user.username}' already exists. Retrieving existing projects.")
+            # the replica may not have it yet
+            pin_to_primary(user.username)
+            writer = await ProjectWriter.for_existing_user(user.username)
+        except SQLAlchemyError as e:
+            await session.close()
+            logger.error(f"User repository error in create_with_projects: {e}")
+            raise DatabaseError("SQLAlchemyError creating user.")
+        except Exception as e:
+            logger.error(f"An unexpected user repository error occurred: {e}")
+            raise DatabaseError("Error creating user.")
+
+        if writer.existing:
+            yield writer
+            return
+
+        try:
+            # errors raised in the block propagate as they are, closing the session rolls back
+            yield writer
+            await session.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"User repository error in create_with_projects: {e}")
+            raise DatabaseError("SQLAlchemyError creating user and projects.")
+        finally:
+            await session.close()
+        pin_to_primary(user.username, user.id)
+        if writer.moved_from:
+            # the leaderboard was recomputed in the transaction
+            await leaderboard.load()
+            await ProjectRepository.transferred(writer.moved_from)
+        else:
+            leaderboard.merge(writer.projects)
+        await query_cache.delete(USER_BY_USERNAME, user.username)
+        await query_cache.invalidate(RECENT_USERS)
+        await query_cache.delete(PROJECTS_BY_USER, user.id)
+        await query_cache.invalidate(MOST_STARRED)
+
+    @staticmethod
+    @asynccontextmanager
+    async def refresh_projects(user: User) -> AsyncIterator["ProjectSync"]:
+        """
+        Sync the projects of a stored user with freshly fetched ones in a single transaction.
+
+            async with UserRepository.refresh_projects(user) as sync:
+                await sync.add(page) # for every page of projects
+
+        - only the changes are written (see ProjectSync): new and changed projects are upserted on add(),
+          the projects gone from GitHub are deleted on exit, if the block set sync.complete (every page was fetched)
+        - last_fetched_at and github_validators are saved and everything is committed on exit,
+          until then readers keep getting the old projects
+        - a repository stored under another user (transferred on GitHub) moves to this one
+        - the leaderboard is recomputed if the user ranked, a project was moved or a written project can rank
+        - an exception in the block rolls back, the old projects stay
+        """
+        session = async_session()
+        try:
+            sync = await ProjectSync.start(session, user)
+            # errors raised in the block propagate as they are, closing the session rolls back
+            yield sync
+            await sync.finish()
+            user.last_fetched_at = datetime.utcnow()
+            statement = (
+                update(User)
+                .where(User.id == user.id)
+                .values(last_fetched_at=user.last_fetched_at, github_validators=user.github_validators)
+            )
+            await session.execute(statement)
+            top = None
+            if sync.ranked or sync.moved_from or await leaderboard.ranking(session, sync.written):
+                top = await leaderboard.recompute(session)
+            await session.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"User repository error in refresh_projects: {e}")
+            raise DatabaseError("SQLAlchemyError refreshing projects.")
+        finally:
+            await session.close()
+        logger.info(
+            f"Synced the projects of user '{user.username}': {len(sync.written)} written, "
+            f"{sync.deleted} deleted, {sync.unchanged} unchanged, {sync.kept} kept (not fetched)."
+        )
+        if top is not None:
+            leaderboard.replace(top)
+        await ProjectRepository.transferred(sync.moved_from)
+        await query_cache.delete(USER_BY_USERNAME, user.username)
+        if sync.changed:
+            pin_to_primary(user.username, user.id)
+            await query_cache.delete(PROJECTS_BY_USER, user.id)
+            await query_cache.invalidate(MOST_STARRED)
+
+    @staticmethod
+    async def get_stale(before: datetime, limit: int, usernames: Optional[List[str]] = None) -> List[User]:
+        """
+        Retrieve up to limit users whose projects were last fetched before the given time, least recently fetched first.
+        - users stored before last_fetched_at was tracked (NULL) come first
+        - usernames restricts the lookup to these users
+        """
+        try:
+            async with read_session() as session:
+                statement = (
+                    select(User)
+                    .where(or_(User.last_fetched_at.is_(None), User.last_fetched_at < before))
+                    .order_by(User.last_fetched_at.asc().nulls_first(), User.id)
+                    .limit(limit)
+                )
+                if usernames is not None:
+                    statement = statement.where(User.username.in_(usernames))
+                result = await session.execute(statement)
+                return list(result.scalars().all())
+        except SQLAlchemyError as e:
+            logger.error(f"User repository error in get_stale: {e}")
+            raise DatabaseError("SQLAlchemyError fetching stale users.")
+        except Exception as e:
+            logger.error(f"An unexpected user repository error occurred: {e}")
+            raise DatabaseError("Error fetching stale users.")
+
+    @staticmethod
+    async def get_id_by_username(username: str) -> Optional[int]:
+        """
+        The id of a user, None if the user is not in the database (without loading the user's projects).
+        """
+        cached = await query_cache.get(USER_ID_BY_USERNAME, username)
+        if cached is not None:
+            return cached
+        try:
+            async with read_session(username) as session:
+                result = await session.execute(select(User.id).where(User.username == username))
+                user_id = result.scalar_one_or_none()
+            await query_cache.set(USER_ID_BY_USERNAME, username, user_id, settings.CACHE_TTL_USER_PROJECTS)
+            return user_id
+        except SQLAlchemyError as e:
+            logger.error(f"User repository error in get_id_by_username: {e}")
+            raise DatabaseError("SQLAlchemyError fetching user id by username.")
+        except Exception as e:
+            logger.error(f"An unexpected user repository error occurred: {e}")
+            raise DatabaseError("Error fetching user id by username.")
+
+    @staticmethod
+    async def claim_refresh(user: User, before: datetime) -> bool:
+        """
+        Mark a stale user as being refreshed by setting last_fetched_at, if it is still stale.
+        - returns False if another worker claimed or refreshed the user since it was read
+        - a failed refresh is retried once the user is stale again
+        """
+        try:
+            async with async_session() as session:
+                statement = (
+                    update(User)
+                    .where(User.id == user.id)
+                    .where(or_(User.last_fetched_at.is_(None), User.last_fetched_at < before))
+                    .values(last_fetched_at=datetime.utcnow())
+                )
+                result = await session.execute(statement)
+                await session.commit()
+                return result.rowcount == 1
+        except SQLAlchemyError as e:
+            logger.error(f"User repository error in claim_refresh: {e}")
+            raise DatabaseError("SQLAlchemyError claiming user refresh.")
+        except Exception as e:
+            logger.error(f"An unexpected user repository error occurred: {e}")
+            raise DatabaseError("Error claiming user refresh.")
+
     @staticmethod
     async def get_most_recent(n: int) -> List[User]:
         """
         Retrieve the n most recent users, ordered by creation date, which could be empty.
         """
+        cached = await query_cache.get(RECENT_USERS, n)
+        if cached is not None:
+            return cached
         try:
-            async with async_session() as session:
-                statement = select(User).order_by(User.created_at.desc()).limit(n)
+            async with read_session() as session:
+                statement = select(User).order_by(User.created_at.desc(), User.id.desc()).limit(n)
                 result = await session.execute(statement)
-                return result.scalars().all()
+                users = result.scalars().all()
+                await query_cache.set(RECENT_USERS, n, users, settings.CACHE_TTL_RECENT_USERS)
+                return users
         except SQLAlchemyError as e:
             logger.error(f"User repository error in get_most_recent: {e}")
             raise DatabaseError("SQLAlchemyError fetching most recent users.")
         except Exception as e:
-            raise DatabaseError("Error fetching most recent users.")
\ No newline at end of file
+            raise DatabaseError("Error fetching most recent users.")
+
+    @staticmethod
+    async def get_most_recent_rows(n: int) -> List[dict]:
+        """
+        Like get_most_recent, but the users are plain dicts (the fields of the User API model) built from the row tuples.
+        """
+        cached = await query_cache.get(RECENT_USER_ROWS, n)
+        if cached is not None:
+            return cached
+        try:
+            async with read_session() as session:
+                statement = select(*USER_COLUMNS).order_by(User.created_at.desc(), User.id.desc()).limit(n)
+                rows = (await session.execute(statement)).all()
+            users = [dict(zip(USER_FIELDS, row)) for row in rows]
+            await query_cache.set(RECENT_USER_ROWS, n, users, settings.CACHE_TTL_RECENT_USERS)
+            return users
+        except SQLAlchemyError as e:
+            logger.error(f"User repository error in get_most_recent_rows: {e}")
+            raise DatabaseError("SQLAlchemyError fetching most recent user rows.")
+        except Exception as e:
+            logger.error(f"An unexpected user repository error occurred: {e}")
+            raise DatabaseError("Error fetching most recent user rows.")
+
+
+class ProjectSync:
+    """
+    Writes the difference between the stored projects of a user and freshly fetched pages, in the transaction
+    opened by UserRepository.refresh_projects.
+    - a fetched repository is matched to a stored project by GitHub repo id, or by name for the projects stored
+      without one (they get their id)
+    - unchanged projects are not written, new and changed ones are upserted page by page (one
+      INSERT ... ON CONFLICT (github_id) DO UPDATE), finish() deletes the projects that weren't fetched
+    - only when complete is set: a fetch that may have missed pages keeps the projects it didn't see
+    - a repository stored under another user moves to this one (see ProjectRepository.take_over)
+    - projects holds every current project of the user, written the ones inserted or updated
+    """
+
+    def __init__(self, session: AsyncSession, user: User, stored: List[Project]):
+        self.session = session
+        self.user = user
+        self.stored = stored
+        self._by_github_id = {p.github_id: p for p in stored if p.github_id is not None}
+        self._by_name = {p.name: p for p in stored}
+        self._matched = set() # ids of the stored projects fetched again
+        self._fetched = set() # github ids (or names) of the new repositories, a repository can show up on two pages
+        self.projects: List[Project] = []
+        self.written: List[Project] = []
+        self.unchanged = 0
+        self.deleted = 0
+        self.kept = 0 # stored projects not fetched, kept by an incomplete fetch
+        self.complete = False # every repository of the user was fetched (see PageValidators.complete)
+        self.ranked = False # the user had leaderboard entries, removed by finish()
+        self.moved_from = {} # users the projects were moved from (see ProjectRepository.take_over)
+
+    @staticmethod
+    async def start(session: AsyncSession, user: User) -> "ProjectSync":
+        result = await session.execute(select(Project).where(Project.user_id == user.id))
+        return ProjectSync(session, user, list(result.scalars().all()))
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.written) or self.deleted > 0
+
+    def _match(self, row: dict) -> Optional[Project]:
+        if row["github_id"] is not None:
+            stored = self._by_github_id.get(row["github_id"])
+            if stored is not None:
+                return stored
+            # stored before the GitHub repo id was kept
+            stored = self._by_name.get(row["name"])
+            return stored if stored is not None and stored.github_id is None else None
+        return self._by_name.get(row["name"])
+
+    async def add(self, projects_data: List[dict]):
+        upserts, updates = [], []
+        for data in projects_data:
+            row = ProjectRepository.to_row(self.user.id, data)
+            stored = self._match(row)
+            if stored is None:
+                key = row["github_id"] if row["github_id"] is not None else row["name"]
+                if key not in self._fetched:
+                    self._fetched.add(key)
+                    upserts.append(row)
+                continue
+            if stored.id in self._matched:
+                continue
+            self._matched.add(stored.id)
+            if all(getattr(stored, field) == value for field, value in row.items()):
+                self.projects.append(stored)
+                self.unchanged += 1
+            elif stored.github_id is not None:
+                upserts.append(row)
+            else:
+                updates.append({"id": stored.id, **row})
+        try:
+            self.moved_from.update(await ProjectRepository.take_over(
+                self.session,
+                self.user.id,
+                [row["github_id"] for row in upserts if row["github_id"] is not None],
+                [row["github_id"] for row in updates if row["github_id"] is not None],
+            ))
+            written = await ProjectRepository.upsert_rows(self.session, upserts)
+            written += await ProjectRepository.update_rows(self.session, updates)
+        except SQLAlchemyError as e:
+            logger.error(f"User repository error in ProjectSync.add: {e}")
+            raise DatabaseError("SQLAlchemyError syncing projects.")
+        self.projects.extend(written)
+        self.written.extend(written)
+
+    async def finish(self):
+        """
+        Delete the stored projects that weren't fetched (complete fetch only), and the user's leaderboard entries
+        if anything changed.
+        """
+        unfetched = [p for p in self.stored if p.id not in self._matched]
+        if not self.complete:
+            # missing from a short fetch doesn't mean deleted on GitHub
+            self.projects.extend(unfetched)
+            self.kept = len(unfetched)
+            unfetched = []
+        gone = [p.id for p in unfetched]
+        if self.written or gone:
+            self.ranked = await leaderboard.remove_user(self.session, self.user.id)
+        await ProjectRepository.delete_by_ids(self.session, gone)
+        self.deleted = len(gone)
+
+
+class ProjectWriter:
+    """
+    Adds projects to the transaction opened by UserRepository.create_with_projects.
+    """
+
+    def __init__(self, session: Optional[AsyncSession], user: User, projects: Optional[List[Project]] = None):
+        self.session = session
+        self.user = user
+        self.projects: List[Project] = projects if projects is not None else []
+        self.existing = session is None # the user was already stored, nothing is written
+        self.moved_from = {} # users the projects were moved from (see ProjectRepository.take_over)
+        self._github_ids = set()
+
+    @staticmethod
+    async def for_existing_user(username: str) -> "ProjectWriter":
+        projects = await ProjectRepository.get_by_username(username)
+        if projects is None:
+            # if for some reason the user still doesn't exist, re-raise the error
+            logger.error(f"IntegrityError occurred, but user '{username}' not found after re-fetching.")
+            raise DatabaseError("User already exists.")
+        return ProjectWriter(None, User(username=username), projects)
+
+    async def add(self, projects_data: List[dict]):
+        if self.existing or not projects_data:
+            return
+        # a repository can show up on two pages if the list changed while it was fetched
+        projects_data = [data for data in projects_data if data.get('id') is None or data['id'] not in self._github_ids]
+        self._github_ids.update(data['id'] for data in projects_data if data.get('id') is not None)
+        try:
+            projects, owners = await ProjectRepository.insert_projects(self.session, self.user.id, projects_data)
+            self.projects.extend(projects)
+            self.moved_from.update(owners)
+        except SQLAlchemyError as e:
+            logger.error(f"User repository error in ProjectWriter.add: {e}")
+            raise DatabaseError("SQLAlchemyError creating projects.")
@@ -4,9 +4,17 @@
 
 import logging
 from app.core.logging_config import *
+import asyncio
 import httpx
+import random
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, Iterable, List, Optional
 from app.core.config import settings
-from app.core.exceptions import NotFoundError, ExternalAPIError
+from app.core.exceptions import NotFoundError, ExternalAPIError, NotModifiedError, RateLimitError
+from app.external_services.token_pool import TokenPool, is_rate_limited
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.metrics import GITHUB_REQUEST_DURATION, observe_since
 
 
 # GET https://api.github.com/users/{username}/repos
@@ -18,36 +26,310 @@ Unauthenticated Rate Limit:
 The primary rate limit for unauthenticated requests is 60 requests per hour.
 
 Authenticated Rate Limit:
-5000 requests per hour
+5000 requests per hour (per token, see token_pool.py)
 """
 
 
 logger = logging.getLogger(__name__)
 
+# transient GitHub errors, worth another attempt
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Build the pooled httpx client used to talk to GitHub.
+    - The app lifespan (app/main.py) creates one of these at startup and shares it across requests,
+      so connections (and their TCP+TLS handshakes) are reused instead of being set up per scrape.
+    """
+    http2 = settings.GITHUB_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("GITHUB_HTTP2 is enabled but the 'h2' package is not installed. Falling back to HTTP/1.1.")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings.GITHUB_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.GITHUB_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.GITHUB_HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        connect=settings.GITHUB_HTTP_CONNECT_TIMEOUT,
+        read=settings.GITHUB_HTTP_READ_TIMEOUT,
+        write=settings.GITHUB_HTTP_WRITE_TIMEOUT,
+        pool=settings.GITHUB_HTTP_POOL_TIMEOUT,
+    )
+    headers = {
+        "Accept": "application/vnd.github+json",
+    } # we need json response
+    # the Authorization header is set per request, with the token picked by the TokenPool
+    return httpx.AsyncClient(
+        base_url=settings.GITHUB_API_BASE_URL,
+        headers=headers,
+        limits=limits,
+        timeout=timeout,
+        http2=http2,
+    )
+
+
+# the fallback of use_graphql() is logged once per process (at startup, by the client created by the app lifespan),
+# not by every scrape asking which fetcher to use
+_graphql_fallback_logged = False
+
+
+def use_graphql() -> bool:
+    """
+    GITHUB_FETCHER="graphql" and a token to use it with, the GraphQL API doesn't accept unauthenticated requests.
+    """
+    global _graphql_fallback_logged
+    if settings.GITHUB_FETCHER != "graphql":
+        return False
+    if not settings.GITHUB_API_TOKENS.strip():
+        if not _graphql_fallback_logged:
+            _graphql_fallback_logged = True
+            logger.warning("GITHUB_FETCHER is 'graphql' but GITHUB_API_TOKENS is empty. Falling back to the REST API.")
+        return False
+    return True
+
+
+def create_github_client(client: Optional[httpx.AsyncClient] = None, tokens: Optional["TokenPool"] = None) -> "GitHubAPIClient":
+    """
+    The GitHub client selected by GITHUB_FETCHER, see GitHubAPIClient for the arguments.
+    """
+    if use_graphql():
+        from app.external_services.github_graphql import GitHubGraphQLClient
+        return GitHubGraphQLClient(client=client, tokens=tokens)
+    return GitHubAPIClient(client=client, tokens=tokens)
+
+
+def create_circuit_breaker() -> CircuitBreaker:
+    return CircuitBreaker(
+        "GitHub API",
+        failure_threshold=settings.GITHUB_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=settings.GITHUB_BREAKER_RESET_TIMEOUT,
+    )
+
+
+# the fields of a GitHub repository that are stored (see ProjectRepository.to_row)
+STORED_FIELDS = ("id", "name", "description", "stargazers_count", "forks_count")
+
+
+def stored_fields(page: List[dict]) -> List[dict]:
+    """
+    A page of repositories without the rest of the GitHub payload (owner, urls, ...).
+    """
+    return [{field: repository[field] for field in STORED_FIELDS if field in repository} for repository in page]
+
+
+class PageValidators:
+    """
+    The ETag and Last-Modified headers of every page of a user's repositories (page 1 first), stored with the user
+    (User.github_validators) so that a refetch can use conditional requests.
+    - a 304 Not Modified response is not counted against the GitHub rate limit
+    - the size (repositories) of every page tells a short last page from a full one, after which more pages may
+      have been added
+    - complete: set once every page of the user was fetched, ending with a short page (the repositories missing
+      from such a fetch were deleted on GitHub)
+    """
+
+    def __init__(self, pages: Optional[List[dict]] = None):
+        self.pages: List[dict] = [dict(page) for page in pages or []]
+        self.complete = False
+
+    def __bool__(self) -> bool:
+        return bool(self.pages)
+
+    def headers(self, page: int) -> Dict[str, str]:
+        if page > len(self.pages):
+            return {}
+        headers = {}
+        if self.pages[page - 1].get("etag"):
+            headers["If-None-Match"] = self.pages[page - 1]["etag"]
+        if self.pages[page - 1].get("last_modified"):
+            headers["If-Modified-Since"] = self.pages[page - 1]["last_modified"]
+        return headers
+
+    def full(self, page: int) -> bool:
+        """
+        The stored page held GITHUB_PER_PAGE repositories (or its size was not stored).
+        """
+        if page < 1 or page > len(self.pages):
+            return False
+        return self.pages[page - 1].get("size", settings.GITHUB_PER_PAGE) >= settings.GITHUB_PER_PAGE
+
+    def update(self, page: int, response: httpx.Response, size: int):
+        while len(self.pages) < page:
+            self.pages.append({})
+        self.pages[page - 1] = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "size": size,
+        }
+
+    def truncate(self, last_page: int):
+        del self.pages[last_page:]
+
+    def to_json(self) -> List[dict]:
+        return [dict(page) for page in self.pages]
+
 
 class GitHubAPIClient:
 
-    def __init__(self):
-        self.base_url = "https://api.github.com"
-        self.headers = {
-            "Accept": "application/vnd.github+json",
-        } # we need json response
-        # if settings.GITHUB_API_TOKEN: # if there is any token specified
-        #     self.headers["Authorization"] = f"token {settings.GITHUB_API_TOKEN}"
-        self.client = httpx.AsyncClient(headers=self.headers, base_url=self.base_url)
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, tokens: Optional[TokenPool] = None, breaker: Optional[CircuitBreaker] = None):
+        """
+        - client: a shared httpx client (see create_http_client). If not given, the GitHubAPIClient
+          creates and owns its own client, which is closed by close().
+        - tokens: the GitHub tokens and what is left of their rate limits, a pool of the configured tokens if not given
+        - breaker: the circuit breaker of the GitHub API, see create_circuit_breaker
+        """
+        self._owns_client = client is None
+        self.client = client if client is not None else create_http_client()
+        self.tokens = tokens if tokens is not None else TokenPool()
+        self.breaker = breaker if breaker is not None else create_circuit_breaker()
 
-    async def fetch_user_projects(self, username: str):
+    async def fetch_user_projects(self, username: str) -> List[dict]:
         """
         Fetches public (Private ?) repositories for the specified GitHub username.
+        - collects every page in memory, use iter_user_project_pages to process the pages as they arrive
+        """
+        projects_data = []
+        async with aclosing(self.iter_user_project_pages(username)) as pages:
+            async for page in pages:
+                projects_data.extend(page)
+        return projects_data
+
+    async def iter_user_project_pages(self, username: str, validators: Optional[PageValidators] = None) -> AsyncIterator[List[dict]]:
+        """
+        Yields the repositories of the specified GitHub username one page (up to GITHUB_PER_PAGE repos) at a time.
+        1. the first page is always fetched (and yielded, even if empty) first, so a missing user raises NotFoundError
+           before anything is yielded
+        2. the Link rel="last" header of the first response gives the page count, the remaining pages are then
+           fetched concurrently with at most GITHUB_PAGE_FANOUT requests in flight
+        3. the remaining pages are yielded in completion order, not page order
+        4. validators, if given, is updated with the ETag/Last-Modified of every page, and marked complete when the
+           last page is short (a full one may have been followed by new pages since the page count was read). If it
+           holds the ones of a previous fetch, every page is requested conditionally instead, see _iter_changed_pages
         """
         url = f"/users/{username}/repos"
+        if validators:
+            async with aclosing(self._iter_changed_pages(username, url, validators)) as pages:
+                async for page in pages:
+                    yield page
+            return
+
+        logger.info(f"Fetching projects for user '{username}' from GitHub API.")
+        response = await self._fetch_page(username, url, 1)
+        last_page = self._last_page(response)
+        items = response.json()
+        if validators is not None:
+            validators.update(1, response, len(items))
+            validators.truncate(last_page)
+        yield items
+
+        fanout = max(1, settings.GITHUB_PAGE_FANOUT)
+        next_page = 2
+        pending = set()
+        try:
+            while next_page <= last_page or pending:
+                # only start a new request when a slot is free, so a slow consumer also bounds memory
+                while next_page <= last_page and len(pending) < fanout:
+                    pending.add(asyncio.create_task(self._fetch_page(username, url, next_page)))
+                    next_page += 1
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    response = task.result()
+                    items = response.json()
+                    if validators is not None:
+                        validators.update(int(response.request.url.params["page"]), response, len(items))
+                    yield items
+        finally:
+            # the consumer stopped early or a page failed, don't leave requests running
+            for task in pending:
+                task.cancel()
+        if validators is not None:
+            validators.complete = not validators.full(last_page)
+
+    async def _iter_changed_pages(self, username: str, url: str, validators: PageValidators) -> AsyncIterator[List[dict]]:
+        """
+        Refetch with conditional requests (If-None-Match / If-Modified-Since) for every page.
+        - if every page is 304 Not Modified, NotModifiedError is raised before anything is yielded
+        - otherwise every page is yielded in page order, the unchanged pages are requested again without validators
+          since their repositories are not stored per page
+        - the page count is the one of the Link header of page 1, or the stored one when page 1 is 304 Not Modified
+          without it; a full last page is followed by the next pages until a short one, so the repositories added
+          since the previous fetch are never left out (the fetch ends complete)
+        """
+        logger.info(f"Refetching projects for user '{username}' from GitHub API with conditional requests.")
+        stored_pages = len(validators.pages)
+        first = await self._fetch_page(username, url, 1, validators.headers(1))
+        if first.status_code == 304 and not first.links:
+            last_page = stored_pages
+        else:
+            last_page = self._last_page(first)
+        responses = {1: first}
+        responses.update(await self._fetch_pages(username, url, range(2, last_page + 1), validators))
+
+        if last_page == stored_pages and all(r.status_code == 304 for r in responses.values()):
+            if not validators.full(last_page):
+                raise NotModifiedError(f"Projects of user '{username}' not modified.")
+            # the repositories added after a full last page only show on the next page
+            probe = await self._fetch_page(username, url, last_page + 1)
+            if not probe.json():
+                raise NotModifiedError(f"Projects of user '{username}' not modified.")
+            responses[last_page + 1] = probe
+
+        page = 0
+        while True:
+            page += 1
+            response = responses.pop(page, None)
+            if response is None or response.status_code == 304:
+                response = await self._fetch_page(username, url, page)
+            items = response.json()
+            validators.update(page, response, len(items))
+            yield items
+            if page >= last_page and len(items) < settings.GITHUB_PER_PAGE:
+                break
+        validators.truncate(page)
+        validators.complete = True
+
+    async def _fetch_pages(self, username: str, url: str, pages: Iterable[int], validators: PageValidators) -> Dict[int, httpx.Response]:
+        """
+        Fetch the given pages conditionally, at most GITHUB_PAGE_FANOUT at a time.
+        """
+        semaphore = asyncio.Semaphore(max(1, settings.GITHUB_PAGE_FANOUT))
+
+        async def fetch(page: int):
+            async with semaphore:
+                return page, await self._fetch_page(username, url, page, validators.headers(page))
+
+        tasks = [asyncio.create_task(fetch(page)) for page in pages]
         try:
-            logger.info(f"Fetching projects for user '{username}' from GitHub API.")
-            response = await self.client.get(url)
+            return dict(await asyncio.gather(*tasks))
+        finally:
+            # a page failed, don't leave requests running
+            for task in tasks:
+                task.cancel()
+
+    async def _fetch_page(self, username: str, url: str, page: int, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        - returns 304 Not Modified responses (conditional requests) as they are
+        - see _request for the retries and the circuit breaker
+        """
+        params = {"per_page": settings.GITHUB_PER_PAGE, "page": page}
+        try:
+            response = await self._request("GET", url, headers or {}, params=params)
+            if response.status_code == 304:
+                return response
             # raise an exception if the response status code is not 200
             response.raise_for_status()
-            projects_data = response.json()
-            return projects_data
+            return response
         except httpx.HTTPStatusError as e:
             status_code = e.response.status_code
             if status_code == 404:
@@ -57,10 +339,85 @@ class GitHubAPIClient:
             else:
                 logger.error(f"HTTP error occurred: {e}. Status code: {status_code}")
                 raise ExternalAPIError("Error fetching projects from GitHub.")
+        except ExternalAPIError:
+            # RateLimitError, CircuitOpenError
+            raise
         except Exception as e:
             logger.exception(f"An unexpected error occurred: {e}")
             raise ExternalAPIError("Error fetching projects from GitHub.")
 
+    async def _request(self, method: str, url: str, headers: Dict[str, str], **kwargs) -> httpx.Response:
+        """
+        A request with retries, behind the circuit breaker (only reads are sent to GitHub, they are safe to repeat).
+        - timeouts, connection errors and 5xx responses are retried up to GITHUB_RETRY_ATTEMPTS times, with
+          decorrelated jitter between the attempts; the last 5xx response is returned, the last error is raised
+        - a request that still fails counts as one failure for the circuit breaker; while the circuit is open
+          CircuitOpenError is raised without calling GitHub, and the half-open probe gets a single attempt
+        """
+        probe = self.breaker.acquire()
+        attempts = 1 if probe else max(1, settings.GITHUB_RETRY_ATTEMPTS)
+        delay = settings.GITHUB_RETRY_BASE_DELAY
+        try:
+            for attempt in range(1, attempts + 1):
+                try:
+                    response = await self._send(method, url, headers, **kwargs)
+                    if response.status_code not in RETRY_STATUS_CODES:
+                        self.breaker.success()
+                        return response
+                    error = None
+                    logger.warning(f"GitHub answered {response.status_code} (attempt {attempt}/{attempts}).")
+                except httpx.TransportError as e:
+                    error = e
+                    logger.warning(f"GitHub request failed: {e!r} (attempt {attempt}/{attempts}).")
+                if attempt < attempts:
+                    delay = min(settings.GITHUB_RETRY_MAX_DELAY, random.uniform(settings.GITHUB_RETRY_BASE_DELAY, delay * 3))
+                    await asyncio.sleep(delay)
+            self.breaker.failure()
+            if error is not None:
+                raise error
+            return response
+        finally:
+            # the probe was cancelled or hit the rate limit
+            if probe:
+                self.breaker.release()
+
+    async def _send(self, method: str, url: str, headers: Dict[str, str], **kwargs) -> httpx.Response:
+        """
+        A request that hits a rate limit is sent again with the next token that has quota, RateLimitError
+        if there is none within GITHUB_RATE_LIMIT_MAX_WAIT.
+        - every request sent is timed in github_request_duration_seconds, by status code ("error" without response)
+        """
+        for _ in range(len(self.tokens.budgets) + 1):
+            async with self.tokens.acquire() as budget:
+                start = time.perf_counter()
+                try:
+                    response = await self.client.request(method, url, headers={**headers, **budget.headers()}, **kwargs)
+                except httpx.TransportError:
+                    observe_since(GITHUB_REQUEST_DURATION, start, method, "error")
+                    raise
+                observe_since(GITHUB_REQUEST_DURATION, start, method, str(response.status_code))
+                budget.update(response)
+            if not is_rate_limited(response):
+                return response
+            logger.warning(f"GitHub rate limit hit with token {budget.name}. Status code: {response.status_code}")
+        raise RateLimitError("GitHub rate limit exhausted.")
+
+    @staticmethod
+    def _last_page(response: httpx.Response) -> int:
+        """
+        Page count from the Link header, a single page of results has no rel="last" link.
+        """
+        last = response.links.get("last")
+        if not last:
+            return 1
+        try:
+            return int(httpx.URL(last["url"]).params.get("page", 1))
+        except (KeyError, ValueError):
+            logger.warning(f"Unexpected Link header from GitHub: {response.headers.get('link')}")
+            return 1
+
     async def close(self):
-        await self.client.aclose()
+        # a shared client belongs to whoever created it (the app lifespan)
+        if self._owns_client:
+            await self.client.aclose()
 
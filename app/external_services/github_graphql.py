@@ -0,0 +1,165 @@
+# app/external_services/github_graphql.py
+# Fetch the repositories of many users with the GitHub GraphQL API, instead of one REST call per user and page.
+# - the page requests of concurrent scrapes (eg. POST /users/batch) are collected for GITHUB_GRAPHQL_BATCH_WINDOW
+#   seconds and sent as one query, every user being an alias with its own cursor:
+#       u0: repositoryOwner(login: $login0) { repositories(first: $first, after: $after0, ...) { ... } }
+# - a user with more than GITHUB_PER_PAGE repositories asks again with the endCursor of its last page,
+#   batched with the other requests of that moment
+# - the repositories are mapped to the dicts of the REST API (see to_project_data), so they are stored by
+#   ProjectRepository.create_projects / insert_projects unchanged
+# - selected with GITHUB_FETCHER="graphql", the GraphQL API needs a token (GITHUB_API_TOKENS)
+
+
+import asyncio
+import logging
+from app.core.logging_config import *
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import httpx
+from app.core.config import settings
+from app.core.exceptions import NotFoundError, ExternalAPIError
+from app.external_services.github_api import GitHubAPIClient, PageValidators
+
+
+logger = logging.getLogger(__name__)
+
+
+REPOSITORIES = (
+    "repositories(first: $first, after: $after{i}, ownerAffiliations: OWNER, privacy: PUBLIC, "
+    "orderBy: {{field: NAME, direction: ASC}}) "
+    "{{ nodes {{ databaseId name description stargazerCount forkCount }} pageInfo {{ hasNextPage endCursor }} }}"
+)
+
+
+def build_query(count: int) -> str:
+    """
+    A query for count users, aliased u0, u1, ... with the variables $login<i> and $after<i> (the cursor, null for the first page).
+    """
+    variables = ", ".join(f"$login{i}: String!, $after{i}: String" for i in range(count))
+    aliases = "\n".join(
+        f"  u{i}: repositoryOwner(login: $login{i}) {{ {REPOSITORIES.format(i=i)} }}" for i in range(count)
+    )
+    return f"query($first: Int!, {variables}) {{\n{aliases}\n}}"
+
+
+def to_project_data(node: dict) -> dict:
+    """
+    A GraphQL repository as the REST API returns it.
+    """
+    return {
+        "id": node["databaseId"],
+        "name": node["name"],
+        "description": node["description"],
+        "stargazers_count": node["stargazerCount"],
+        "forks_count": node["forkCount"],
+    }
+
+
+class GitHubGraphQLClient(GitHubAPIClient):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (username, cursor, future) waiting for the next query
+        self._queue: List[Tuple[str, Optional[str], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._running = set() # queries in flight, referenced until they are done
+
+    async def iter_user_project_pages(self, username: str, validators: Optional[PageValidators] = None) -> AsyncIterator[List[dict]]:
+        """
+        Yields the repositories of the specified GitHub username one page at a time, in page order.
+        - like the REST client, the first page is always yielded (even if empty) and a missing user raises
+          NotFoundError before anything is yielded
+        - GraphQL has no conditional requests: validators is emptied, so refreshes always store the projects again,
+          and marked complete after the last page
+        """
+        if validators is not None:
+            validators.truncate(0)
+        cursor = None
+        while True:
+            repositories = await self._load(username, cursor)
+            if repositories is None:
+                logger.warning(f"GitHub user '{username}' not found.")
+                raise NotFoundError(f"User '{username}' not found on Github.")
+            yield [to_project_data(node) for node in repositories["nodes"]]
+            if not repositories["pageInfo"]["hasNextPage"]:
+                if validators is not None:
+                    validators.complete = True
+                return
+            cursor = repositories["pageInfo"]["endCursor"]
+
+    async def _load(self, username: str, cursor: Optional[str]) -> Optional[dict]:
+        """
+        One page of a user's repositories (None if the user doesn't exist), fetched with the other pages requested meanwhile.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((username, cursor, future))
+        if len(self._queue) >= settings.GITHUB_GRAPHQL_USERS_PER_QUERY:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(settings.GITHUB_GRAPHQL_BATCH_WINDOW, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        size = max(1, settings.GITHUB_GRAPHQL_USERS_PER_QUERY)
+        while self._queue:
+            batch, self._queue = self._queue[:size], self._queue[size:]
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[str, Optional[str], asyncio.Future]]):
+        try:
+            data, errors = await self._query([(username, cursor) for username, cursor, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for i, (username, _, future) in enumerate(batch):
+            if future.done():
+                continue # the scrape was cancelled
+            owner = data.get(f"u{i}")
+            if owner is not None:
+                future.set_result(owner["repositories"])
+            elif errors.get(f"u{i}") == "NOT_FOUND":
+                future.set_result(None)
+            else:
+                logger.error(f"GitHub GraphQL error for user '{username}': {errors.get(f'u{i}')}")
+                future.set_exception(ExternalAPIError("Error fetching projects from GitHub."))
+
+    async def _query(self, pages: List[Tuple[str, Optional[str]]]) -> Tuple[dict, Dict[str, str]]:
+        """
+        Send one query for the given (username, cursor) pages.
+        Returns the data by alias, and the error type by alias (eg. NOT_FOUND for a missing user).
+        """
+        variables = {"first": settings.GITHUB_PER_PAGE}
+        for i, (username, cursor) in enumerate(pages):
+            variables[f"login{i}"] = username
+            variables[f"after{i}"] = cursor
+        logger.info(f"Fetching {len(pages)} pages of projects from GitHub GraphQL API.")
+        try:
+            response = await self._request("POST", "/graphql", {}, json={"query": build_query(len(pages)), "variables": variables})
+            response.raise_for_status()
+            payload = response.json()
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error occurred: {e}. Status code: {e.response.status_code}")
+            raise ExternalAPIError("Error fetching projects from GitHub.")
+        except ExternalAPIError:
+            # RateLimitError, CircuitOpenError
+            raise
+        except Exception as e:
+            logger.exception(f"An unexpected error occurred: {e}")
+            raise ExternalAPIError("Error fetching projects from GitHub.")
+
+        errors = {
+            str(error["path"][0]): error.get("type")
+            for error in payload.get("errors") or []
+            if error.get("path")
+        }
+        if payload.get("data") is None:
+            logger.error(f"GitHub GraphQL query failed: {payload.get('errors')}")
+            raise ExternalAPIError("Error fetching projects from GitHub.")
+        return payload["data"], errors
@@ -0,0 +1,164 @@
+# app/external_services/token_pool.py
+# Spread the GitHub requests over the configured tokens, and slow down before GitHub starts answering 403.
+# - every token has its own hourly rate limit, tracked from the X-RateLimit-* headers of its responses
+# - each request takes the token with the most requests left, GITHUB_RATE_LIMIT_RESERVE of every token stays unused
+# - when no token has requests left, the request waits for the earliest reset (at most GITHUB_RATE_LIMIT_MAX_WAIT),
+#   otherwise it fails with RateLimitError without calling GitHub
+# - a secondary rate limit (403/429 with Retry-After) blocks the token for that long
+
+
+import asyncio
+import logging
+import time
+from app.core.logging_config import *
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+import httpx
+from app.core.config import settings
+from app.core.exceptions import RateLimitError
+
+
+logger = logging.getLogger(__name__)
+
+# hourly limits until GitHub tells us otherwise
+AUTHENTICATED_LIMIT = 5000
+UNAUTHENTICATED_LIMIT = 60
+# GitHub asks to wait at least a minute after a secondary rate limit without Retry-After
+SECONDARY_LIMIT_WAIT = 60.0
+
+
+def is_rate_limited(response: httpx.Response) -> bool:
+    """
+    A 403 is also used for forbidden resources, only the rate limit ones say so in their headers or message.
+    """
+    if response.status_code == 429:
+        return True
+    if response.status_code != 403:
+        return False
+    return (
+        response.headers.get("x-ratelimit-remaining") == "0"
+        or "retry-after" in response.headers
+        or "rate limit" in response.text.lower()
+    )
+
+
+class TokenBudget:
+    """
+    What is left of the rate limit of one token (None for unauthenticated requests).
+    - times are epoch seconds, like X-RateLimit-Reset
+    """
+
+    def __init__(self, token: Optional[str], reserve: float):
+        self.token = token
+        self.reserve = reserve
+        self.limit = AUTHENTICATED_LIMIT if token else UNAUTHENTICATED_LIMIT
+        self.remaining = self.limit
+        self.reset_at = 0.0 # unknown until the first response
+        self.blocked_until = 0.0
+        self.in_flight = 0 # sent but not answered yet, not counted in remaining
+
+    @property
+    def name(self) -> str:
+        # never log or expose a whole token
+        return f"{self.token[:4]}...{self.token[-4:]}" if self.token else "unauthenticated"
+
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+    def headroom(self, now: float) -> int:
+        """
+        Requests that can still be sent with this token before reaching its reserve.
+        """
+        if now < self.blocked_until:
+            return 0
+        # past the reset, the whole limit is back even if no response told us yet
+        remaining = self.limit if self.reset_at and now >= self.reset_at else self.remaining
+        return remaining - self.in_flight - int(self.limit * self.reserve)
+
+    def available_at(self, now: float) -> float:
+        """
+        When the token has requests left again.
+        """
+        if now < self.blocked_until:
+            return self.blocked_until
+        return max(now, self.reset_at)
+
+    def update(self, response: httpx.Response):
+        headers = response.headers
+        try:
+            if "x-ratelimit-limit" in headers:
+                self.limit = int(headers["x-ratelimit-limit"])
+            if "x-ratelimit-remaining" in headers:
+                remaining = int(headers["x-ratelimit-remaining"])
+                if self.remaining > int(self.limit * self.reserve) >= remaining:
+                    logger.warning(f"GitHub token {self.name} is down to {remaining}/{self.limit} requests, holding it back until the reset.")
+                self.remaining = remaining
+            if "x-ratelimit-reset" in headers:
+                self.reset_at = float(headers["x-ratelimit-reset"])
+        except ValueError:
+            logger.warning(f"Unexpected rate limit headers from GitHub: {dict(headers)}")
+
+        if is_rate_limited(response) and headers.get("x-ratelimit-remaining") != "0":
+            # secondary rate limit, the primary one is handled by remaining and reset_at
+            try:
+                wait = float(headers.get("retry-after", SECONDARY_LIMIT_WAIT))
+            except ValueError:
+                wait = SECONDARY_LIMIT_WAIT
+            self.blocked_until = time.time() + wait
+            logger.warning(f"GitHub secondary rate limit hit with token {self.name}, blocked for {wait} seconds.")
+
+    def stats(self) -> dict:
+        return {
+            "token": self.name,
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "reset_at": self.reset_at,
+            "blocked_until": self.blocked_until,
+            "in_flight": self.in_flight,
+        }
+
+
+class TokenPool:
+
+    def __init__(self, tokens: Optional[List[str]] = None, reserve: Optional[float] = None, max_wait: Optional[float] = None):
+        """
+        - tokens: defaults to GITHUB_API_TOKENS, no token means unauthenticated requests
+        """
+        if tokens is None:
+            tokens = [token.strip() for token in settings.GITHUB_API_TOKENS.split(",") if token.strip()]
+        reserve = settings.GITHUB_RATE_LIMIT_RESERVE if reserve is None else reserve
+        self.max_wait = settings.GITHUB_RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        self.budgets = [TokenBudget(token, reserve) for token in tokens] or [TokenBudget(None, reserve)]
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[TokenBudget]:
+        """
+        Pick a token for one request, call budget.update(response) with the response.
+        """
+        budget = await self._pick()
+        budget.in_flight += 1
+        try:
+            yield budget
+        finally:
+            budget.in_flight -= 1
+
+    async def _pick(self) -> TokenBudget:
+        deadline = time.time() + self.max_wait
+        while True:
+            now = time.time()
+            budget = max(self.budgets, key=lambda b: b.headroom(now))
+            if budget.headroom(now) > 0:
+                return budget
+            # throttle: wait for a token to get requests back rather than running into 403s
+            wake = min(b.available_at(now) for b in self.budgets)
+            if wake > deadline:
+                logger.error(f"Every GitHub token is out of quota for another {wake - now:.0f} seconds.")
+                raise RateLimitError("GitHub rate limit exhausted.")
+            logger.info(f"Every GitHub token is at its reserve, waiting {wake - now:.1f} seconds.")
+            await asyncio.sleep(max(wake - now, 0.1))
+
+    def stats(self) -> List[dict]:
+        """
+        Remaining quota of every token.
+        """
+        return [budget.stats() for budget in self.budgets]
@@ -2,17 +2,77 @@
 
 
 import logging
+import math
 from app.core.logging_config import *
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from app.api.routes import router as api_router
+from app.api.middleware import MetricsMiddleware
 from app.data_access.database import engine
+from app.data_access.migrations import upgrade_schema
+from app.data_access.leaderboard import leaderboard
 from sqlmodel import SQLModel
-from app.core.exceptions import NotFoundError, DatabaseError, ExternalAPIError
+from app.core.exceptions import NotFoundError, DatabaseError, ExternalAPIError, CircuitOpenError, InvalidCursorError
 from fastapi.responses import JSONResponse
-
-
-
-app = FastAPI(title = "Github Scraper API")
+from contextlib import asynccontextmanager
+from app.external_services.github_api import create_github_client, create_http_client
+from app.external_services.token_pool import TokenPool
+from app.services.user_service import Service
+from app.services.refresh_scheduler import RefreshScheduler
+from app.services.job_queue import JobQueue
+from app.core.config import settings
+from app.data_access.cache import query_cache, create_cache_backend, MemoryCacheBackend
+from app.core.metrics import CONTENT_TYPE, render, track_github_client
+
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup: create the tables, load the leaderboard, the configured cache backend and one pooled GitHub HTTP client shared by every request,
+    then start the background refresh of the stored users and the scrape job workers.
+    Shutdown: stop the job workers and the refreshes, close the client (and its keep-alive connections) and the cache backend.
+    """
+    await create_db_and_tables()
+    # rebuilds the materialized leaderboard if it doesn't match the projects table
+    await leaderboard.ensure_consistent()
+
+    cache_backend = create_cache_backend()
+    query_cache.use(cache_backend)
+
+    http_client = create_http_client()
+    app.state.github_client = create_github_client(client=http_client, tokens=TokenPool())
+    Service.github_client = app.state.github_client
+    # its token quotas and circuit breaker are exported by GET /metrics
+    track_github_client(app.state.github_client)
+
+    # refreshes the stored users in the background, with the shared client
+    refresh_scheduler = None
+    if settings.REFRESH_ENABLED:
+        refresh_scheduler = RefreshScheduler(Service.refresh_user)
+        Service.refresh_scheduler = refresh_scheduler
+        refresh_scheduler.start()
+
+    # scrapes of the cold misses answered with 202, the workers poll the job store once started
+    job_queue = JobQueue(Service.scrape_one, autostart=not settings.JOBS_ENABLED)
+    Service.job_queue = job_queue
+    if settings.JOBS_ENABLED:
+        job_queue.start()
+    try:
+        yield
+    finally:
+        Service.job_queue = None
+        await job_queue.stop()
+        if refresh_scheduler is not None:
+            Service.refresh_scheduler = None
+            await refresh_scheduler.stop()
+        Service.github_client = None
+        track_github_client(app.state.github_client, tracked=False)
+        await http_client.aclose()
+        query_cache.use(MemoryCacheBackend())
+        await cache_backend.close()
+
+
+app = FastAPI(title = "Github Scraper API", lifespan=lifespan)
 
 
 # THE EXCEPTION HANDLER CODE BELOW IS GENERATED BY CHATGPT
@@ -40,6 +100,22 @@ async def external_api_exception_handler(request: Request, exc: ExternalAPIError
         content={"detail": "External API error."}
     )
 
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_exception_handler(request: Request, exc: CircuitOpenError):
+    # GitHub was not called: the circuit is open, or half-open while a probe request finds out if GitHub is back
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "External API unavailable.", "circuit": exc.state},
+        headers={"Retry-After": str(math.ceil(exc.retry_after))}
+    )
+
+@app.exception_handler(InvalidCursorError)
+async def invalid_cursor_exception_handler(request: Request, exc: InvalidCursorError):
+    return JSONResponse(
+        status_code=400,
+        content={"detail": "Invalid cursor."}
+    )
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     logging.error(f"Unhandled exception: {exc}")
@@ -51,15 +127,21 @@ async def general_exception_handler(request: Request, exc: Exception):
 
 app.include_router(api_router)
 
+app.add_middleware(MetricsMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # the Prometheus text format of the metrics of this worker (see app/core/metrics.py)
+    return Response(content=render(), media_type=CONTENT_TYPE)
 
 
-@app.on_event("startup")
-async def on_startup():
-    await create_db_and_tables()
 
 async def create_db_and_tables():
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        # columns and indexes added since the tables were created
+        await conn.run_sync(upgrade_schema)
 
 
 # cannot directly call synchronous methods using an async engion
@@ -1,20 +1,98 @@
 # app/models.py
 
+import uuid
 from datetime import datetime
 from typing import Optional, List
+from typing_extensions import Annotated
+from pydantic import BaseModel, StringConstraints
+from sqlalchemy import BigInteger, Index, JSON, Column
 from sqlmodel import SQLModel, Field, Relationship
+from app.core.config import settings
 
 class Project(SQLModel, table=True):
+    __table_args__ = (
+        # most starred leaderboard: ORDER BY stars DESC, id DESC LIMIT n is a backward scan of this index
+        Index("ix_project_stars_id", "stars", "id"),
+        # keyset pages of a user's projects (see ProjectRepository.get_page), one per sort
+        Index("ix_project_user_id_stars_id", "user_id", "stars", "id"),
+        Index("ix_project_user_id_forks_id", "user_id", "forks", "id"),
+        Index("ix_project_user_id_name_id", "user_id", "name", "id"),
+        # the conflict target of the upserts of a refresh (see ProjectRepository.upsert_rows), NULLs don't conflict
+        Index("ix_project_github_id", "github_id", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True) # make sure it's autoincremented
     name: str
     description: Optional[str] = None
     stars: int = 0
     forks: int = 0
-    user_id: int = Field(foreign_key="user.id")
+    user_id: int = Field(foreign_key="user.id", index=True) # projects of a user
+    # GitHub's repository id (not part of the API), NULL for projects stored before it was kept
+    # 64 bits: the ids are nearing the INTEGER limit of PostgreSQL
+    github_id: Optional[int] = Field(default=None, sa_type=BigInteger, exclude=True)
     user: Optional["User"] = Relationship(back_populates="projects")
 
 class User(SQLModel, table=True):
+    __table_args__ = (
+        # most recent users: ORDER BY created_at DESC, id DESC LIMIT n
+        Index("ix_user_created_at_id", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str = Field(index=True, unique=True) # for faster lookups
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # when the projects were last fetched from GitHub, NULL for users stored before it was tracked
+    last_fetched_at: Optional[datetime] = Field(default_factory=datetime.utcnow, index=True)
+    # ETag / Last-Modified of every page of the user's GitHub repositories, for conditional refetches (not part of the API)
+    # (None is stored as SQL NULL, not the JSON 'null')
+    github_validators: Optional[List[dict]] = Field(default=None, sa_column=Column(JSON(none_as_null=True)), exclude=True)
     projects: List[Project] = Relationship(back_populates="user")
+
+class LeaderboardEntry(SQLModel, table=True):
+    """
+    Materialized most starred leaderboard: a copy of the top LEADERBOARD_SIZE projects,
+    kept up to date by every project write (see app/data_access/leaderboard.py).
+    """
+    __tablename__ = "leaderboard_entry"
+    __table_args__ = (
+        Index("ix_leaderboard_entry_stars_project_id", "stars", "project_id"),
+    )
+
+    project_id: int = Field(primary_key=True, foreign_key="project.id")
+    name: str
+    description: Optional[str] = None
+    stars: int = 0
+    forks: int = 0
+    user_id: int
+
+class ScrapeJob(SQLModel, table=True):
+    """
+    A scrape of a user's projects queued by a cold miss, run by the job workers (see app/services/job_queue.py).
+    - status: "queued", "running", then "done", "not_found" or "error" (with a detail)
+    - only the "database" job backend stores it, the "memory" backend keeps the instances
+    """
+    __tablename__ = "scrape_job"
+    __table_args__ = (
+        # next job to run: WHERE status = 'queued' ORDER BY created_at, and the finished jobs to prune
+        Index("ix_scrape_job_status_created_at", "status", "created_at"),
+    )
+
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex, primary_key=True)
+    username: str = Field(index=True) # the unfinished job of a user
+    status: str = "queued"
+    projects: Optional[int] = None # projects stored, once done
+    detail: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# GitHub usernames: alphanumeric characters or hyphens, at most 39 characters
+USERNAME_PATTERN = r"^[a-zA-Z0-9-]{1,39}$"
+
+class BatchScrapeRequest(BaseModel):
+    """
+    Body of POST /users/batch.
+    """
+    usernames: List[Annotated[str, StringConstraints(pattern=USERNAME_PATTERN)]] = Field(
+        min_length=1, max_length=settings.BATCH_MAX_USERNAMES
+    )
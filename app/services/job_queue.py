@@ -0,0 +1,104 @@
+# app/services/job_queue.py
+# Run the scrapes of cold misses in the background, so that the request doesn't wait for GitHub.
+# - a cold miss queues a job (answered with 202 and the job id), JOB_WORKERS workers of the app run the queued jobs
+#   and GET /jobs/{id} tells how far it is
+# - the jobs are kept in a pluggable store (see app/data_access/job_store.py): in memory, or in the database
+#   to be shared by every app worker
+# - without JOBS_ENABLED, only the requests sent with "Prefer: respond-async" queue jobs: the workers are started
+#   by the first one (autostart), until then the job store isn't polled
+# - a job interrupted by a shutdown stays "running": dropped with the memory store, run again by the database store
+#   after JOB_RUNNING_TIMEOUT_SECONDS
+
+
+import asyncio
+import logging
+import time
+from app.core.logging_config import *
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+from app.core.config import settings
+from app.data_access.job_store import JobStore, create_job_store
+from app.models import ScrapeJob
+
+
+logger = logging.getLogger(__name__)
+
+# how often the finished jobs older than JOB_RETENTION_SECONDS are dropped
+PRUNE_INTERVAL_SECONDS = 60.0
+
+
+class JobQueue:
+
+    def __init__(self, scrape: Callable[[str], Awaitable[dict]], store: Optional[JobStore] = None, autostart: bool = False):
+        """
+        - scrape: stores the projects of a user, returns {"status": "stored" | "scraped" | "not_found" | "error",
+          "projects", "detail"} (Service.scrape_one)
+        - store: where the jobs are kept, the one selected by JOB_BACKEND by default
+        - autostart: start the workers with the first submitted job instead of calling start()
+        """
+        self.scrape = scrape
+        self.store = store if store is not None else create_job_store()
+        self.autostart = autostart
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._pruned_at = time.monotonic()
+
+    async def submit(self, username: str) -> ScrapeJob:
+        """
+        Queue a scrape of the user, the job already queued or running for that user if any.
+        """
+        job = await self.store.submit(username)
+        if self.autostart and not self._workers:
+            self.start()
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[ScrapeJob]:
+        return await self.store.get(job_id)
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._work()) for _ in range(max(1, settings.JOB_WORKERS))]
+
+    async def stop(self):
+        self.autostart = False
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self.run_once():
+                    continue
+                await self._prune()
+            except Exception as e:
+                # keep the worker alive, the job store may be back on the next poll
+                logger.exception(f"Scrape job worker failed: {e}")
+            try:
+                # woken up by submit(), the poll finds the jobs queued by the other app workers
+                await asyncio.wait_for(self._wakeup.wait(), settings.JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> bool:
+        """
+        Run the next queued job, returns False if there was none.
+        """
+        job = await self.store.claim()
+        if job is None:
+            return False
+        logger.info(f"Running scrape job {job.id} of user '{job.username}'.")
+        result = await self.scrape(job.username)
+        status = "done" if result["status"] in ("stored", "scraped") else result["status"]
+        await self.store.finish(job, status, result.get("projects"), result.get("detail"))
+        return True
+
+    async def _prune(self):
+        if time.monotonic() - self._pruned_at < PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned_at = time.monotonic()
+        pruned = await self.store.prune(datetime.utcnow() - timedelta(seconds=settings.JOB_RETENTION_SECONDS))
+        if pruned:
+            logger.info(f"Dropped {pruned} finished scrape jobs.")
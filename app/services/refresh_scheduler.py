@@ -0,0 +1,140 @@
+# app/services/refresh_scheduler.py
+# Keep the stored users fresh in the background, so that reads never wait for GitHub.
+# - every REFRESH_INTERVAL_SECONDS the scheduler picks the users whose projects are older than
+#   REFRESH_STALE_AFTER_SECONDS, the most read ones first, and refreshes them one at a time
+# - the GitHub requests spent on refreshes are capped by REFRESH_REQUESTS_PER_HOUR, shared by the WEB_CONCURRENCY workers:
+#   every worker has its own budget of REFRESH_REQUESTS_PER_HOUR / WEB_CONCURRENCY
+# - with several workers, a user is claimed (last_fetched_at set) before it is refreshed, so only one worker does it
+
+
+import asyncio
+import logging
+import time
+from app.core.logging_config import *
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+from app.core.config import settings
+from app.core.exceptions import NotFoundError, DatabaseError, ExternalAPIError, CircuitOpenError
+from app.data_access.repositories.user_repository import UserRepository
+from app.models import Project, User
+
+
+logger = logging.getLogger(__name__)
+
+# the most read usernames looked up first in every run, and how many read counts are kept in memory
+HOT_USERNAMES = 500
+MAX_TRACKED_READS = 10000
+
+
+class RateBudget:
+    """
+    Token bucket of GitHub requests, refilled at per_hour requests per hour and holding at most an hour's worth.
+    - spend() may take it below zero (a user with more pages than expected), the debt is paid by the next refills
+    """
+
+    def __init__(self, per_hour: float):
+        self.per_hour = per_hour
+        self.tokens = per_hour
+        self._updated_at = time.monotonic()
+
+    def available(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.per_hour, self.tokens + (now - self._updated_at) * self.per_hour / 3600)
+        self._updated_at = now
+        return self.tokens
+
+    def spend(self, requests: int):
+        self.available()
+        self.tokens -= requests
+
+
+class RefreshScheduler:
+
+    def __init__(self, refresh: Callable[[User], Awaitable[List[Project]]]):
+        """
+        - refresh: fetches and stores the projects of a user again (Service.refresh_user)
+        """
+        self.refresh = refresh
+        self.reads: Counter = Counter() # reads per username since its last refresh
+        # the budget is kept in each worker, the workers spend the same GitHub quota
+        self.budget = RateBudget(settings.REFRESH_REQUESTS_PER_HOUR / max(1, settings.WEB_CONCURRENCY))
+        self._task: Optional[asyncio.Task] = None
+
+    def record_read(self, username: str):
+        self.reads[username] += 1
+        if len(self.reads) > MAX_TRACKED_READS:
+            # forget the least read half rather than growing without bound
+            self.reads = Counter(dict(self.reads.most_common(MAX_TRACKED_READS // 2)))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.REFRESH_INTERVAL_SECONDS)
+            try:
+                await self.run_once()
+            except Exception as e:
+                # keep the scheduler alive, the next run starts over
+                logger.exception(f"Background refresh failed: {e}")
+
+    async def run_once(self) -> int:
+        """
+        Refresh the due users while the budget lasts, returns the number of users refreshed.
+        """
+        before = datetime.utcnow() - timedelta(seconds=settings.REFRESH_STALE_AFTER_SECONDS)
+        refreshed = 0
+        for user in await self._due(before):
+            if self.budget.available() < 1:
+                logger.info("GitHub refresh budget spent, the remaining stale users wait for the next run.")
+                break
+            if not await UserRepository.claim_refresh(user, before):
+                continue # refreshed by another worker since it was read
+            try:
+                projects = await self.refresh(user)
+            except NotFoundError:
+                self.budget.spend(1)
+                logger.warning(f"User '{user.username}' not found on GitHub anymore, keeping the stored projects.")
+                continue
+            except CircuitOpenError:
+                logger.info("GitHub circuit is open, the stale users wait for the next run.")
+                break
+            except ExternalAPIError as e:
+                # most likely rate limited or GitHub is down, try again on the next run
+                self.budget.spend(1)
+                logger.error(f"External API error while refreshing user '{user.username}': {e}")
+                break
+            except DatabaseError as e:
+                logger.error(f"Database error while refreshing user '{user.username}': {e}")
+                continue
+            # one request per page, an empty first page included, 304 Not Modified responses are free
+            if projects is not None:
+                self.budget.spend(max(1, -(-len(projects) // settings.GITHUB_PER_PAGE)))
+            self.reads.pop(user.username, None)
+            refreshed += 1
+        return refreshed
+
+    async def _due(self, before: datetime) -> List[User]:
+        """
+        Up to REFRESH_BATCH_SIZE stale users: the stale ones among the most read first, then the least recently fetched.
+        """
+        limit = settings.REFRESH_BATCH_SIZE
+        hot = [username for username, _ in self.reads.most_common(HOT_USERNAMES)]
+        users = await UserRepository.get_stale(before, len(hot), usernames=hot) if hot else []
+        users = sorted(users, key=lambda user: self.reads[user.username], reverse=True)[:limit]
+        if len(users) < limit:
+            picked = {user.id for user in users}
+            oldest = await UserRepository.get_stale(before, limit)
+            users += [user for user in oldest if user.id not in picked][:limit - len(users)]
+        return users
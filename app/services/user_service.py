@@ -4,52 +4,90 @@
 
 import logging 
 from app.core.logging_config import *
-from typing import List, Optional
+import asyncio
+from typing import AsyncIterator, Iterable, List, Optional, Tuple, Union, TYPE_CHECKING
+from contextlib import aclosing, asynccontextmanager
 from app.data_access.repositories.project_repository import ProjectRepository
 from app.data_access.repositories.user_repository import UserRepository
-from app.external_services.github_api import GitHubAPIClient
-from app.models import Project, User
-from app.core.exceptions import NotFoundError, DatabaseError, ExternalAPIError
+from app.external_services.github_api import GitHubAPIClient, PageValidators, create_github_client, stored_fields, use_graphql
+from app.models import Project, User, ScrapeJob
+from app.core.exceptions import NotFoundError, DatabaseError, ExternalAPIError, NotModifiedError, CircuitOpenError
+from app.core.single_flight import SingleFlight
+from app.core.pagination import PROJECT_SORTS, encode_cursor, decode_cursor
+from app.core.config import settings
+from app.core.metrics import SERVICE_CALL_DURATION, SCRAPES_IN_FLIGHT, instrumented
+
+if TYPE_CHECKING:
+    from app.services.refresh_scheduler import RefreshScheduler
+    from app.services.job_queue import JobQueue
 
 # get a logger for current module
 logger = logging.getLogger(__name__)
 
 
+@instrumented(SERVICE_CALL_DURATION)
 class Service:
 
+    # shared GitHub client, installed by the app lifespan (see app/main.py)
+    github_client: Optional[GitHubAPIClient] = None
+
+    # background refresh of stored users, installed by the app lifespan (see app/main.py)
+    refresh_scheduler: Optional["RefreshScheduler"] = None
+
+    # workers of the scrape jobs queued by cold misses, installed by the app lifespan (see app/main.py)
+    job_queue: Optional["JobQueue"] = None
+
+    # in-flight GitHub scrapes, keyed by username
+    _scrapes = SingleFlight()
+
+    @staticmethod
+    @asynccontextmanager
+    async def _github() -> AsyncIterator[GitHubAPIClient]:
+        """
+        Yield the shared GitHub client. When the app lifespan hasn't installed one
+        (e.g. the service is used outside the app), a short-lived client is created
+        and always closed, even if the fetch raises.
+        """
+        if Service.github_client is not None:
+            yield Service.github_client
+            return
+        github_client = create_github_client()
+        try:
+            yield github_client
+        finally:
+            await github_client.close()
+
     @staticmethod
-    async def get_user_projects_service(username: str) -> List[Project]:
+    async def get_user_projects_service(username: str, rows: bool = False) -> Union[List[Project], List[dict]]:
+        """
+        - rows=True: the projects are plain dicts read without model instances, for the fast read path
+        """
         try:
-            user = await UserRepository.get_by_username(username)
-            if user:
-                projects = await ProjectRepository.get_by_user_id(user.id)
+            # one query for the user and their projects, None if the user is not stored yet
+            if rows:
+                projects = await ProjectRepository.get_rows_by_username(username)
+            else:
+                projects = await ProjectRepository.get_by_username(username)
+            if projects is not None:
+                # stale-while-revalidate: stored projects are served as they are,
+                # the read makes the user a priority for the next background refresh
+                if Service.refresh_scheduler is not None:
+                    Service.refresh_scheduler.record_read(username)
                 return projects
             else:
-                github_client = GitHubAPIClient()
-                """
-                    Needs to distinguish between user not found and user having no public repositories
-                    1. if a user is not found, a NOT FOUND error should be raised
-                    2. if a user is found but has no public repositories, no error should be raised
-                """
-                projects_data = await github_client.fetch_user_projects(username)
-                await github_client.close()
-
-                # Create user
-                user = User(username=username)
-                user = await UserRepository.create(user)
-
-                # Create projects (could be empty)
-                projects = []
-                if projects_data:
-                    projects = await ProjectRepository.create_projects(user.id, projects_data)
-
-                return projects  # Can be empty list
+                # concurrent cold misses for the same user share one scrape (and its result or error)
+                projects = await Service._scrapes.do(username, lambda: Service._scrape_user(username))
+                return [project.model_dump() for project in projects] if rows else projects
         except NotFoundError:
             logger.warning(f"User '{username}' not found on GitHub.")
             raise NotFoundError(f"User '{username}' not found on GitHub.")
         except DatabaseError as e:
             logger.error(f"Database error: {e}")
             raise DatabaseError("Error fetching user or projects.")
+        except CircuitOpenError as e:
+            # failing fast, kept as it is for the 503 with Retry-After
+            logger.warning(f"Not fetching projects of '{username}' from GitHub: {e}")
+            raise
         except ExternalAPIError as e:
             logger.error(f"External API error: {e}")
             raise ExternalAPIError("Error fetching projects from GitHub.")
@@ -57,11 +95,245 @@ class Service:
             logger.error(f"An unexpected error occurred: {e}")
             raise 
 
+    @staticmethod
+    async def get_user_projects_or_job(username: str) -> Union[List[Project], ScrapeJob]:
+        """
+        Like get_user_projects_service, but a user that isn't stored yet is not scraped in the request:
+        the scrape is queued for the job workers and its job is returned (the job already queued for that user if any).
+        - without a job queue (the app lifespan didn't start one), the user is scraped in the request
+        """
+        if Service.job_queue is None:
+            return await Service.get_user_projects_service(username)
+        try:
+            projects = await ProjectRepository.get_by_username(username)
+            if projects is not None:
+                if Service.refresh_scheduler is not None:
+                    Service.refresh_scheduler.record_read(username)
+                return projects
+            return await Service.job_queue.submit(username)
+        except DatabaseError as e:
+            logger.error(f"Database error: {e}")
+            raise DatabaseError("Error fetching user or queuing scrape job.")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred: {e}")
+            raise
+
+    @staticmethod
+    async def get_user_projects_page_service(
+        username: str,
+        sort: str = "stars",
+        limit: int = 30,
+        after: Optional[str] = None,
+        min_stars: Optional[int] = None,
+        queue: bool = False,
+    ) -> Union[Tuple[List[Project], Optional[str]], ScrapeJob]:
+        """
+        One page of a user's projects and the cursor of the next page (None on the last page).
+        - the page is sorted and filtered by the database (see ProjectRepository.get_page), not in memory
+        - after is the cursor returned with the previous page, InvalidCursorError if it isn't one of this sort
+        - a cold miss is scraped first like get_user_projects_service, or queued with queue=True and its job returned
+        """
+        position = decode_cursor(after, sort)
+        try:
+            user_id = await UserRepository.get_id_by_username(username)
+        except DatabaseError as e:
+            logger.error(f"Database error: {e}")
+            raise DatabaseError("Error fetching user or projects.")
+        if user_id is None:
+            if queue:
+                result = await Service.get_user_projects_or_job(username)
+            else:
+                result = await Service.get_user_projects_service(username)
+            if isinstance(result, ScrapeJob):
+                return result
+            if not result:
+                return [], None
+            user_id = result[0].user_id
+        elif Service.refresh_scheduler is not None:
+            Service.refresh_scheduler.record_read(username)
+        try:
+            projects = await ProjectRepository.get_page(user_id, sort, limit, position, min_stars)
+        except DatabaseError as e:
+            logger.error(f"Database error: {e}")
+            raise DatabaseError("Error fetching projects.")
+        if len(projects) < limit:
+            return projects, None
+        field, _ = PROJECT_SORTS[sort]
+        last = projects[-1]
+        return projects, encode_cursor(sort, getattr(last, field), last.id)
+
+    @staticmethod
+    async def stream_user_projects_service(username: str, queue: bool = False) -> Union[AsyncIterator[List[dict]], ScrapeJob]:
+        """
+        The projects of a user for a streamed response: batches of project dicts read from a database cursor.
+        - the user is looked up (and a cold miss scraped) before anything is returned, so that errors get their
+          status code; an error while the batches are read can only end the stream
+        - a cold miss is scraped in the request like get_user_projects_service, or queued with queue=True
+          (see get_user_projects_or_job) and its job is returned
+        """
+        try:
+            user_id = await UserRepository.get_id_by_username(username)
+        except DatabaseError as e:
+            logger.error(f"Database error: {e}")
+            raise DatabaseError("Error fetching user or projects.")
+        if user_id is None:
+            if queue:
+                result = await Service.get_user_projects_or_job(username)
+            else:
+                result = await Service.get_user_projects_service(username)
+            if isinstance(result, ScrapeJob):
+                return result
+            return Service._batches([project.model_dump() for project in result])
+        if Service.refresh_scheduler is not None:
+            Service.refresh_scheduler.record_read(username)
+        return ProjectRepository.stream_by_user_id(user_id)
+
+    @staticmethod
+    async def _batches(projects: List[dict]) -> AsyncIterator[List[dict]]:
+        for start in range(0, len(projects), settings.STREAM_BATCH_SIZE):
+            yield projects[start:start + settings.STREAM_BATCH_SIZE]
+
+    @staticmethod
+    async def get_job_service(job_id: str) -> ScrapeJob:
+        """
+        A scrape job, NotFoundError if it doesn't exist (anymore) or there is no job queue.
+        """
+        try:
+            job = await Service.job_queue.get(job_id) if Service.job_queue is not None else None
+        except DatabaseError as e:
+            logger.error(f"Database error: {e}")
+            raise DatabaseError("Error fetching scrape job.")
+        if job is None:
+            raise NotFoundError(f"Scrape job '{job_id}' not found.")
+        return job
+
+    @staticmethod
+    async def _scrape_user(username: str) -> List[Project]:
+        """
+            Needs to distinguish between user not found and user having no public repositories
+            1. if a user is not found, a NOT FOUND error should be raised
+            2. if a user is found but has no public repositories, no error should be raised
+        """
+        with SCRAPES_IN_FLIGHT.track("scrape"):
+            validators = PageValidators()
+            async with Service._github() as github_client:
+                # the first page raises NotFoundError for a missing GitHub user,
+                # so the user is only created once we know it exists
+                pages = await Service._fetch_pages(github_client.iter_user_project_pages(username, validators))
+
+            # Create the user and their projects (could be empty) in one transaction, opened once GitHub answered
+            async with UserRepository.create_with_projects(User(username=username)) as writer:
+                for page in pages:
+                    await writer.add(page)
+                # kept with the user for the conditional refetches
+                writer.user.github_validators = validators.to_json()
+
+        return writer.projects  # Can be empty list
+
+    @staticmethod
+    async def _fetch_pages(pages: AsyncIterator[List[dict]]) -> List[List[dict]]:
+        """
+        Every page of repositories, fetched before the write transaction is opened: on SQLite a transaction waiting
+        for GitHub would hold the write lock, and the other writers would fail with "database is locked".
+        - the raw GitHub payload of a page is dropped as soon as it arrives, only the stored fields are kept
+        """
+        async with aclosing(pages):
+            return [stored_fields(page) async for page in pages]
+
+    @staticmethod
+    async def scrape_batch(usernames: Iterable[str]) -> AsyncIterator[dict]:
+        """
+        Store many users at once, yields one result per distinct username as soon as it is done (not in input order):
+            {"username": ..., "status": "stored" | "scraped" | "not_found" | "error", "projects": <count>, "detail": ...}
+        - users already in the database are not scraped again ("stored")
+        - at most BATCH_CONCURRENCY users are looked up / scraped at a time (BATCH_CONCURRENCY GraphQL queries
+          with the GraphQL fetcher), a user's failure doesn't stop the batch
+        - if the consumer stops early (eg. the client disconnected), the running scrapes are cancelled, except those
+          another request or job is also waiting on (see SingleFlight)
+        """
+        usernames = iter(dict.fromkeys(usernames)) # drop duplicates, keep the order
+        concurrency = max(1, settings.BATCH_CONCURRENCY)
+        if use_graphql():
+            # the concurrent scrapes are batched into GraphQL queries, a slot is a query instead of a user
+            concurrency *= max(1, settings.GITHUB_GRAPHQL_USERS_PER_QUERY)
+        pending = set()
+        try:
+            while True:
+                for username in usernames:
+                    pending.add(asyncio.create_task(Service.scrape_one(username)))
+                    if len(pending) >= concurrency:
+                        break
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def scrape_one(username: str) -> dict:
+        """
+        Store one user of a batch or a scrape job, the errors are reported in the result instead of raised:
+            {"username": ..., "status": "stored" | "scraped" | "not_found" | "error", "projects": <count>, "detail": ...}
+        """
+        result = {"username": username}
+        try:
+            projects = await ProjectRepository.get_by_username(username)
+            if projects is not None:
+                result["status"] = "stored"
+            else:
+                projects = await Service._scrapes.do(username, lambda: Service._scrape_user(username))
+                result["status"] = "scraped"
+            result["projects"] = len(projects)
+        except NotFoundError:
+            result["status"] = "not_found"
+        # same details as the exception handlers in app/main.py
+        except DatabaseError as e:
+            logger.error(f"Batch scrape of user '{username}' failed: {e}")
+            result.update(status="error", detail="Database server error.")
+        except ExternalAPIError as e:
+            logger.error(f"Batch scrape of user '{username}' failed: {e}")
+            result.update(status="error", detail="External API error.")
+        except Exception as e:
+            logger.exception(f"An unexpected error occurred in the batch scrape of user '{username}': {e}")
+            result.update(status="error", detail="An unexpected error occurred.")
+        return result
+
+    @staticmethod
+    async def refresh_user(user: User) -> Optional[List[Project]]:
+        """
+        Fetch the projects of a stored user again and sync the stored ones with them (used by the refresh scheduler):
+        new and changed projects are written, the ones gone from GitHub are deleted only if every page was fetched.
+        - the pages are requested with the user's stored ETags, None is returned without writing anything
+          if GitHub answers 304 Not Modified for all of them
+        - NotFoundError and ExternalAPIError propagate before anything is written, the stored projects stay
+        """
+        with SCRAPES_IN_FLIGHT.track("refresh"):
+            validators = PageValidators(user.github_validators)
+            async with Service._github() as github_client:
+                try:
+                    pages = await Service._fetch_pages(github_client.iter_user_project_pages(user.username, validators))
+                except NotModifiedError:
+                    logger.info(f"Projects of user '{user.username}' not modified since the last fetch.")
+                    return None
+
+            # the transaction is opened once every page is fetched (see _fetch_pages)
+            async with UserRepository.refresh_projects(user) as writer:
+                for page in pages:
+                    await writer.add(page)
+                user.github_validators = validators.to_json()
+                writer.complete = validators.complete
+
+        logger.info(f"Refreshed {len(writer.projects)} projects of user '{user.username}'.")
+        return writer.projects
+
 
     @staticmethod
-    async def get_most_recent_users_service(n:int)->List[User]:
+    async def get_most_recent_users_service(n:int, rows: bool = False)->Union[List[User], List[dict]]:
         try: 
-            users = await UserRepository.get_most_recent(n)
+            users = await (UserRepository.get_most_recent_rows(n) if rows else UserRepository.get_most_recent(n))
             return users
         except DatabaseError as e:
             logger.error(f"Database error: {e}")
@@ -72,9 +344,9 @@ class Service:
         
 
     @staticmethod
-    async def get_most_starred_projects_service(n:int)->List[Project]:
+    async def get_most_starred_projects_service(n:int, rows: bool = False)->Union[List[Project], List[dict]]:
         try:  
-            projects = await ProjectRepository.get_most_starred(n)
+            projects = await (ProjectRepository.get_most_starred_rows(n) if rows else ProjectRepository.get_most_starred(n))
             return projects
         except DatabaseError as e:
             logger.error(f"Database error: {e}")
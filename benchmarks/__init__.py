@@ -0,0 +1 @@
+# Benchmarks, run from the project root, eg. python -m benchmarks.bench_user_projects
@@ -0,0 +1,45 @@
+# benchmarks/bench_fast_reads.py
+# Compare the List[Project] / List[User] response_model path of the three list endpoints with the fast read path
+# (FAST_READS: plain rows from the repositories, serialized by FastJSONResponse), through the whole app.
+#
+#   python -m benchmarks.bench_fast_reads [number of projects of the user]   (default 1000)
+
+import asyncio
+import sys
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.api import responses
+from app.core.config import settings
+from app.models import User
+from app.data_access.leaderboard import leaderboard
+from app.data_access.repositories.user_repository import UserRepository
+from benchmarks.common import bench_database, timeit
+
+
+async def main(n_projects: int, repeat: int = 100):
+    async with bench_database():
+        for i in range(100):
+            async with UserRepository.create_with_projects(User(username=f"user-{i}")) as writer:
+                await writer.add([{"name": f"repo-{i}-{j}", "stargazers_count": i * j, "forks_count": j} for j in range(3)])
+        async with UserRepository.create_with_projects(User(username="bench-user")) as writer:
+            await writer.add([
+                {"name": f"repo-{j}", "description": "a repository", "stargazers_count": j, "forks_count": 0}
+                for j in range(n_projects)
+            ])
+        await leaderboard.rebuild()
+
+        urls = ["/users/bench-user/projects", "/users/recent/100", "/projects/most-starred/100"]
+        encoder = "orjson" if responses.orjson is not None else "json"
+        print(f"user with {n_projects} projects, cache disabled, {repeat} runs each, fast path encoder: {encoder}")
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+            for url in urls:
+                timings = []
+                for fast in (False, True):
+                    settings.FAST_READS = fast
+                    timings.append(await timeit(lambda: client.get(url), repeat))
+                settings.FAST_READS = False
+                print(f"  {url:<30} models {timings[0]:8.3f} ms  rows {timings[1]:8.3f} ms  ({timings[0] / timings[1]:.1f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000))
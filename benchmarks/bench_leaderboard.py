@@ -0,0 +1,74 @@
+# benchmarks/bench_leaderboard.py
+# Time the most starred and most recent queries on a large database, with and without the indexes.
+# The most starred repository call is served by the materialized leaderboard, the raw query shows what it saves.
+#
+#   python -m benchmarks.bench_leaderboard [number of projects]   (default 1,000,000)
+
+import asyncio
+import random
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from sqlmodel import select
+from app.models import Project, User
+from app.data_access.leaderboard import leaderboard
+from app.data_access.repositories.user_repository import UserRepository
+from app.data_access.repositories.project_repository import ProjectRepository
+from benchmarks.common import bench_database, timeit
+
+PROJECTS_PER_USER = 50
+BATCH = 50_000
+
+
+async def seed(engine, n_projects: int):
+    n_users = max(1, n_projects // PROJECTS_PER_USER)
+    start = datetime(2024, 1, 1)
+    rng = random.Random(42)
+    async with engine.begin() as conn:
+        for offset in range(0, n_users, BATCH):
+            await conn.execute(insert(User), [
+                {"id": i + 1, "username": f"user-{i}", "created_at": start + timedelta(seconds=rng.randrange(10**8))}
+                for i in range(offset, min(offset + BATCH, n_users))
+            ])
+        for offset in range(0, n_projects, BATCH):
+            await conn.execute(insert(Project), [
+                {"name": f"repo-{i}", "description": None, "stars": int(rng.paretovariate(1.2)), "forks": 0,
+                 "user_id": i // PROJECTS_PER_USER + 1}
+                for i in range(offset, min(offset + BATCH, n_projects))
+            ])
+
+
+MOST_STARRED = select(Project).order_by(Project.stars.desc(), Project.id.desc()).limit(100)
+MOST_RECENT = select(User).order_by(User.created_at.desc(), User.id.desc()).limit(100)
+
+
+async def run(engine, label: str, repeat: int):
+    # the query alone, on an open connection
+    async with engine.connect() as conn:
+        starred_sql_ms = await timeit(lambda: conn.execute(MOST_STARRED), repeat)
+        recent_sql_ms = await timeit(lambda: conn.execute(MOST_RECENT), repeat)
+    # the whole repository call (session, ORM objects)
+    starred_ms = await timeit(lambda: ProjectRepository.get_most_starred(100), repeat)
+    recent_ms = await timeit(lambda: UserRepository.get_most_recent(100), repeat)
+    print(f"  {label:<16} most-starred/100: query {starred_sql_ms:8.3f} ms, repository {starred_ms:8.3f} ms")
+    print(f"  {'':<16} recent/100:       query {recent_sql_ms:8.3f} ms, repository {recent_ms:8.3f} ms")
+
+
+async def main(n_projects: int):
+    async with bench_database() as (session_factory, _):
+        engine = session_factory.kw["bind"]
+        print(f"seeding {n_projects:,} projects ...")
+        await seed(engine, n_projects)
+        await leaderboard.rebuild()
+
+        print("mean of the runs (cache disabled):")
+        await run(engine, "with indexes", repeat=200)
+
+        async with engine.begin() as conn:
+            await conn.execute(text("DROP INDEX ix_project_stars_id"))
+            await conn.execute(text("DROP INDEX ix_user_created_at_id"))
+        await run(engine, "without indexes", repeat=5)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
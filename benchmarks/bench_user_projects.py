@@ -0,0 +1,41 @@
+# benchmarks/bench_user_projects.py
+# Compare the read path of GET /users/{username}/projects before and after the single-query repository method.
+#
+#   python -m benchmarks.bench_user_projects [number of projects]
+
+import asyncio
+import sys
+from app.models import User
+from app.data_access.repositories.user_repository import UserRepository
+from app.data_access.repositories.project_repository import ProjectRepository
+from benchmarks.common import bench_database, timeit
+
+
+async def two_sessions(username: str):
+    # the previous path: user SELECT + refresh of its projects, then the projects again in a new session
+    user = await UserRepository.get_by_username(username)
+    return await ProjectRepository.get_by_user_id(user.id)
+
+
+async def single_query(username: str):
+    return await ProjectRepository.get_by_username(username)
+
+
+async def main(n_projects: int, repeat: int = 200):
+    async with bench_database() as (_, queries):
+        user = await UserRepository.create(User(username="bench-user"))
+        await ProjectRepository.create_projects(
+            user.id, [{"name": f"repo-{i}", "stargazers_count": i, "forks_count": 0} for i in range(n_projects)]
+        )
+
+        print(f"user with {n_projects} projects, {repeat} runs each")
+        for name, path in (("get_by_username + get_by_user_id", two_sessions), ("ProjectRepository.get_by_username", single_query)):
+            queries.reset()
+            await path("bench-user")
+            count = queries.count
+            mean_ms = await timeit(lambda: path("bench-user"), repeat)
+            print(f"  {name:<36} {count} queries  {mean_ms:8.3f} ms/request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
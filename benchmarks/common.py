@@ -0,0 +1,80 @@
+# benchmarks/common.py - helpers shared by the benchmarks
+
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlmodel import SQLModel
+from app.core.config import settings
+from app.data_access import database, leaderboard
+from app.data_access.database import create_database_engine
+from app.data_access.repositories import project_repository, user_repository
+
+
+class QueryCounter:
+    """
+    Counts the SQL statements sent through an engine.
+    """
+
+    def __init__(self, engine):
+        self.statements: List[str] = []
+        event.listen(engine.sync_engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def reset(self):
+        self.statements.clear()
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@asynccontextmanager
+async def bench_database() -> AsyncIterator[tuple]:
+    """
+    A fresh SQLite database file, patched into the repositories in place of the app database.
+    The repository cache is disabled so that every call reaches the database.
+    Yields (session factory, QueryCounter).
+    """
+    directory = tempfile.mkdtemp(prefix="ghscraper-bench-")
+    engine = create_database_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}", profile="bench")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    previous = (
+        database.async_session, user_repository.async_session, project_repository.async_session, leaderboard.async_session,
+        settings.CACHE_ENABLED,
+    )
+    database.async_session = session_factory
+    user_repository.async_session = session_factory
+    project_repository.async_session = session_factory
+    leaderboard.async_session = session_factory
+    leaderboard.leaderboard.reset()
+    settings.CACHE_ENABLED = False
+    try:
+        yield session_factory, QueryCounter(engine)
+    finally:
+        (
+            database.async_session, user_repository.async_session, project_repository.async_session, leaderboard.async_session,
+            settings.CACHE_ENABLED,
+        ) = previous
+        leaderboard.leaderboard.reset()
+        await engine.dispose()
+
+
+async def timeit(fn: Callable[[], Awaitable], repeat: int) -> float:
+    """
+    Mean wall time of one call, in milliseconds.
+    """
+    await fn() # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        await fn()
+    return (time.perf_counter() - start) * 1000 / repeat
@@ -1,8 +1,11 @@
 # cli.py
 
+import json
+import sys
 import typer
 import requests
-from typing import Optional
+from collections import Counter
+from typing import Iterator, List, Optional
 
 app = typer.Typer()
 
@@ -65,5 +68,50 @@ def get_most_starred_projects(n: int = typer.Argument(5, help="Number of most st
         typer.echo(f"Error: {response.json().get('detail', 'Unknown error')}")
 
 
+def read_usernames(file: str) -> List[str]:
+    """
+    One username per line, blank lines and lines starting with # are skipped. "-" reads stdin.
+    """
+    lines = sys.stdin if file == "-" else open(file)
+    with lines:
+        return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+def chunks(items: List[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+@app.command()
+def scrape_batch(
+    file: str = typer.Argument("-", help="File with one username per line, - for stdin"),
+    batch_size: int = typer.Option(1000, help="Usernames sent per request"),
+):
+    """
+    Store the projects of many users, printing each user's result as soon as the server is done with it.
+    """
+    usernames = read_usernames(file)
+    typer.echo(f"Scraping {len(usernames)} users...")
+    totals = Counter()
+    for batch in chunks(usernames, batch_size):
+        response = requests.post("http://localhost:8000/users/batch", json={"usernames": batch}, stream=True)
+        if response.status_code != 200:
+            typer.echo(f"Error: {response.json().get('detail', 'Unknown error')}")
+            raise typer.Exit(code=1)
+        # NDJSON, one user per line
+        for line in response.iter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            totals[result["status"]] += 1
+            if result["status"] in ("stored", "scraped"):
+                typer.echo(f"- {result['username']}: {result['status']}, {result['projects']} projects")
+            elif result["status"] == "not_found":
+                typer.echo(f"- {result['username']}: not found")
+            else:
+                typer.echo(f"- {result['username']}: error, {result.get('detail', 'Unknown error')}")
+    typer.echo(", ".join(f"{count} {status}" for status, count in sorted(totals.items())) or "Nothing to do.")
+
+
 if __name__ == "__main__":
     app()
@@ -0,0 +1,56 @@
+# tests/conftest.py - fixtures shared by the test modules
+# TEST_DATABASE_URL=postgresql+asyncpg://... runs the database tests on that PostgreSQL database instead of
+# a new SQLite database file per test (see `make test-postgres`), its tables are dropped and created for every test.
+
+import os
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+from sqlmodel import SQLModel
+from app.data_access.database import create_database_engine
+from app.data_access.cache import query_cache, MemoryCacheBackend
+from app.data_access.leaderboard import leaderboard
+
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+
+@pytest.fixture(autouse=True)
+def clear_query_cache():
+    """
+    Cached repository reads (and the leaderboard in memory) must not leak from one test into another.
+    """
+    query_cache.use(MemoryCacheBackend())
+    leaderboard.reset()
+    yield
+    query_cache.use(MemoryCacheBackend())
+    leaderboard.reset()
+
+
+@pytest_asyncio.fixture
+async def sqlite_session(mocker, tmp_path):
+    """
+    A fresh SQLite database file (or the emptied TEST_DATABASE_URL database), patched into the repositories
+    in place of the app database. Yields the session factory so that tests can seed and inspect the database.
+    - every session has its own connection, as with the app engine: concurrent sessions don't share a transaction
+    - foreign keys are enforced on SQLite too, as on PostgreSQL
+    """
+    if TEST_DATABASE_URL:
+        engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)
+    else:
+        engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", profile="bench")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.drop_all)
+        await conn.run_sync(SQLModel.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    # the primary, read_session() falls back to it without a replica
+    mocker.patch('app.data_access.database.async_session', new=session_factory)
+    mocker.patch('app.data_access.repositories.user_repository.async_session', new=session_factory)
+    mocker.patch('app.data_access.repositories.project_repository.async_session', new=session_factory)
+    mocker.patch('app.data_access.leaderboard.async_session', new=session_factory)
+    mocker.patch('app.data_access.job_store.async_session', new=session_factory)
+    yield session_factory
+    await engine.dispose()
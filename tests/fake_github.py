@@ -0,0 +1,58 @@
+# tests/fake_github.py - a fake GitHub REST API with per token rate limits, served through httpx.MockTransport
+# Supports GET /users/{username}/repos (one page per user), the X-RateLimit-* headers and secondary rate limits.
+
+import time
+import httpx
+
+
+class FakeGitHub:
+
+    def __init__(self, repos=None, limit=5000, reset_in=3600.0):
+        """
+        - repos: username -> list of GitHub repo dicts, unknown users get a 404
+        - limit, reset_in: the hourly limit of every token and the seconds until it resets
+        """
+        self.repos = repos or {}
+        self.limit = limit
+        self.reset_in = reset_in
+        self.remaining = {} # token -> requests left
+        self.reset_at = {} # token -> epoch seconds
+        self.retry_after = {} # token -> seconds, answered once with a secondary rate limit
+        self.requests = [] # (token, status) of every response, for assertions
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self), base_url="https://api.github.com")
+
+    def set_remaining(self, token, remaining, reset_in=None):
+        self.remaining[token] = remaining
+        self.reset_at[token] = time.time() + (self.reset_in if reset_in is None else reset_in)
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        authorization = request.headers.get("authorization", "")
+        token = authorization.removeprefix("Bearer ") or None
+        now = time.time()
+        if token not in self.reset_at or now >= self.reset_at[token]:
+            self.set_remaining(token, self.limit)
+        headers = {
+            "x-ratelimit-limit": str(self.limit),
+            "x-ratelimit-reset": str(int(self.reset_at[token]) + 1),
+        }
+
+        if token in self.retry_after:
+            headers["retry-after"] = str(self.retry_after.pop(token))
+            headers["x-ratelimit-remaining"] = str(self.remaining[token])
+            return self._respond(token, 403, headers, {"message": "You have exceeded a secondary rate limit."})
+        if self.remaining[token] <= 0:
+            headers["x-ratelimit-remaining"] = "0"
+            return self._respond(token, 403, headers, {"message": "API rate limit exceeded."})
+
+        self.remaining[token] -= 1
+        headers["x-ratelimit-remaining"] = str(self.remaining[token])
+        username = request.url.path.split("/")[2]
+        if username not in self.repos:
+            return self._respond(token, 404, headers, {"message": "Not Found"})
+        return self._respond(token, 200, headers, self.repos[username])
+
+    def _respond(self, token, status, headers, body) -> httpx.Response:
+        self.requests.append((token, status))
+        return httpx.Response(status, headers=headers, json=body)
@@ -0,0 +1,85 @@
+# tests/fake_redis.py - a tiny Redis-protocol (RESP) server for the cache tests
+# Supports the commands used by RedisCacheBackend: GET, SET (EX/PX), DEL, INCR/INCRBY, plus PING/SELECT/CLIENT.
+
+import asyncio
+import time
+
+
+class FakeRedisServer:
+
+    def __init__(self):
+        self.data = {} # key -> (value, expires_at or None)
+        self.commands = [] # names of the commands received, for assertions
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                writer.write(self._execute(command))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        assert line.startswith(b"*"), line
+        args = []
+        for _ in range(int(line[1:])):
+            length = int((await reader.readline())[1:])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def _execute(self, args) -> bytes:
+        name = args[0].decode().upper()
+        self.commands.append(name)
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name in ("SELECT", "CLIENT"):
+            return b"+OK\r\n"
+        if name == "GET":
+            value = self._get(args[1])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == "SET":
+            expires_at = None
+            options = [a.decode().upper() for a in args[3:]]
+            if "PX" in options:
+                expires_at = time.monotonic() + int(options[options.index("PX") + 1]) / 1000
+            if "EX" in options:
+                expires_at = time.monotonic() + int(options[options.index("EX") + 1])
+            self.data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if name == "DEL":
+            deleted = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+            return b":%d\r\n" % deleted
+        if name in ("INCR", "INCRBY"):
+            value = int(self._get(args[1]) or 0) + (int(args[2]) if name == "INCRBY" else 1)
+            self.data[args[1]] = (str(value).encode(), None)
+            return b":%d\r\n" % value
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
@@ -0,0 +1,233 @@
+# tests/test_cache.py
+
+import asyncio
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from app.models import User, Project
+from app.core.config import settings
+from app.data_access.cache import (
+    TTLCache, QueryCache, RedisCacheBackend, query_cache, MOST_STARRED, RECENT_USERS, USER_BY_USERNAME,
+    PROJECT_ROWS_BY_USER, RECENT_USER_ROWS
+)
+from app.data_access.repositories.user_repository import UserRepository
+from app.data_access.repositories.project_repository import ProjectRepository
+from tests.fake_redis import FakeRedisServer
+
+
+
+# TEST CASES FOR the TTL/LRU cache
+
+"""
+1. The least recently used entry is evicted once the cache is full.
+"""
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2)
+    cache.set("ns", "a", 1, ttl=60)
+    cache.set("ns", "b", 2, ttl=60)
+    assert cache.get("ns", "a") == 1 # "b" is now the least recently used
+    cache.set("ns", "c", 3, ttl=60)
+
+    assert cache.get("ns", "b") is None
+    assert cache.get("ns", "a") == 1
+    assert cache.get("ns", "c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+"""
+2. Entries expire after their TTL.
+"""
+
+def test_ttl_expiry(mocker):
+    now = mocker.patch('app.data_access.cache.time.monotonic', return_value=100.0)
+    cache = TTLCache(maxsize=10)
+    cache.set("ns", "a", [1], ttl=5)
+
+    now.return_value = 104.0
+    assert cache.get("ns", "a") == [1]
+    now.return_value = 105.0
+    assert cache.get("ns", "a") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["size"]) == (1, 1, 1, 0)
+
+
+"""
+3. Invalidating a namespace drops all of its entries and nothing else.
+"""
+
+def test_invalidate_namespace():
+    cache = TTLCache(maxsize=10)
+    cache.set(MOST_STARRED, 5, [1], ttl=60)
+    cache.set(MOST_STARRED, 10, [2], ttl=60)
+    cache.set(RECENT_USERS, 5, [3], ttl=60)
+
+    cache.invalidate(MOST_STARRED)
+
+    assert cache.get(MOST_STARRED, 5) is None
+    assert cache.get(MOST_STARRED, 10) is None
+    assert cache.get(RECENT_USERS, 5) == [3]
+
+
+"""
+4. A disabled cache stores nothing.
+"""
+
+def test_disabled_cache():
+    cache = TTLCache(maxsize=10, enabled=False)
+    cache.set("ns", "a", 1, ttl=60)
+    assert cache.get("ns", "a") is None
+
+
+# TEST CASES FOR the cached repository reads
+
+"""
+1. Beyond the materialized leaderboard, most starred projects are served from the cache until create_projects writes new projects.
+"""
+
+@pytest.mark.asyncio
+async def test_most_starred_cached_until_write(sqlite_session, mocker):
+    mocker.patch.object(settings, 'LEADERBOARD_SIZE', 1)
+    user = await UserRepository.create(User(username="cached-user"))
+    await ProjectRepository.create_projects(user.id, [{"name": "one", "stargazers_count": 1}])
+
+    first = await ProjectRepository.get_most_starred(5)
+    hits = query_cache.stats()["hits"]
+    second = await ProjectRepository.get_most_starred(5)
+    assert [p.name for p in first] == [p.name for p in second] == ["one"]
+    assert query_cache.stats()["hits"] == hits + 1
+
+    await ProjectRepository.create_projects(user.id, [{"name": "two", "stargazers_count": 2}])
+
+    assert [p.name for p in await ProjectRepository.get_most_starred(5)] == ["two", "one"]
+    assert [p.name for p in await ProjectRepository.get_by_user_id(user.id)] == ["one", "two"]
+
+
+"""
+2. Creating a user invalidates the recent users list.
+"""
+
+@pytest.mark.asyncio
+async def test_recent_users_invalidated_by_create(sqlite_session):
+    await UserRepository.create(User(username="first-user"))
+    assert [u.username for u in await UserRepository.get_most_recent(5)] == ["first-user"]
+
+    await UserRepository.create(User(username="second-user"))
+
+    assert [u.username for u in await UserRepository.get_most_recent(5)] == ["second-user", "first-user"]
+
+
+"""
+3. The cached rows of the fast read path are dropped with the models of the same query.
+"""
+
+@pytest.mark.asyncio
+async def test_rows_invalidated_with_models(sqlite_session, mocker):
+    mocker.patch.object(settings, 'LEADERBOARD_SIZE', 1)
+    user = await UserRepository.create(User(username="rows-user"))
+    await ProjectRepository.create_projects(user.id, [{"name": "one", "stargazers_count": 1}])
+    assert [p["name"] for p in await ProjectRepository.get_rows_by_username("rows-user")] == ["one"]
+    assert [p["name"] for p in await ProjectRepository.get_most_starred_rows(5)] == ["one"]
+    assert [u["username"] for u in await UserRepository.get_most_recent_rows(5)] == ["rows-user"]
+
+    await ProjectRepository.create_projects(user.id, [{"name": "two", "stargazers_count": 2}])
+    await UserRepository.create(User(username="other-user"))
+
+    assert [p["name"] for p in await ProjectRepository.get_rows_by_username("rows-user")] == ["one", "two"]
+    assert [p["name"] for p in await ProjectRepository.get_most_starred_rows(5)] == ["two", "one"]
+    assert [u["username"] for u in await UserRepository.get_most_recent_rows(5)] == ["other-user", "rows-user"]
+
+
+# TEST CASES FOR the Redis-protocol cache backend (against a local fake server)
+
+@pytest_asyncio.fixture
+async def redis_backend():
+    pytest.importorskip("redis")
+    server = await FakeRedisServer().start()
+    backend = RedisCacheBackend(url=server.url, prefix="test")
+    yield backend, server
+    await backend.close()
+    await server.stop()
+
+
+"""
+1. Lists of projects and single users survive a round trip through the server.
+"""
+
+@pytest.mark.asyncio
+async def test_redis_backend_round_trip(redis_backend):
+    backend, _ = redis_backend
+    projects = [Project(id=1, name="one", description=None, stars=3, forks=1, user_id=1)]
+    user = User(id=1, username="redis-user", created_at=datetime(2024, 11, 18, 12, 0))
+
+    await backend.set(MOST_STARRED, 5, projects, ttl=60)
+    await backend.set(USER_BY_USERNAME, "redis-user", user, ttl=60)
+    await backend.set(RECENT_USERS, 5, [], ttl=60)
+
+    assert await backend.get(MOST_STARRED, 5) == projects
+    cached_user = await backend.get(USER_BY_USERNAME, "redis-user")
+    assert (cached_user.id, cached_user.username, cached_user.created_at) == (1, "redis-user", user.created_at)
+    assert await backend.get(RECENT_USERS, 5) == []
+    assert await backend.get(MOST_STARRED, 10) is None
+    assert backend.stats() == {"hits": 3, "misses": 1}
+
+
+"""
+2. Plain rows survive a round trip too, with datetimes as the ISO strings of the API.
+"""
+
+@pytest.mark.asyncio
+async def test_redis_backend_rows(redis_backend):
+    backend, _ = redis_backend
+    rows = [{"id": 1, "username": "redis-user", "created_at": datetime(2024, 11, 18, 12, 0), "last_fetched_at": None}]
+
+    await backend.set(RECENT_USER_ROWS, 5, rows, ttl=60)
+    await backend.set(PROJECT_ROWS_BY_USER, 1, [], ttl=60)
+
+    assert await backend.get(RECENT_USER_ROWS, 5) == [{**rows[0], "created_at": "2024-11-18T12:00:00"}]
+    assert await backend.get(PROJECT_ROWS_BY_USER, 1) == []
+
+
+"""
+3. Invalidating a namespace bumps its version, which every worker sees.
+"""
+
+@pytest.mark.asyncio
+async def test_redis_backend_versioned_invalidation(redis_backend):
+    backend, server = redis_backend
+    other_worker = RedisCacheBackend(url=server.url, prefix="test")
+    await backend.set(MOST_STARRED, 5, [Project(id=1, name="one", user_id=1)], ttl=60)
+    assert await other_worker.get(MOST_STARRED, 5) is not None
+
+    await other_worker.invalidate(MOST_STARRED)
+
+    assert await backend.get(MOST_STARRED, 5) is None
+    await other_worker.close()
+
+
+"""
+4. Entries expire with their TTL.
+"""
+
+@pytest.mark.asyncio
+async def test_redis_backend_ttl(redis_backend):
+    backend, _ = redis_backend
+    await backend.set(MOST_STARRED, 5, [Project(id=1, name="one", user_id=1)], ttl=0.05)
+    await asyncio.sleep(0.1)
+    assert await backend.get(MOST_STARRED, 5) is None
+
+
+"""
+5. An unreachable cache server turns reads into misses instead of failing the request.
+"""
+
+@pytest.mark.asyncio
+async def test_unreachable_cache_is_a_miss():
+    pytest.importorskip("redis")
+    cache = QueryCache(RedisCacheBackend(url="redis://127.0.0.1:1/0", prefix="test"))
+
+    assert await cache.get(MOST_STARRED, 5) is None
+    await cache.set(MOST_STARRED, 5, [], ttl=60)
+    assert cache.stats()["errors"] == 2
+    await cache.backend.close()
@@ -0,0 +1,179 @@
+# tests/test_circuit_breaker.py
+
+import asyncio
+import httpx
+import pytest
+from httpx import AsyncClient
+from httpx._transports.asgi import ASGITransport
+from app.main import app
+from app.core.circuit_breaker import CircuitBreaker, CLOSED, OPEN
+from app.core.config import settings
+from app.core.exceptions import ExternalAPIError, CircuitOpenError, NotFoundError
+from app.data_access.repositories.project_repository import ProjectRepository
+from app.data_access.repositories.user_repository import UserRepository
+from app.external_services.github_api import GitHubAPIClient
+from app.services.user_service import Service
+from tests.utils import mock_writer
+
+
+transport = ASGITransport(app=app)
+
+REPOS = [{"name": "repo", "description": None, "stargazers_count": 1, "forks_count": 0}]
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(mocker):
+    mocker.patch.object(settings, 'GITHUB_RETRY_BASE_DELAY', 0.001)
+    mocker.patch.object(settings, 'GITHUB_RETRY_MAX_DELAY', 0.01)
+
+
+def flaky_github(*outcomes):
+    """
+    Fake GitHub answering with the given outcomes in order (a status code or an exception to raise), then 200.
+    Records every request.
+    """
+    outcomes = list(outcomes)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        outcome = outcomes.pop(0) if outcomes else 200
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, json=REPOS if outcome == 200 else {"message": "error"})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://api.github.com"), requests
+
+
+# TEST CASES FOR retries
+
+"""
+1. Transient 5xx responses and timeouts are retried, the request succeeds.
+"""
+
+@pytest.mark.asyncio
+async def test_transient_errors_retried(mocker):
+    mocker.patch.object(settings, 'GITHUB_RETRY_ATTEMPTS', 3)
+    http_client, requests = flaky_github(502, httpx.ConnectTimeout("timed out"))
+    github_client = GitHubAPIClient(client=http_client)
+
+    assert await github_client.fetch_user_projects("flaky") == REPOS
+    assert len(requests) == 3
+    assert github_client.breaker.state == CLOSED and github_client.breaker.failures == 0
+    await http_client.aclose()
+
+
+"""
+2. A request failing on every attempt raises ExternalAPIError, a 404 is not retried.
+"""
+
+@pytest.mark.asyncio
+async def test_retries_exhausted(mocker):
+    mocker.patch.object(settings, 'GITHUB_RETRY_ATTEMPTS', 2)
+    http_client, requests = flaky_github(503, 503, 404)
+    github_client = GitHubAPIClient(client=http_client)
+
+    with pytest.raises(ExternalAPIError):
+        await github_client.fetch_user_projects("down")
+    assert len(requests) == 2
+    assert github_client.breaker.failures == 1
+
+    with pytest.raises(NotFoundError):
+        await github_client.fetch_user_projects("missing")
+    assert len(requests) == 3
+    await http_client.aclose()
+
+
+
+# TEST CASES FOR the circuit breaker
+
+def install(mocker, github_client):
+    mocker.patch.object(Service, 'github_client', github_client)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=None))
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_writer())
+
+
+"""
+1. Consecutive failures open the circuit: requests fail fast without calling GitHub, with a 503 and Retry-After.
+"""
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast(mocker):
+    mocker.patch.object(settings, 'GITHUB_RETRY_ATTEMPTS', 1)
+    http_client, requests = flaky_github(500, 500)
+    github_client = GitHubAPIClient(client=http_client, breaker=CircuitBreaker("GitHub API", failure_threshold=2, reset_timeout=30))
+    install(mocker, github_client)
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        assert (await ac.get("/users/first/projects")).status_code == 503
+        assert (await ac.get("/users/second/projects")).status_code == 503
+        response = await ac.get("/users/third/projects")
+
+    assert response.status_code == 503
+    assert response.json() == {"detail": "External API unavailable.", "circuit": "open"}
+    assert 0 < int(response.headers["retry-after"]) <= 30
+    assert len(requests) == 2
+    await http_client.aclose()
+
+
+"""
+2. Once the reset timeout has passed, one probe goes to GitHub while the other requests keep failing fast (half-open),
+   and a successful probe closes the circuit.
+"""
+
+@pytest.mark.asyncio
+async def test_half_open_probe_closes_circuit(mocker):
+    probe_started = asyncio.Event()
+    release_probe = asyncio.Event()
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        probe_started.set()
+        await release_probe.wait()
+        return httpx.Response(200, json=REPOS)
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://api.github.com")
+    breaker = CircuitBreaker("GitHub API", failure_threshold=1, reset_timeout=0.01)
+    breaker.failure()
+    github_client = GitHubAPIClient(client=http_client, breaker=breaker)
+    install(mocker, github_client)
+    await asyncio.sleep(0.02)
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        probe = asyncio.create_task(ac.get("/users/probe/projects"))
+        await probe_started.wait()
+        during_probe = await ac.get("/users/waiting/projects")
+        release_probe.set()
+        assert (await probe).status_code == 200
+        after_probe = await ac.get("/users/after/projects")
+
+    assert during_probe.status_code == 503
+    assert during_probe.json()["circuit"] == "half-open"
+    assert after_probe.status_code == 200
+    assert breaker.state == CLOSED and len(requests) == 2
+    await http_client.aclose()
+
+
+"""
+3. A failed probe opens the circuit again.
+"""
+
+@pytest.mark.asyncio
+async def test_failed_probe_reopens_circuit(mocker):
+    mocker.patch.object(settings, 'GITHUB_RETRY_ATTEMPTS', 3)
+    http_client, requests = flaky_github(502, 502)
+    breaker = CircuitBreaker("GitHub API", failure_threshold=1, reset_timeout=0.01)
+    breaker.failure()
+    github_client = GitHubAPIClient(client=http_client, breaker=breaker)
+    await asyncio.sleep(0.02)
+
+    with pytest.raises(ExternalAPIError):
+        await github_client.fetch_user_projects("probe")
+    with pytest.raises(CircuitOpenError):
+        await github_client.fetch_user_projects("next")
+
+    # the probe gets a single attempt
+    assert len(requests) == 1
+    assert breaker.state == OPEN
+    await http_client.aclose()
@@ -0,0 +1,187 @@
+# tests/test_database.py
+
+import asyncio
+import contextvars
+import logging
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.postgresql import asyncpg
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlmodel import SQLModel
+from app.core.config import settings
+from app.data_access import database
+from app.data_access.database import create_database_engine
+from app.data_access.repositories.project_repository import ProjectRepository
+from app.data_access.repositories.user_repository import UserRepository
+from app.external_services.github_api import GitHubAPIClient
+from app.main import app
+from app.models import Project, User
+from app.services.user_service import Service
+from tests.fake_github import FakeGitHub
+
+
+async def pragma(engine, name: str):
+    async with engine.connect() as conn:
+        return (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+
+
+@pytest.fixture
+def sql_log_level():
+    """
+    The tests change the level of the SQL statements logger, put it back as it was.
+    """
+    sql_logger = logging.getLogger("sqlalchemy.engine")
+    level = sql_logger.level
+    yield sql_logger
+    sql_logger.setLevel(level)
+
+
+async def in_new_request(coroutine):
+    """
+    Run the coroutine in a fresh context, as the next request would.
+    """
+    return await asyncio.create_task(coroutine, context=contextvars.Context())
+
+
+async def scrape(username: str, github_id: int):
+    async with UserRepository.create_with_projects(User(username=username)) as writer:
+        await writer.add([{"id": github_id, "name": f"{username}-repo", "stargazers_count": 1, "forks_count": 0}])
+    # read your writes: the request that scraped the user reads it back
+    return await ProjectRepository.get_by_username(username)
+
+
+# TEST CASES FOR the engine profiles
+
+"""
+1. A SQLite database file gets the pool of the profile and every connection the PRAGMAs of the profile.
+"""
+
+@pytest.mark.asyncio
+async def test_sqlite_profile(tmp_path, sql_log_level):
+    engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path / 'app.db'}", profile="prod")
+
+    assert await pragma(engine, "journal_mode") == "wal"
+    assert await pragma(engine, "synchronous") == 1 # NORMAL
+    assert await pragma(engine, "busy_timeout") == 5000
+    assert await pragma(engine, "cache_size") == -65536
+    assert engine.pool.size() == 10
+    assert engine.pool._pre_ping
+    await engine.dispose()
+
+
+"""
+2. The settings override the profile, an unknown profile is the dev profile, an in-memory database gets no pool options.
+   Creating an engine leaves the SQL statements logger as the logging configuration set it.
+"""
+
+@pytest.mark.asyncio
+async def test_profile_overrides(mocker, sql_log_level):
+    mocker.patch.object(settings, 'DATABASE_POOL_SIZE', 3)
+    sql_log_level.setLevel(logging.WARNING)
+
+    engine = create_database_engine("sqlite+aiosqlite:///:memory:", profile="staging")
+    assert await pragma(engine, "busy_timeout") == 5000
+    assert sql_log_level.level == logging.WARNING
+    await engine.dispose()
+
+    mocker.patch.object(settings, 'DATABASE_PROFILE', 'bench')
+    engine = create_database_engine("sqlite+aiosqlite:///./unused.db")
+    assert engine.pool.size() == 3 and engine.pool._max_overflow == 0
+    await engine.dispose()
+
+
+# TEST CASES FOR PostgreSQL
+# (the whole suite runs on PostgreSQL with TEST_DATABASE_URL, see `make test-postgres`)
+
+"""
+1. The tables and indexes compile for postgresql+asyncpg: "user" is quoted, the GitHub ids are 64 bits.
+"""
+
+def test_postgresql_schema():
+    dialect = asyncpg.dialect()
+    ddl = [str(CreateTable(table).compile(dialect=dialect)) for table in SQLModel.metadata.sorted_tables]
+    ddl += [str(CreateIndex(index).compile(dialect=dialect)) for table in SQLModel.metadata.sorted_tables for index in table.indexes]
+
+    assert any('CREATE TABLE "user"' in statement for statement in ddl)
+    assert any("github_id BIGINT" in statement for statement in ddl)
+    assert "CREATE UNIQUE INDEX ix_project_github_id ON project (github_id)" in ddl
+
+
+"""
+2. The upsert of a refresh is an INSERT ... ON CONFLICT (github_id) DO UPDATE ... RETURNING on PostgreSQL too.
+"""
+
+def test_postgresql_upsert():
+    statement = str(ProjectRepository.upsert_statement("postgresql").compile(dialect=asyncpg.dialect()))
+
+    assert "ON CONFLICT (github_id) DO UPDATE SET name = excluded.name" in statement
+    assert "RETURNING project.id" in statement
+
+
+# TEST CASES FOR the read replica
+
+@pytest_asyncio.fixture
+async def replica(sqlite_session, tmp_path, mocker):
+    """
+    An empty replica that never catches up with the primary (sqlite_session), without the cache in front of them.
+    """
+    replica_engine = create_database_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}", profile="bench")
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    mocker.patch.object(database, 'replica_session', sessionmaker(bind=replica_engine, class_=AsyncSession, expire_on_commit=False))
+    mocker.patch.dict(database._pinned_keys, clear=True)
+    mocker.patch.object(settings, 'CACHE_ENABLED', False)
+    yield replica_engine
+    await replica_engine.dispose()
+
+
+"""
+1. Reads go to the replica and writes to the primary; the reads of the written user, from any request until
+   DATABASE_REPLICA_LAG_SECONDS, go to the primary.
+"""
+
+@pytest.mark.asyncio
+async def test_replica_routing(sqlite_session, replica, mocker):
+
+    # on the primary only, the replica is behind
+    async with sqlite_session() as session:
+        user = User(username="behind")
+        session.add(user)
+        await session.flush()
+        session.add(Project(name="behind-repo", user_id=user.id))
+        await session.commit()
+    assert await in_new_request(ProjectRepository.get_by_username("behind")) is None
+
+    written = await in_new_request(scrape("alice", 1))
+    assert [project.name for project in written] == ["alice-repo"]
+    assert [project.name for project in await in_new_request(ProjectRepository.get_by_username("alice"))] == ["alice-repo"]
+    assert await in_new_request(UserRepository.get_id_by_username("alice")) == written[0].user_id
+    assert await in_new_request(ProjectRepository.get_by_username("behind")) is None
+
+    # no pin at all without a lag
+    mocker.patch.object(settings, 'DATABASE_REPLICA_LAG_SECONDS', 0)
+    assert await in_new_request(scrape("bob", 2)) is None
+
+
+"""
+2. A cold miss scraped through a request (in the task shared by the concurrent misses) is read back by the next
+   requests for that user, while the reads of other data stay on the replica.
+"""
+
+@pytest.mark.asyncio
+async def test_replica_read_after_cold_miss(sqlite_session, replica, mocker):
+    fake = FakeGitHub({"carol": [{"id": 3, "name": "carol-repo", "stargazers_count": 1, "forks_count": 0}]})
+    mocker.patch.object(Service, 'github_client', GitHubAPIClient(client=fake.client()))
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        scraped = await ac.get("/users/carol/projects")
+        read = await ac.get("/users/carol/projects")
+
+    assert scraped.status_code == read.status_code == 200
+    assert [p["name"] for p in scraped.json()] == [p["name"] for p in read.json()] == ["carol-repo"]
+    assert len(fake.requests) == 1 # the second request read the primary, it didn't scrape again
+    assert await in_new_request(UserRepository.get_most_recent(5)) == []
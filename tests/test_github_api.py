@@ -0,0 +1,378 @@
+# tests/test_github_api.py
+
+import asyncio
+import httpx
+import pytest
+from app.main import app, lifespan
+from app.data_access.leaderboard import leaderboard
+from app.data_access.repositories.user_repository import UserRepository
+from app.data_access.repositories.project_repository import ProjectRepository
+from app.external_services.github_api import GitHubAPIClient, PageValidators, create_http_client
+from app.core.config import settings
+from app.core.exceptions import NotFoundError, ExternalAPIError, NotModifiedError
+from app.services.user_service import Service
+from tests.utils import mock_pages, mock_writer
+
+
+
+# TEST CASES FOR the shared GitHub HTTP client
+
+"""
+1. The app lifespan creates one pooled client, installs it on the service and closes it on shutdown.
+"""
+
+@pytest.mark.asyncio
+async def test_lifespan_installs_shared_client(mocker):
+    mocker.patch('app.main.create_db_and_tables', mocker.AsyncMock())
+    mocker.patch.object(leaderboard, 'ensure_consistent', mocker.AsyncMock())
+
+    async with lifespan(app):
+        github_client = Service.github_client
+        assert github_client is app.state.github_client
+        assert not github_client.client.is_closed
+
+    assert Service.github_client is None
+    assert github_client.client.is_closed
+
+
+"""
+2. A cold miss reuses the shared client and leaves it open for the next request.
+"""
+
+@pytest.mark.asyncio
+async def test_service_reuses_shared_client(mocker):
+    username = "shared-client-user"
+    shared = GitHubAPIClient(client=create_http_client())
+    mocker.patch.object(Service, 'github_client', shared)
+
+    mock_create_user = mock_writer()
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=None))
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_pages([]))
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
+
+    await Service.get_user_projects_service(username)
+    await Service.get_user_projects_service(username)
+
+    assert mock_create_user.pages == [[], []]
+    assert not shared.client.is_closed
+    await shared.client.aclose()
+
+
+"""
+3. Without a shared client, the short-lived client is closed even when the fetch fails.
+"""
+
+@pytest.mark.asyncio
+async def test_transient_client_closed_on_error(mocker):
+    username = "failing-user"
+    mocker.patch.object(Service, 'github_client', None)
+    mock_close = mocker.patch.object(GitHubAPIClient, 'close', mocker.AsyncMock())
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=None))
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_pages(side_effect=ExternalAPIError("boom")))
+
+    with pytest.raises(ExternalAPIError):
+        await Service.get_user_projects_service(username)
+
+    mock_close.assert_awaited_once()
+
+
+"""
+4. A client built around a shared httpx client does not close it.
+"""
+
+@pytest.mark.asyncio
+async def test_close_does_not_close_shared_client():
+    http_client = create_http_client()
+    github_client = GitHubAPIClient(client=http_client)
+
+    await github_client.close()
+
+    assert not http_client.is_closed
+    await http_client.aclose()
+
+
+
+# TEST CASES FOR pagination
+
+def repos(start, count):
+    return [{"name": f"repo-{i}", "description": None, "stargazers_count": i, "forks_count": 0} for i in range(start, start + count)]
+
+
+def paginated_github(total, per_page=100):
+    """
+    Build a fake GitHub /users/{username}/repos endpoint with Link headers, and record the requested pages.
+    """
+    requested = []
+    last_page = max(1, -(-total // per_page))
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.params["per_page"] == str(per_page)
+        page = int(request.url.params["page"])
+        requested.append(page)
+        headers = {}
+        if last_page > 1:
+            headers["link"] = (
+                f'<https://api.github.com/user/1/repos?per_page={per_page}&page={min(page + 1, last_page)}>; rel="next", '
+                f'<https://api.github.com/user/1/repos?per_page={per_page}&page={last_page}>; rel="last"'
+            )
+        start = (page - 1) * per_page
+        return httpx.Response(200, json=repos(start, max(0, min(per_page, total - start))), headers=headers)
+
+    return handler, requested
+
+
+"""
+1. A user with more than one page of repositories gets every repository, with per_page=100.
+"""
+
+@pytest.mark.asyncio
+async def test_fetch_user_projects_all_pages():
+    handler, requested = paginated_github(250)
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://api.github.com")
+    github_client = GitHubAPIClient(client=http_client)
+
+    projects_data = await github_client.fetch_user_projects("many-repos")
+
+    assert sorted(p["stargazers_count"] for p in projects_data) == list(range(250))
+    assert sorted(requested) == [1, 2, 3]
+    assert requested[0] == 1
+    await http_client.aclose()
+
+
+"""
+2. A single page of results (no Link header) makes exactly one request.
+"""
+
+@pytest.mark.asyncio
+async def test_fetch_user_projects_single_page():
+    handler, requested = paginated_github(5)
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://api.github.com")
+    github_client = GitHubAPIClient(client=http_client)
+
+    projects_data = await github_client.fetch_user_projects("few-repos")
+
+    assert len(projects_data) == 5
+    assert requested == [1]
+    await http_client.aclose()
+
+
+"""
+3. Remaining pages are fetched concurrently, but never more than GITHUB_PAGE_FANOUT at a time.
+"""
+
+@pytest.mark.asyncio
+async def test_page_fanout_is_bounded(mocker):
+    mocker.patch.object(settings, 'GITHUB_PAGE_FANOUT', 3)
+    handler, _ = paginated_github(1000)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def slow_handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return handler(request)
+
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(slow_handler), base_url="https://api.github.com")
+    github_client = GitHubAPIClient(client=http_client)
+
+    pages = [page async for page in github_client.iter_user_project_pages("lots-of-repos")]
+
+    assert len(pages) == 10
+    assert max_in_flight == 3
+    await http_client.aclose()
+
+
+"""
+4. A missing user raises NotFoundError before any page is yielded.
+"""
+
+@pytest.mark.asyncio
+async def test_iter_pages_user_not_found():
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(404)), base_url="https://api.github.com")
+    github_client = GitHubAPIClient(client=http_client)
+
+    with pytest.raises(NotFoundError):
+        await anext(github_client.iter_user_project_pages("ghost"))
+    await http_client.aclose()
+
+
+"""
+5. The service stores the projects page by page.
+"""
+
+@pytest.mark.asyncio
+async def test_service_stores_projects_per_page(mocker):
+    username = "paged-user"
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=None))
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_pages(repos(0, 100), repos(100, 20)))
+    mock_create_user = mock_writer()
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
+
+    await Service.get_user_projects_service(username)
+
+    assert [len(page) for page in mock_create_user.pages] == [100, 20]
+
+
+"""
+6. The pages are all fetched before the user's write transaction is opened: a scrape waiting for a slow page
+   doesn't hold the database write lock, another cold miss is stored meanwhile.
+"""
+
+@pytest.mark.asyncio
+async def test_slow_page_does_not_block_writers(sqlite_session, mocker):
+    release = asyncio.Event()
+
+    async def iter_user_project_pages(self, username, validators=None):
+        yield [{"id": hash(username), "name": f"{username}-repo", "stargazers_count": 1, "forks_count": 0, "owner": {}}]
+        if username == "slow-user":
+            await release.wait()
+            yield [{"id": hash(username) + 1, "name": "late-repo", "stargazers_count": 2, "forks_count": 0}]
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', iter_user_project_pages)
+
+    slow = asyncio.create_task(Service.get_user_projects_service("slow-user"))
+    await asyncio.sleep(0.01)
+    fast = await asyncio.wait_for(Service.get_user_projects_service("fast-user"), timeout=2)
+    release.set()
+
+    assert [p.name for p in fast] == ["fast-user-repo"]
+    assert sorted(p.name for p in await slow) == ["late-repo", "slow-user-repo"]
+
+
+
+# TEST CASES FOR conditional requests
+
+def etag_github(pages):
+    """
+    Build a fake GitHub /users/{username}/repos endpoint serving the given pages (a list that the test may change),
+    with an ETag per page and 304 Not Modified for a matching If-None-Match. Records (page, status) of every response.
+    """
+    responses = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        page = int(request.url.params["page"])
+        etag = f'"{hash(repr(pages[page - 1]))}"'
+        headers = {"etag": etag}
+        if len(pages) > 1:
+            headers["link"] = f'<https://api.github.com/user/1/repos?per_page=100&page={len(pages)}>; rel="last"'
+        if request.headers.get("if-none-match") == etag:
+            responses.append((page, 304))
+            return httpx.Response(304, headers=headers)
+        responses.append((page, 200))
+        return httpx.Response(200, json=pages[page - 1], headers=headers)
+
+    return handler, responses
+
+
+"""
+1. A first fetch records the ETag of every page, a refetch of unchanged pages raises NotModifiedError with 304s only.
+"""
+
+@pytest.mark.asyncio
+async def test_refetch_not_modified():
+    handler, responses = etag_github([repos(0, 100), repos(100, 100), repos(200, 3)])
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://api.github.com")
+    github_client = GitHubAPIClient(client=http_client)
+    validators = PageValidators()
+
+    pages = [page async for page in github_client.iter_user_project_pages("etag-user", validators)]
+    assert len(pages) == 3 and len(validators.pages) == 3
+    responses.clear()
+
+    with pytest.raises(NotModifiedError):
+        await anext(github_client.iter_user_project_pages("etag-user", PageValidators(validators.to_json())))
+    assert sorted(responses) == [(1, 304), (2, 304), (3, 304)]
+    await http_client.aclose()
+
+
+"""
+2. When a page changed, every page is yielded in page order, and the validators are updated.
+"""
+
+@pytest.mark.asyncio
+async def test_refetch_changed_page():
+    github_pages = [repos(0, 100), repos(100, 100)]
+    handler, responses = etag_github(github_pages)
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://api.github.com")
+    github_client = GitHubAPIClient(client=http_client)
+    validators = PageValidators()
+    _ = [page async for page in github_client.iter_user_project_pages("changed-user", validators)]
+    stored = validators.to_json()
+    responses.clear()
+
+    github_pages[1] = repos(100, 50)
+    pages = [page async for page in github_client.iter_user_project_pages("changed-user", validators)]
+
+    assert [len(page) for page in pages] == [100, 50]
+    # the unchanged page is requested again, its repositories are not stored per page
+    assert responses == [(1, 304), (2, 200), (1, 200)]
+    assert validators.pages[0] == stored[0] and validators.pages[1] != stored[1]
+    await http_client.aclose()
+
+
+def growing_github(names):
+    """
+    A fake /users/{username}/repos endpoint over a list of repository names (that the test may change), paged by
+    GITHUB_PER_PAGE. Like GitHub, a 304 Not Modified carries no Link header. Records (page, status) of every response.
+    """
+    responses = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        page, per_page = int(request.url.params["page"]), settings.GITHUB_PER_PAGE
+        items = [{"name": name, "stargazers_count": 0, "forks_count": 0} for name in names[(page - 1) * per_page:page * per_page]]
+        etag = f'"{hash(repr(items))}"'
+        if request.headers.get("if-none-match") == etag:
+            responses.append((page, 304))
+            return httpx.Response(304, headers={"etag": etag})
+        last_page = max(1, -(-len(names) // per_page))
+        links = []
+        if page < last_page:
+            links.append(f'<https://api.github.com/user/1/repos?per_page={per_page}&page={page + 1}>; rel="next"')
+            links.append(f'<https://api.github.com/user/1/repos?per_page={per_page}&page={last_page}>; rel="last"')
+        headers = {"etag": etag, "link": ", ".join(links)} if links else {"etag": etag}
+        responses.append((page, 200))
+        return httpx.Response(200, json=items, headers=headers)
+
+    return handler, responses
+
+
+"""
+3. Repositories added since the previous fetch are all fetched, even when page 1 is not modified (no Link header)
+   or every stored page is: a full last page is followed until a short one, and the fetch ends complete.
+"""
+
+@pytest.mark.asyncio
+async def test_refetch_page_count_grows(mocker):
+    mocker.patch.object(settings, 'GITHUB_PER_PAGE', 2)
+    names = ["a", "b", "c", "d"]
+    handler, responses = growing_github(names)
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://api.github.com")
+    github_client = GitHubAPIClient(client=http_client)
+
+    async def fetch(validators):
+        return [project["name"] for page in [p async for p in github_client.iter_user_project_pages("growing", validators)] for project in page]
+
+    validators = PageValidators()
+    assert await fetch(validators) == ["a", "b", "c", "d"]
+    # the last page is full: more pages may have been added after the page count was read
+    assert not validators.complete
+
+    # unchanged, the page after the full last page is empty
+    responses.clear()
+    with pytest.raises(NotModifiedError):
+        await fetch(PageValidators(validators.to_json()))
+    assert sorted(responses) == [(1, 304), (2, 304), (3, 200)]
+
+    names.insert(2, "bb")
+    validators = PageValidators(validators.to_json())
+    assert await fetch(validators) == ["a", "b", "bb", "c", "d"]
+    assert validators.complete and len(validators.pages) == 3
+
+    names.append("e")
+    validators = PageValidators(validators.to_json())
+    assert await fetch(validators) == ["a", "b", "bb", "c", "d", "e"]
+    # three full pages, the empty fourth one ends the fetch
+    assert validators.complete and len(validators.pages) == 4
+    await http_client.aclose()
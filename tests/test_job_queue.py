@@ -0,0 +1,181 @@
+# tests/test_job_queue.py
+
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from httpx import AsyncClient
+from httpx._transports.asgi import ASGITransport
+from sqlalchemy import update
+from app.main import app
+from app.core.config import settings
+from app.models import ScrapeJob
+from app.data_access.job_store import MemoryJobStore, DatabaseJobStore
+from app.data_access.repositories.project_repository import ProjectRepository
+from app.external_services.github_api import GitHubAPIClient
+from app.services.job_queue import JobQueue
+from app.services.user_service import Service
+from tests.test_main import batch_github
+
+
+transport = ASGITransport(app=app)
+
+REPOS = {
+    "octocat": [{"name": "hello-world", "stargazers_count": 3, "forks_count": 1}],
+    "broken": [],
+}
+
+
+def install(mocker, store=None, delay=0.0):
+    """
+    A job queue on the test database (workers not started) and a fake GitHub.
+    """
+    iter_pages, _ = batch_github(REPOS, delay=delay, errors=("broken",))
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', iter_pages)
+    job_queue = JobQueue(Service.scrape_one, store if store is not None else MemoryJobStore())
+    mocker.patch.object(Service, 'job_queue', job_queue)
+    return job_queue
+
+
+# TEST CASES FOR scrape jobs
+
+"""
+1. With "Prefer: respond-async" a cold miss answers 202 with a job, the job stores the projects and reports it,
+   then the projects are served from the database.
+"""
+
+@pytest.mark.asyncio
+async def test_cold_miss_queues_job(sqlite_session, mocker):
+    job_queue = install(mocker)
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.get("/users/octocat/projects", headers={"Prefer": "respond-async"})
+        assert response.status_code == 202, f"Response content: {response.content}"
+        job = response.json()
+        assert job["status"] == "queued" and job["username"] == "octocat"
+        assert response.headers["location"] == f"/jobs/{job['id']}"
+        assert await ProjectRepository.get_by_username("octocat") is None
+
+        assert await job_queue.run_once()
+        assert not await job_queue.run_once()
+
+        status = (await ac.get(f"/jobs/{job['id']}")).json()
+        projects = await ac.get("/users/octocat/projects", headers={"Prefer": "respond-async"})
+
+    assert status["status"] == "done" and status["projects"] == 1
+    assert projects.status_code == 200
+    assert [p["name"] for p in projects.json()] == ["hello-world"]
+
+
+"""
+2. Requests for a user already queued share its job, and JOBS_ENABLED queues jobs without the Prefer header.
+"""
+
+@pytest.mark.asyncio
+async def test_one_job_per_user(sqlite_session, mocker):
+    mocker.patch.object(settings, 'JOBS_ENABLED', True)
+    job_queue = install(mocker)
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        responses = await asyncio.gather(*(ac.get("/users/octocat/projects") for _ in range(3)))
+
+    assert [response.status_code for response in responses] == [202, 202, 202]
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert len(job_queue.store.jobs) == 1
+
+
+"""
+3. The workers run the jobs in the background, a missing or failing user finishes its job without stopping the workers.
+"""
+
+@pytest.mark.asyncio
+async def test_workers_run_jobs(sqlite_session, mocker):
+    mocker.patch.object(settings, 'JOB_WORKERS', 2)
+    job_queue = install(mocker, delay=0.01)
+    job_queue.start()
+    try:
+        jobs = [await job_queue.submit(username) for username in ["octocat", "ghost", "broken"]]
+        for _ in range(100):
+            if all(job.status not in ("queued", "running") for job in jobs):
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await job_queue.stop()
+
+    assert [(job.status, job.projects, job.detail) for job in jobs] == [
+        ("done", 1, None),
+        ("not_found", None, None),
+        ("error", None, "External API error."),
+    ]
+
+
+"""
+4. An autostart queue (JOBS_ENABLED off) starts no worker, and doesn't poll the store, until the first job is submitted.
+"""
+
+@pytest.mark.asyncio
+async def test_workers_started_by_first_job(sqlite_session, mocker):
+    job_queue = JobQueue(Service.scrape_one, MemoryJobStore(), autostart=True)
+    install(mocker)
+    claim = mocker.spy(job_queue.store, 'claim')
+    await asyncio.sleep(0.01)
+    assert claim.call_count == 0
+
+    job = await job_queue.submit("octocat")
+    try:
+        for _ in range(100):
+            if job.status == "done":
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await job_queue.stop()
+
+    assert job.status == "done"
+    assert claim.call_count >= 1
+
+"""
+5. An unknown job is a 404.
+"""
+
+@pytest.mark.asyncio
+async def test_unknown_job(mocker):
+    install(mocker)
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.get("/jobs/0123456789abcdef")
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Resource not found."}
+
+
+# TEST CASES FOR the database job store
+
+"""
+1. Jobs are claimed oldest first and once, a job left running past JOB_RUNNING_TIMEOUT_SECONDS is claimed again,
+   and only finished jobs are pruned.
+"""
+
+@pytest.mark.asyncio
+async def test_database_store(sqlite_session, mocker):
+    store = DatabaseJobStore()
+    first = await store.submit("first")
+    second = await store.submit("second")
+    assert (await store.submit("first")).id == first.id
+
+    assert (await store.claim()).id == first.id
+    assert (await store.claim()).id == second.id
+    assert await store.claim() is None
+
+    # the worker running the first job died
+    async with sqlite_session() as session:
+        await session.execute(
+            update(ScrapeJob).where(ScrapeJob.id == first.id).values(updated_at=datetime.utcnow() - timedelta(hours=1))
+        )
+        await session.commit()
+    assert (await store.claim()).id == first.id
+
+    await store.finish(second, "done", projects=2)
+    assert (await store.get(second.id)).projects == 2
+    assert (await store.submit("second")).id != second.id
+    assert await store.prune(datetime.utcnow() + timedelta(seconds=1)) == 1
+    assert await store.get(second.id) is None
+    assert (await store.get(first.id)).status == "running"
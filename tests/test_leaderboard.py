@@ -0,0 +1,139 @@
+# tests/test_leaderboard.py
+
+import pytest
+from sqlalchemy import delete, func, select, update
+from app.core.config import settings
+from app.models import LeaderboardEntry, Project, User
+from app.data_access.leaderboard import Leaderboard, leaderboard
+from app.data_access.repositories.user_repository import UserRepository
+from app.data_access.repositories.project_repository import ProjectRepository
+from tests.test_repositories import count_queries
+
+
+
+def repos(*stars):
+    return [{"name": f"repo-{s}", "stargazers_count": s, "forks_count": 0} for s in stars]
+
+
+async def entry_count(session_factory):
+    async with session_factory() as session:
+        return (await session.execute(select(func.count()).select_from(LeaderboardEntry))).scalar_one()
+
+
+# TEST CASES FOR the materialized leaderboard
+
+"""
+1. Project writes update the leaderboard, which is then served without touching the projects table.
+"""
+
+@pytest.mark.asyncio
+async def test_leaderboard_served_from_memory(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="first")) as writer:
+        await writer.add(repos(5, 50, 1))
+    user = await UserRepository.create(User(username="second"))
+    await ProjectRepository.create_projects(user.id, repos(20))
+
+    statements = count_queries(sqlite_session)
+    top = await ProjectRepository.get_most_starred(3)
+
+    assert [p.stars for p in top] == [50, 20, 5]
+    assert not any("FROM project" in statement for statement in statements)
+
+
+"""
+2. The leaderboard table never keeps more than LEADERBOARD_SIZE projects.
+"""
+
+@pytest.mark.asyncio
+async def test_leaderboard_table_trimmed(sqlite_session, mocker):
+    mocker.patch.object(settings, 'LEADERBOARD_SIZE', 3)
+    async with UserRepository.create_with_projects(User(username="many")) as writer:
+        await writer.add(repos(*range(10)))
+        await writer.add(repos(100, 0, 7))
+
+    assert await entry_count(sqlite_session) == 3
+    assert await leaderboard.check()
+    assert [p.stars for p in await ProjectRepository.get_most_starred(3)] == [100, 9, 8]
+
+
+"""
+3. The consistency checker finds a damaged table, and rebuild() repairs it.
+"""
+
+@pytest.mark.asyncio
+async def test_leaderboard_check_and_rebuild(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="checked")) as writer:
+        await writer.add(repos(3, 2, 1))
+    async with sqlite_session() as session:
+        await session.execute(delete(LeaderboardEntry).where(LeaderboardEntry.stars == 3))
+        await session.commit()
+
+    assert not await leaderboard.check()
+
+    await leaderboard.ensure_consistent()
+
+    assert await leaderboard.check()
+    assert [p.stars for p in await ProjectRepository.get_most_starred(5)] == [3, 2, 1]
+
+
+"""
+4. A rolled back scrape leaves the leaderboard untouched.
+"""
+
+@pytest.mark.asyncio
+async def test_leaderboard_rolled_back_with_projects(sqlite_session):
+    with pytest.raises(RuntimeError):
+        async with UserRepository.create_with_projects(User(username="failed")) as writer:
+            await writer.add(repos(1000))
+            raise RuntimeError("GitHub page failed")
+
+    assert await entry_count(sqlite_session) == 0
+    assert await ProjectRepository.get_most_starred(5) == []
+
+
+"""
+5. Another worker picks up the writes once its copy is reloaded from the table.
+"""
+
+@pytest.mark.asyncio
+async def test_other_worker_reloads(sqlite_session, mocker):
+    other_worker = Leaderboard()
+    assert await other_worker.top(5) == []
+
+    async with UserRepository.create_with_projects(User(username="elsewhere")) as writer:
+        await writer.add(repos(42))
+
+    assert await other_worker.top(5) == [] # still within LEADERBOARD_RELOAD_SECONDS
+    mocker.patch.object(settings, 'LEADERBOARD_RELOAD_SECONDS', 0)
+    assert [p.stars for p in await other_worker.top(5)] == [42]
+
+
+"""
+6. A worker whose copy still holds projects that another worker lowered decides against the table: a project that
+   ranks there is recorded even though it would not enter the stale copy.
+"""
+
+@pytest.mark.asyncio
+async def test_stale_copy_does_not_drop_ranking_project(sqlite_session, mocker):
+    mocker.patch.object(settings, 'LEADERBOARD_SIZE', 3)
+    async with UserRepository.create_with_projects(User(username="popular")) as writer:
+        await writer.add(repos(100, 90, 80))
+    async with UserRepository.create_with_projects(User(username="small")) as writer:
+        await writer.add(repos(5, 4))
+    assert [p.stars for p in await leaderboard.top(3)] == [100, 90, 80]
+
+    # another worker lowers the stars of the popular projects
+    other_worker = Leaderboard()
+    async with sqlite_session() as session:
+        await session.execute(update(Project).where(Project.stars >= 80).values(stars=1))
+        other_worker.replace(await other_worker.recompute(session))
+        await session.commit()
+    assert [p.stars for p in await other_worker.top(3)] == [5, 4, 1]
+    assert [p.stars for p in await leaderboard.top(3)] == [100, 90, 80] # still within LEADERBOARD_RELOAD_SECONDS
+
+    async with UserRepository.create_with_projects(User(username="newcomer")) as writer:
+        await writer.add(repos(50))
+
+    assert await leaderboard.check()
+    mocker.patch.object(settings, 'LEADERBOARD_RELOAD_SECONDS', 0)
+    assert [p.stars for p in await other_worker.top(3)] == [50, 5, 4]
@@ -0,0 +1,123 @@
+# tests/test_logging_config.py
+
+import logging
+import pytest
+import queue
+import threading
+import time
+from datetime import datetime
+from app.core.config import settings
+from app.core.logging_config import (
+    DailyFileHandler, DrainingQueueListener, DroppingQueueHandler, SamplingFilter, configure_sql_logging, parse_sample_rates
+)
+
+
+def record(name: str = "app", level: int = logging.INFO, created: datetime = None) -> logging.LogRecord:
+    log_record = logging.LogRecord(name, level, __file__, 1, "message", None, None)
+    if created is not None:
+        log_record.created = created.timestamp()
+    return log_record
+
+
+class Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.getMessage(), threading.current_thread()))
+
+
+# TEST CASES FOR the daily log files
+
+"""
+1. The first record after midnight starts the file of the new day, a late record of the day before doesn't reopen
+   its file, and the files older than backup_days are deleted.
+"""
+
+def test_daily_file_rolls_at_midnight(tmp_path):
+    (tmp_path / "app_2026-01-01.log").write_text("old\n")
+    (tmp_path / "other.log").write_text("kept\n")
+    handler = DailyFileHandler(str(tmp_path), backup_days=2)
+    handler.day = datetime(2026, 1, 3).date()
+    handler.baseFilename = str(tmp_path / "app_2026-01-03.log")
+
+    handler.emit(record(created=datetime(2026, 1, 3, 23, 59, 59)))
+    handler.emit(record(created=datetime(2026, 1, 4, 0, 0, 1)))
+    handler.emit(record(created=datetime(2026, 1, 3, 23, 59, 59)))
+    handler.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["app_2026-01-03.log", "app_2026-01-04.log", "other.log"]
+    assert (tmp_path / "app_2026-01-03.log").read_text() == "message\n"
+    assert (tmp_path / "app_2026-01-04.log").read_text() == "message\nmessage\n"
+
+
+# TEST CASES FOR sampling
+
+"""
+1. The INFO records of a sampled logger and its children are thinned to the rate, its warnings, and the other loggers,
+   are all kept; a rate of 0 drops every INFO record.
+"""
+
+def test_sampling_filter():
+    sampling = SamplingFilter(parse_sample_rates("sqlalchemy.engine=0.25, httpx=0"))
+
+    kept = [sampling.filter(record("sqlalchemy.engine.Engine")) for _ in range(8)]
+    assert kept == [True, False, False, False, True, False, False, False]
+    assert sampling.filter(record("sqlalchemy.engine.Engine", logging.WARNING))
+    assert not sampling.filter(record("httpx"))
+    assert sampling.filter(record("httpx", logging.ERROR))
+    assert sampling.filter(record("sqlalchemy.pool"))
+    assert sampling.filter(record("app.services.user_service"))
+
+
+# TEST CASES FOR the SQL statements logging
+
+"""
+1. The SQL statements are logged with the dev database profile or DATABASE_ECHO, the other profiles leave the
+   sqlalchemy.engine logger alone.
+"""
+
+@pytest.mark.parametrize("profile, echo, level", [
+    ("dev", None, logging.INFO),
+    ("prod", None, logging.WARNING),
+    ("prod", True, logging.INFO),
+    ("dev", False, logging.WARNING),
+])
+def test_sql_logging(mocker, profile, echo, level):
+    mocker.patch.object(settings, 'DATABASE_PROFILE', profile)
+    mocker.patch.object(settings, 'DATABASE_ECHO', echo)
+    sql_logger = logging.getLogger("sqlalchemy.engine")
+    previous = sql_logger.level
+    sql_logger.setLevel(logging.WARNING)
+    try:
+        configure_sql_logging()
+        assert sql_logger.level == level
+    finally:
+        sql_logger.setLevel(previous)
+
+
+# TEST CASES FOR the logging queue
+
+"""
+1. A full queue drops the records instead of waiting, the listener writes the queued records on its own thread
+   and all of them before stopping.
+"""
+
+def test_queue_never_blocks():
+    log_queue = queue.Queue(maxsize=2)
+    queue_handler = DroppingQueueHandler(log_queue)
+    output = Collect()
+
+    started = time.perf_counter()
+    for i in range(5):
+        queue_handler.handle(record(created=datetime.now()))
+    assert time.perf_counter() - started < 1
+    assert queue_handler.dropped == 3
+
+    listener = DrainingQueueListener(log_queue, output)
+    listener.start()
+    listener.stop()
+
+    assert [message for message, _ in output.records] == ["message", "message"]
+    assert all(thread is not threading.current_thread() for _, thread in output.records)
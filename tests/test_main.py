@@ -1,5 +1,7 @@
 # tests/test_main.py
 
+import asyncio
+import json
 import pytest
 from app.main import app
 from httpx import AsyncClient
@@ -11,6 +13,8 @@ from app.external_services.github_api import GitHubAPIClient
 from app.core.exceptions import NotFoundError, DatabaseError, ExternalAPIError
 from datetime import datetime, timezone
 from app.services.user_service import Service
+from app.core.config import settings
+from tests.utils import mock_pages, mock_writer
 from sqlalchemy.exc import SQLAlchemyError
 from app.data_access.database import async_session
 
@@ -33,11 +37,9 @@ async def test_user_in_db_with_projects(mocker):
         Project(id=1, name="Project1", description="Test project 1", stars=10, forks=2, user_id=1),
         Project(id=2, name="Project2", description="Test project 2", stars=5, forks=1, user_id=1),
     ]
-    mock_get_user = mocker.AsyncMock(return_value=User(id=1, username=username))
     mock_get_projects = mocker.AsyncMock(return_value=projects)
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
-    mocker.patch.object(ProjectRepository, 'get_by_user_id', mock_get_projects)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_projects)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -57,11 +59,9 @@ async def test_user_in_db_with_projects(mocker):
 async def test_user_in_db_no_projects(mocker):
     username = "user-no-projects"  
 
-    mock_get_user = mocker.AsyncMock(return_value=User(id=2, username=username))
     mock_get_projects = mocker.AsyncMock(return_value=[])
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
-    mocker.patch.object(ProjectRepository, 'get_by_user_id', mock_get_projects)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_projects)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -103,14 +103,12 @@ async def test_user_not_in_db_exists_on_github_with_projects(mocker):
     ]
 
     mock_get_user = mocker.AsyncMock(return_value=None)
-    mock_fetch_projects = mocker.AsyncMock(return_value=github_projects)
-    mock_create_user = mocker.AsyncMock(return_value=User(id=1, username=username))
-    mock_create_projects = mocker.AsyncMock(return_value=projects)
+    mock_fetch_projects = mock_pages(github_projects)
+    mock_create_user = mock_writer(projects)
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
-    mocker.patch.object(GitHubAPIClient, 'fetch_user_projects', mock_fetch_projects)
-    mocker.patch.object(UserRepository, 'create', mock_create_user)
-    mocker.patch.object(ProjectRepository, 'create_projects', mock_create_projects)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_user)
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_fetch_projects)
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -132,14 +130,12 @@ async def test_user_not_in_db_exists_on_github_no_projects(mocker):
     username = "github-user-no-projects" 
 
     mock_get_user = mocker.AsyncMock(return_value=None)
-    mock_fetch_projects = mocker.AsyncMock(return_value=[])
-    mock_create_user = mocker.AsyncMock(return_value=User(id=1, username=username))
-    mock_create_projects = mocker.AsyncMock(return_value=[])
+    mock_fetch_projects = mock_pages([])
+    mock_create_user = mock_writer([])
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
-    mocker.patch.object(GitHubAPIClient, 'fetch_user_projects', mock_fetch_projects)
-    mocker.patch.object(UserRepository, 'create', mock_create_user)
-    mocker.patch.object(ProjectRepository, 'create_projects', mock_create_projects)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_user)
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_fetch_projects)
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -158,10 +154,10 @@ async def test_user_not_in_db_not_on_github(mocker):
     username = "nonexistent-user" 
 
     mock_get_user = mocker.AsyncMock(return_value=None)
-    mock_fetch_projects = mocker.AsyncMock(side_effect=NotFoundError(f"User '{username}' not found on GitHub."))
+    mock_fetch_projects = mock_pages(side_effect=NotFoundError(f"User '{username}' not found on GitHub."))
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
-    mocker.patch.object(GitHubAPIClient, 'fetch_user_projects', mock_fetch_projects)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_user)
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_fetch_projects)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -184,10 +180,10 @@ async def test_github_api_failure(mocker):
     username = "any-user"
 
     mock_get_user = mocker.AsyncMock(return_value=None)
-    mock_fetch_projects = mocker.AsyncMock(side_effect=ExternalAPIError("GitHub API rate limit exceeded"))
+    mock_fetch_projects = mock_pages(side_effect=ExternalAPIError("GitHub API rate limit exceeded"))
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
-    mocker.patch.object(GitHubAPIClient, 'fetch_user_projects', mock_fetch_projects)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_user)
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_fetch_projects)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -375,7 +371,7 @@ async def test_database_error_get_by_username(mocker):
 
     mock_get_user = mocker.AsyncMock(side_effect=DatabaseError("Simulated database error in get_by_username"))
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_user)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -388,12 +384,12 @@ async def test_database_error_create_user(mocker):
     username = "new-user"
 
     mock_get_user = mocker.AsyncMock(return_value=None)
-    mock_fetch_projects = mocker.AsyncMock(return_value=[])
-    mock_create_user = mocker.AsyncMock(side_effect=DatabaseError("Simulated database error in create"))
+    mock_fetch_projects = mock_pages([])
+    mock_create_user = mock_writer(side_effect=DatabaseError("Simulated database error in create"))
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
-    mocker.patch.object(GitHubAPIClient, 'fetch_user_projects', mock_fetch_projects)
-    mocker.patch.object(UserRepository, 'create', mock_create_user)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_user)
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_fetch_projects)
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -406,12 +402,12 @@ async def test_integrity_error_create_user(mocker):
     username = "duplicate-user"
 
     mock_get_user = mocker.AsyncMock(return_value=None)
-    mock_fetch_projects = mocker.AsyncMock(return_value=[])
-    mock_create_user = mocker.AsyncMock(side_effect=DatabaseError("User already exists."))
+    mock_fetch_projects = mock_pages([])
+    mock_create_user = mock_writer(side_effect=DatabaseError("User already exists."))
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
-    mocker.patch.object(GitHubAPIClient, 'fetch_user_projects', mock_fetch_projects)
-    mocker.patch.object(UserRepository, 'create', mock_create_user)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_user)
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_fetch_projects)
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -438,11 +434,9 @@ async def test_database_error_get_most_recent(mocker):
 async def test_database_error_get_by_user_id(mocker):
     username = "existing-user"
 
-    mock_get_user = mocker.AsyncMock(return_value=User(id=1, username=username))
     mock_get_projects = mocker.AsyncMock(side_effect=DatabaseError("Simulated database error in get_by_user_id"))
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
-    mocker.patch.object(ProjectRepository, 'get_by_user_id', mock_get_projects)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_projects)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -464,14 +458,12 @@ async def test_database_error_create_projects(mocker):
     ]
 
     mock_get_user = mocker.AsyncMock(return_value=None)
-    mock_fetch_projects = mocker.AsyncMock(return_value=github_projects)
-    mock_create_user = mocker.AsyncMock(return_value=User(id=1, username=username))
-    mock_create_projects = mocker.AsyncMock(side_effect=DatabaseError("Simulated database error in create_projects"))
+    mock_fetch_projects = mock_pages(github_projects)
+    mock_create_user = mock_writer(add_side_effect=DatabaseError("Simulated database error in create_projects"))
 
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
-    mocker.patch.object(GitHubAPIClient, 'fetch_user_projects', mock_fetch_projects)
-    mocker.patch.object(UserRepository, 'create', mock_create_user)
-    mocker.patch.object(ProjectRepository, 'create_projects', mock_create_projects)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mock_get_user)
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_fetch_projects)
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -546,7 +538,11 @@ the exception can be caught to raise a DatabaseError.
 async def test_unexpected_error_in_user_repository(mocker):
     username = "any-user"
 
-    # Mock the session.execute method to raise an exception within get_by_username
+    # the user is not stored yet and exists on GitHub, so the service creates it through the user repository
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=None))
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_pages([]))
+
+    # Mock the session.execute method to raise an exception within create
     async def mock_execute(*args, **kwargs):
         raise SQLAlchemyError("Unexpected error in session.execute")
 
@@ -582,9 +578,7 @@ async def test_unexpected_error_in_user_repository(mocker):
 async def test_unexpected_error_in_project_repository(mocker):
     username = "existing-user"
 
-    mock_get_user = mocker.AsyncMock(return_value=User(id=1, username=username))
-
-    # Mock the session.execute method to raise an exception within get_by_user_id
+    # Mock the session.execute method to raise an exception within get_by_username
     async def mock_execute(*args, **kwargs):
         raise SQLAlchemyError("Unexpected error in session.execute")
 
@@ -600,13 +594,11 @@ async def test_unexpected_error_in_project_repository(mocker):
             await mock_execute(*args, **kwargs)
 
     # Define a function that returns an instance of MockSession
-    async def mock_async_session():
+    async def mock_read_session(*args):
         return MockSession()
 
-    # Patch the async_session to return the mock session when called
-    mocker.patch('app.data_access.repositories.project_repository.async_session', new=mock_async_session)
-
-    mocker.patch.object(UserRepository, 'get_by_username', mock_get_user)
+    # Patch the read session (get_by_username reads through read_session) to return the mock session when called
+    mocker.patch('app.data_access.repositories.project_repository.read_session', new=mock_read_session)
 
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         response = await ac.get(f"/users/{username}/projects")
@@ -710,3 +702,259 @@ async def test_n_too_large_projects_most_starred():
     assert response.status_code == 422, f"Response content: {response.content}"
 
 
+
+
+
+# TEST CASES FOR /users/batch
+
+def batch_github(repos_by_user, delay=0.0, errors=()):
+    """
+    Stand-in for GitHubAPIClient.iter_user_project_pages serving one page per username, NotFoundError for the others
+    and ExternalAPIError for the usernames in errors. Records the highest number of users fetched at the same time.
+    """
+    stats = {"in_flight": 0, "max_in_flight": 0}
+
+    async def iter_user_project_pages(self, username, validators=None):
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(delay)
+            if username in errors:
+                raise ExternalAPIError("GitHub is down.")
+            if username not in repos_by_user:
+                raise NotFoundError(f"User '{username}' not found on Github.")
+        finally:
+            stats["in_flight"] -= 1
+        yield repos_by_user[username]
+
+    return iter_user_project_pages, stats
+
+
+"""
+1. Every distinct user gets one NDJSON line: stored users are not scraped again, missing users don't fail the batch.
+"""
+
+@pytest.mark.asyncio
+async def test_batch_streams_results(mocker):
+    stored = {"stored-user": [Project(id=1, name="Project1", stars=1, forks=0, user_id=1)]}
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(side_effect=lambda username: stored.get(username)))
+    iter_pages, _ = batch_github({"new-user": [{"name": "repo", "stargazers_count": 1, "forks_count": 0}]})
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', iter_pages)
+    mock_create_user = mock_writer(projects=[Project(id=2, name="repo", stars=1, forks=0, user_id=2)])
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/users/batch", json={"usernames": ["stored-user", "new-user", "ghost", "new-user"]})
+
+    assert response.status_code == 200, f"Response content: {response.content}"
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda r: r["username"])
+    assert results == [
+        {"username": "ghost", "status": "not_found"},
+        {"username": "new-user", "status": "scraped", "projects": 1},
+        {"username": "stored-user", "status": "stored", "projects": 1},
+    ]
+    assert len(mock_create_user.pages) == 1
+
+
+"""
+2. No more than BATCH_CONCURRENCY users are scraped at the same time, and a GitHub error is reported per user.
+"""
+
+@pytest.mark.asyncio
+async def test_batch_concurrency_is_bounded(mocker):
+    mocker.patch.object(settings, 'BATCH_CONCURRENCY', 3)
+    usernames = [f"user-{i}" for i in range(10)]
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=None))
+    iter_pages, stats = batch_github({username: [] for username in usernames}, delay=0.01, errors={"user-5"})
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', iter_pages)
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_writer())
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.post("/users/batch", json={"usernames": usernames})
+
+    results = {result["username"]: result for result in map(json.loads, response.text.splitlines())}
+    assert len(results) == 10
+    assert results["user-5"] == {"username": "user-5", "status": "error", "detail": "External API error."}
+    assert all(results[username]["status"] == "scraped" for username in usernames if username != "user-5")
+    assert stats["max_in_flight"] == 3
+
+
+"""
+3. A consumer that stops early (the client disconnected) cancels the scrapes still running: nothing more is fetched
+   or written.
+"""
+
+@pytest.mark.asyncio
+async def test_batch_stopped_early_cancels_scrapes(mocker):
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=None))
+    iter_pages, _ = batch_github({"fast-user": []})
+    slow_pages, _ = batch_github({"slow-user": []}, delay=0.05)
+    mocker.patch.object(
+        GitHubAPIClient, 'iter_user_project_pages',
+        lambda self, username, validators=None: (slow_pages if username == "slow-user" else iter_pages)(self, username, validators),
+    )
+    mock_create_user = mock_writer()
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
+
+    results = Service.scrape_batch(["fast-user", "slow-user"])
+    assert (await anext(results))["username"] == "fast-user"
+    await results.aclose()
+    await asyncio.sleep(0.1)
+
+    assert len(mock_create_user.pages) == 1 # the fast user's only
+    assert Service._scrapes.in_flight() == 0
+
+"""
+4. Invalid usernames and empty batches are rejected before anything is scraped.
+- status code should be 422
+"""
+
+@pytest.mark.asyncio
+async def test_batch_input_validation(mocker):
+    mock_scrape = mocker.patch.object(Service, 'scrape_batch')
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        invalid = await ac.post("/users/batch", json={"usernames": ["valid-user", "invalid_user!"]})
+        empty = await ac.post("/users/batch", json={"usernames": []})
+
+    assert invalid.status_code == 422, f"Response content: {invalid.content}"
+    assert empty.status_code == 422, f"Response content: {empty.content}"
+    mock_scrape.assert_not_called()
+
+
+
+# TEST CASES FOR streamed /users/{username}/projects (Accept: application/x-ndjson)
+
+"""
+1. A stored user's projects are streamed as NDJSON, the same projects as the JSON response.
+"""
+
+@pytest.mark.asyncio
+async def test_projects_streamed_as_ndjson(sqlite_session, mocker):
+    mocker.patch.object(settings, 'STREAM_BATCH_SIZE', 2)
+    async with UserRepository.create_with_projects(User(username="many-repos")) as writer:
+        await writer.add([{"name": f"repo-{i}", "stargazers_count": i, "forks_count": 0} for i in range(5)])
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        streamed = await ac.get("/users/many-repos/projects", headers={"Accept": "application/x-ndjson"})
+        regular = await ac.get("/users/many-repos/projects")
+
+    assert streamed.status_code == 200, f"Response content: {streamed.content}"
+    assert streamed.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in streamed.text.splitlines()] == regular.json()
+
+
+"""
+2. A cold miss is scraped before streaming, a missing user is still a 404.
+"""
+
+@pytest.mark.asyncio
+async def test_streamed_cold_miss(sqlite_session, mocker):
+    iter_pages, _ = batch_github({"new-user": [{"name": "repo", "description": "d", "stargazers_count": 1, "forks_count": 2}]})
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', iter_pages)
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        scraped = await ac.get("/users/new-user/projects", headers={"Accept": "application/x-ndjson"})
+        missing = await ac.get("/users/ghost/projects", headers={"Accept": "application/x-ndjson"})
+
+    assert scraped.status_code == 200, f"Response content: {scraped.content}"
+    [project] = [json.loads(line) for line in scraped.text.splitlines()]
+    assert (project["name"], project["description"], project["stars"], project["forks"]) == ("repo", "d", 1, 2)
+    assert missing.status_code == 404
+
+
+# TEST CASES FOR pages of /users/{username}/projects
+
+"""
+1. The Link header leads through the pages of a sort until the last page, which has none.
+"""
+
+@pytest.mark.asyncio
+async def test_projects_pages(sqlite_session, mocker):
+    async with UserRepository.create_with_projects(User(username="paged-user")) as writer:
+        await writer.add([{"name": f"repo-{i}", "stargazers_count": i, "forks_count": 0} for i in range(5)])
+
+    pages = []
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        url = "/users/paged-user/projects?limit=2&min_stars=1"
+        while url:
+            response = await ac.get(url)
+            assert response.status_code == 200, f"Response content: {response.content}"
+            pages.append([project["stars"] for project in response.json()])
+            link = response.headers.get("link")
+            url = link[1:link.index(">")] if link else None
+        top = await ac.get("/users/paged-user/projects?sort=name&limit=1")
+
+    assert pages == [[4, 3], [2, 1], []]
+    assert [project["name"] for project in top.json()] == ["repo-0"]
+
+
+"""
+2. A malformed cursor, or one of another sort, is a 400.
+"""
+
+@pytest.mark.asyncio
+async def test_projects_invalid_cursor(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="paged-user")) as writer:
+        await writer.add([{"name": f"repo-{i}", "stargazers_count": i, "forks_count": 0} for i in range(3)])
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        first = await ac.get("/users/paged-user/projects?limit=1")
+        cursor = first.headers["link"].split("after=")[1].split(">")[0]
+        other_sort = await ac.get(f"/users/paged-user/projects?sort=name&after={cursor}")
+        malformed = await ac.get("/users/paged-user/projects?after=not-a-cursor")
+
+    assert other_sort.status_code == 400 and malformed.status_code == 400
+    assert malformed.json() == {"detail": "Invalid cursor."}
+
+
+# TEST CASES FOR the fast read path (FAST_READS)
+
+"""
+1. The three list endpoints answer the same JSON from plain rows as from validated models, with orjson or without.
+"""
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_orjson", [True, False])
+async def test_fast_reads_same_responses(sqlite_session, mocker, use_orjson):
+    if use_orjson:
+        pytest.importorskip("orjson")
+    else:
+        mocker.patch('app.api.responses.orjson', None)
+    for username, stars in [("first-user", [3, 1]), ("second-user", [])]:
+        async with UserRepository.create_with_projects(User(username=username)) as writer:
+            await writer.add([{"name": f"repo-{s}", "description": "é", "stargazers_count": s, "forks_count": 1} for s in stars])
+    urls = ["/users/first-user/projects", "/users/second-user/projects", "/users/recent/5", "/projects/most-starred/5"]
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        regular = [await ac.get(url) for url in urls]
+        mocker.patch.object(settings, 'FAST_READS', True)
+        mock_get = mocker.patch.object(ProjectRepository, 'get_by_username')
+        fast = [await ac.get(url) for url in urls]
+
+    for regular_response, fast_response in zip(regular, fast):
+        assert fast_response.status_code == 200
+        assert fast_response.headers["content-type"] == "application/json"
+        assert fast_response.json() == regular_response.json()
+    mock_get.assert_not_called()
+
+
+"""
+2. A cold miss and a missing user behave as on the regular path.
+"""
+
+@pytest.mark.asyncio
+async def test_fast_reads_cold_miss(sqlite_session, mocker):
+    mocker.patch.object(settings, 'FAST_READS', True)
+    iter_pages, _ = batch_github({"new-user": [{"name": "repo", "stargazers_count": 1, "forks_count": 2}]})
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', iter_pages)
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        scraped = await ac.get("/users/new-user/projects")
+        stored = await ac.get("/users/new-user/projects")
+        missing = await ac.get("/users/ghost/projects")
+
+    assert scraped.status_code == 200 and scraped.json() == stored.json()
+    assert [(p["name"], p["stars"], p["forks"]) for p in stored.json()] == [("repo", 1, 2)]
+    assert missing.status_code == 404
@@ -0,0 +1,132 @@
+# tests/test_metrics.py
+
+import pytest
+from httpx import AsyncClient
+from httpx._transports.asgi import ASGITransport
+from app.main import app
+from app.core import metrics
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS, DB_STATEMENTS, HTTP_REQUEST_DURATION, REPOSITORY_CALL_DURATION, Histogram, track_github_client
+from app.data_access.repositories.project_repository import ProjectRepository
+from app.data_access.repositories.user_repository import UserRepository
+from app.external_services.github_api import GitHubAPIClient
+from app.external_services.token_pool import TokenPool
+from app.models import Project, User
+
+
+transport = ASGITransport(app=app)
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    """
+    The metrics are global, every test starts from zero.
+    """
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+# TEST CASES FOR the metrics
+
+"""
+1. A histogram renders cumulative buckets (a value on a bound falls in it), +Inf, the sum and the count of every
+   label set, with the label values escaped.
+"""
+
+def test_histogram_render(mocker):
+    mocker.patch.object(metrics, 'REGISTRY', [])
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.1, '/a"b')
+    histogram.observe(0.5, '/a"b')
+    histogram.observe(3.0, '/a"b')
+
+    assert metrics.render().splitlines() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a\\"b",le="0.1"} 1',
+        'latency_seconds_bucket{route="/a\\"b",le="1.0"} 2',
+        'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 3',
+        'latency_seconds_sum{route="/a\\"b"} 3.6',
+        'latency_seconds_count{route="/a\\"b"} 3',
+    ]
+
+
+"""
+2. The repository methods are timed by outcome, the statements they send are counted under their name and the
+   cache lookups of their reads as hits and misses.
+"""
+
+@pytest.mark.asyncio
+async def test_repository_metrics(sqlite_session):
+    await UserRepository.create(User(username="octocat"))
+    assert await UserRepository.get_by_username("octocat") is not None
+    statements = DB_STATEMENTS.values[("UserRepository.get_by_username",)]
+    assert await UserRepository.get_by_username("octocat") is not None
+    with pytest.raises(TypeError):
+        await UserRepository.get_by_username()
+
+    assert REPOSITORY_CALL_DURATION.count("UserRepository.create", "ok") == 1
+    assert REPOSITORY_CALL_DURATION.count("UserRepository.get_by_username", "ok") == 2
+    assert REPOSITORY_CALL_DURATION.count("UserRepository.get_by_username", "error") == 1
+    assert DB_STATEMENTS.values[("UserRepository.create",)] >= 1
+    # the second read is a cache hit
+    assert DB_STATEMENTS.values[("UserRepository.get_by_username",)] == statements
+    assert CACHE_REQUESTS.values == {("user_by_username", "miss"): 1, ("user_by_username", "hit"): 1}
+
+
+"""
+3. GET /metrics serves the Prometheus text format, the requests are labeled with their route template and status,
+   and nothing is collected with METRICS_ENABLED off.
+"""
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(mocker):
+    projects = [Project(id=1, name="Project1", stars=1, forks=0, user_id=1)]
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=projects))
+
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        assert (await ac.get("/users/octocat/projects")).status_code == 200
+        assert (await ac.get("/unknown")).status_code == 404
+        response = await ac.get("/metrics")
+
+        mocker.patch.object(settings, 'METRICS_ENABLED', False)
+        await ac.get("/users/octocat/projects")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/users/{username}/projects",status="200"} 1' in response.text
+    assert HTTP_REQUEST_DURATION.count("GET", "/users/{username}/projects", "200") == 1
+    assert HTTP_REQUEST_DURATION.count("GET", "unmatched", "404") == 1
+
+
+
+"""
+4. A tracked GitHub client exports the rate limit of every token and its circuit breaker state, the remaining quota
+   of a token is the whole limit again once its reset has passed, and nothing once it's untracked.
+"""
+
+def test_github_client_metrics():
+    github_client = GitHubAPIClient(tokens=TokenPool(["ghp_aaaa1111", "ghp_bbbb2222"]))
+    first, second = github_client.tokens.budgets
+    first.limit, first.remaining, first.reset_at = 5000, 42, 4102444800
+    second.limit, second.remaining, second.reset_at = 5000, 0, 1
+    for _ in range(github_client.breaker.failure_threshold):
+        github_client.breaker.failure()
+
+    track_github_client(github_client)
+    try:
+        text = metrics.render()
+    finally:
+        track_github_client(github_client, tracked=False)
+
+    assert "# TYPE github_rate_limit_remaining gauge" in text
+    assert f'github_rate_limit_remaining{{token="{first.name}"}} 42' in text
+    assert f'github_rate_limit_remaining{{token="{second.name}"}} 5000' in text
+    assert f'github_rate_limit{{token="{first.name}"}} 5000' in text
+    assert f'github_rate_limit_reset_timestamp_seconds{{token="{first.name}"}} 4102444800' in text
+    assert 'circuit_breaker_state{name="GitHub API"} 2' in text
+    assert f'circuit_breaker_failures{{name="GitHub API"}} {github_client.breaker.failure_threshold}' in text
+    assert "ghp_aaaa1111" not in text
+    assert "github_rate_limit_remaining{" not in metrics.render()
@@ -0,0 +1,131 @@
+# tests/test_migrations.py
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from app.data_access.migrations import upgrade_schema
+from app.models import User
+
+
+# the schema created by the first version of the models
+BASELINE_SCHEMA = [
+    "CREATE TABLE user (id INTEGER NOT NULL, username VARCHAR NOT NULL, created_at DATETIME NOT NULL, PRIMARY KEY (id))",
+    "CREATE UNIQUE INDEX ix_user_username ON user (username)",
+    "CREATE TABLE project (id INTEGER NOT NULL, name VARCHAR NOT NULL, description VARCHAR, stars INTEGER NOT NULL, "
+    "forks INTEGER NOT NULL, user_id INTEGER NOT NULL, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id))",
+    "INSERT INTO user (id, username, created_at) VALUES (1, 'old-user', '2024-11-18 12:00:00')",
+    "INSERT INTO project (name, description, stars, forks, user_id) VALUES ('old-project', NULL, 3, 0, 1)",
+]
+
+
+def index_names(conn, table):
+    return {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+"""
+1. A database created before the indexes existed gets them, and keeps its data.
+"""
+
+@pytest.mark.asyncio
+async def test_upgrade_schema_creates_missing_indexes():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            await conn.execute(text(statement))
+
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+        assert {"ix_project_stars_id", "ix_project_user_id"} <= await conn.run_sync(index_names, "project")
+        assert {"ix_user_created_at_id", "ix_user_username"} <= await conn.run_sync(index_names, "user")
+        assert (await conn.execute(text("SELECT name FROM project"))).scalars().all() == ["old-project"]
+    await engine.dispose()
+
+
+"""
+2. Columns added to the models later are added to the existing table, the existing rows get NULL.
+"""
+
+@pytest.mark.asyncio
+async def test_upgrade_schema_adds_missing_columns():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            await conn.execute(text(statement))
+
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+        assert "ix_user_last_fetched_at" in await conn.run_sync(index_names, "user")
+        rows = (await conn.execute(text("SELECT username, last_fetched_at FROM user"))).all()
+        assert [tuple(row) for row in rows] == [("old-user", None)]
+    await engine.dispose()
+
+
+"""
+3. Running the upgrade again on an up-to-date database does nothing.
+"""
+
+@pytest.mark.asyncio
+async def test_upgrade_schema_is_idempotent():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+        await conn.run_sync(upgrade_schema)
+        assert "ix_project_stars_id" in await conn.run_sync(index_names, "project")
+    await engine.dispose()
+
+
+"""
+4. The leaderboard and recency queries are served by the indexes instead of a full scan and sort.
+"""
+
+@pytest.mark.asyncio
+async def test_leaderboard_queries_use_indexes():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+        starred = (await conn.execute(text("EXPLAIN QUERY PLAN SELECT * FROM project ORDER BY stars DESC, id DESC LIMIT 10"))).all()
+        recent = (await conn.execute(text("EXPLAIN QUERY PLAN SELECT * FROM user ORDER BY created_at DESC, id DESC LIMIT 10"))).all()
+    await engine.dispose()
+
+    assert "ix_project_stars_id" in starred[0][-1] and "TEMP B-TREE" not in str(starred)
+    assert "ix_user_created_at_id" in recent[0][-1] and "TEMP B-TREE" not in str(recent)
+
+
+"""
+5. On the test database (SQLite, or PostgreSQL with TEST_DATABASE_URL) the tables created by create_all have every
+   index of the models, and the upgrade finds nothing to do.
+"""
+
+@pytest.mark.asyncio
+async def test_upgrade_schema_on_test_database(sqlite_session):
+    engine = sqlite_session.kw["bind"]
+    async with engine.begin() as conn:
+        await conn.run_sync(upgrade_schema)
+        for table in SQLModel.metadata.sorted_tables:
+            assert {index.name for index in table.indexes} <= await conn.run_sync(index_names, table.name)
+
+
+"""
+6. A user stored without validators gets SQL NULL, the JSON 'null' stored by the earlier models is replaced by it.
+"""
+
+@pytest.mark.asyncio
+async def test_github_validators_null(sqlite_session):
+    async with sqlite_session() as session:
+        session.add(User(username="new-user"))
+        await session.commit()
+        await session.execute(text(
+            "INSERT INTO \"user\" (username, created_at, github_validators) VALUES ('old-user', '2024-11-18 12:00:00', 'null')"
+        ))
+        await session.commit()
+
+    engine = sqlite_session.kw["bind"]
+    async with engine.begin() as conn:
+        await conn.run_sync(upgrade_schema)
+        rows = (await conn.execute(text("SELECT username FROM \"user\" WHERE github_validators IS NULL ORDER BY username"))).all()
+
+    assert [row[0] for row in rows] == ["new-user", "old-user"]
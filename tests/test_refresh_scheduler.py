@@ -0,0 +1,206 @@
+# tests/test_refresh_scheduler.py
+
+import httpx
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlmodel import select
+from app.core.config import settings
+from app.core.exceptions import ExternalAPIError
+from app.models import User
+from app.data_access.leaderboard import leaderboard
+from app.data_access.repositories.user_repository import UserRepository
+from app.data_access.repositories.project_repository import ProjectRepository
+from app.external_services.github_api import GitHubAPIClient
+from app.services.refresh_scheduler import RefreshScheduler
+from app.services.user_service import Service
+from tests.utils import mock_pages
+from tests.test_github_api import etag_github, growing_github
+from tests.test_repositories import count_queries
+
+
+
+def repos(*stars):
+    return [{"name": f"repo-{s}", "stargazers_count": s, "forks_count": 0} for s in stars]
+
+
+async def store_user(session_factory, username, stars, fetched_ago=timedelta(days=1)):
+    """
+    Store a user with projects, last fetched from GitHub fetched_ago.
+    """
+    async with UserRepository.create_with_projects(User(username=username)) as writer:
+        await writer.add(repos(*stars))
+    async with session_factory() as session:
+        await session.execute(
+            update(User).where(User.username == username).values(last_fetched_at=datetime.utcnow() - fetched_ago)
+        )
+        await session.commit()
+
+
+def github_pages(pages_by_user):
+    """
+    Stand-in for GitHubAPIClient.iter_user_project_pages serving the given pages per username, and recording the users.
+    """
+    fetched = []
+
+    async def iter_user_project_pages(self, username, validators=None):
+        fetched.append(username)
+        for page in pages_by_user[username]:
+            yield page
+        if validators is not None:
+            validators.complete = True
+
+    return iter_user_project_pages, fetched
+
+
+# TEST CASES FOR the background refresh
+
+"""
+1. A stale user gets its projects replaced, the leaderboard follows, and last_fetched_at moves forward.
+"""
+
+@pytest.mark.asyncio
+async def test_stale_user_refreshed(sqlite_session, mocker):
+    await store_user(sqlite_session, "stale", [100, 5])
+    await store_user(sqlite_session, "other", [50], fetched_ago=timedelta(0))
+    iter_pages, fetched = github_pages({"stale": [repos(7), repos(1)]})
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', iter_pages)
+
+    refreshed = await RefreshScheduler(Service.refresh_user).run_once()
+
+    assert refreshed == 1 and fetched == ["stale"]
+    assert sorted(p.stars for p in await ProjectRepository.get_by_username("stale")) == [1, 7]
+    # the 100 stars project is gone, the leaderboard is recomputed from the projects table
+    assert [p.stars for p in await ProjectRepository.get_most_starred(3)] == [50, 7, 1]
+    assert await leaderboard.check()
+    async with sqlite_session() as session:
+        user = (await session.execute(select(User).where(User.username == "stale"))).scalars().one()
+    assert user.last_fetched_at > datetime.utcnow() - timedelta(minutes=1)
+
+
+"""
+2. Fresh users are left alone, stale users are refreshed the most read first, within the GitHub budget
+   (split between the WEB_CONCURRENCY workers).
+"""
+
+@pytest.mark.asyncio
+async def test_most_read_refreshed_first_within_budget(sqlite_session, mocker):
+    mocker.patch.object(settings, 'REFRESH_REQUESTS_PER_HOUR', 4)
+    mocker.patch.object(settings, 'WEB_CONCURRENCY', 2)
+    await store_user(sqlite_session, "fresh", [1], fetched_ago=timedelta(seconds=1))
+    await store_user(sqlite_session, "oldest", [1], fetched_ago=timedelta(days=3))
+    await store_user(sqlite_session, "old", [1], fetched_ago=timedelta(days=2))
+    await store_user(sqlite_session, "popular", [1], fetched_ago=timedelta(days=1))
+    iter_pages, fetched = github_pages({name: [repos(2)] for name in ["fresh", "oldest", "old", "popular"]})
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', iter_pages)
+
+    scheduler = RefreshScheduler(Service.refresh_user)
+    scheduler.record_read("popular")
+    scheduler.record_read("fresh")
+    refreshed = await scheduler.run_once()
+
+    assert refreshed == 2
+    assert fetched == ["popular", "oldest"]
+    assert "popular" not in scheduler.reads and scheduler.reads["fresh"] == 1
+
+
+"""
+3. A user claimed by another worker since it was found stale is skipped.
+"""
+
+@pytest.mark.asyncio
+async def test_claimed_user_skipped(sqlite_session, mocker):
+    await store_user(sqlite_session, "claimed", [1])
+    iter_pages, fetched = github_pages({"claimed": [repos(2)]})
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', iter_pages)
+    user = await UserRepository.get_by_username("claimed")
+    before = datetime.utcnow() - timedelta(hours=1)
+
+    assert await UserRepository.claim_refresh(user, before)
+    assert not await UserRepository.claim_refresh(user, before)
+    assert await RefreshScheduler(Service.refresh_user).run_once() == 0
+    assert fetched == []
+
+
+"""
+4. A failed refresh keeps the stored projects, and stops the run until GitHub is reachable again.
+"""
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_projects(sqlite_session, mocker):
+    await store_user(sqlite_session, "first", [3])
+    await store_user(sqlite_session, "second", [4])
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_pages(side_effect=ExternalAPIError("rate limited")))
+    refresh = mocker.AsyncMock(side_effect=Service.refresh_user)
+
+    assert await RefreshScheduler(refresh).run_once() == 0
+
+    refresh.assert_awaited_once()
+    assert [p.stars for p in await ProjectRepository.get_by_username("first")] == [3]
+
+
+"""
+5. Reads of a stored user are served from the database and counted for the scheduler.
+"""
+
+@pytest.mark.asyncio
+async def test_reads_served_stale_and_counted(mocker):
+    scheduler = RefreshScheduler(Service.refresh_user)
+    mocker.patch.object(Service, 'refresh_scheduler', scheduler)
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=[]))
+    mock_pages_ = mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages')
+
+    await Service.get_user_projects_service("reader")
+    await Service.get_user_projects_service("reader")
+
+    assert scheduler.reads["reader"] == 2
+    mock_pages_.assert_not_called()
+
+
+"""
+6. The ETags of a scrape are stored with the user, a refresh answered with 304 Not Modified writes nothing.
+"""
+
+@pytest.mark.asyncio
+async def test_not_modified_refresh_skips_writes(sqlite_session, mocker):
+    github_pages = [[{"name": "etagged", "stargazers_count": 1, "forks_count": 0}]]
+    handler, responses = etag_github(github_pages)
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://api.github.com")
+    mocker.patch.object(Service, 'github_client', GitHubAPIClient(client=http_client))
+    await Service.get_user_projects_service("etag-user")
+    user = (await UserRepository.get_stale(datetime.utcnow(), 1))[0]
+    stored = user.github_validators
+    assert len(stored) == 1 and stored[0]["etag"]
+
+    statements = count_queries(sqlite_session)
+    assert await Service.refresh_user(user) is None
+    assert statements == []
+
+    github_pages[0] = [{"name": "etagged", "stargazers_count": 2, "forks_count": 0}]
+    projects = await Service.refresh_user(user)
+    assert [p.stars for p in projects] == [2]
+    assert (await UserRepository.get_stale(datetime.utcnow(), 1))[0].github_validators != stored
+    assert responses == [(1, 200), (1, 304), (1, 200)]
+    await http_client.aclose()
+
+
+"""
+7. A repository added to a user whose first page is not modified is stored by the refresh, and none of the stored
+   ones is deleted.
+"""
+
+@pytest.mark.asyncio
+async def test_refresh_page_count_grows(sqlite_session, mocker):
+    mocker.patch.object(settings, 'GITHUB_PER_PAGE', 2)
+    names = ["a", "b", "c", "d"]
+    handler, responses = growing_github(names)
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="https://api.github.com")
+    mocker.patch.object(Service, 'github_client', GitHubAPIClient(client=http_client))
+    await Service.get_user_projects_service("growing-user")
+    user = (await UserRepository.get_stale(datetime.utcnow(), 1))[0]
+
+    names.insert(2, "bb")
+    await Service.refresh_user(user)
+
+    assert sorted(p.name for p in await ProjectRepository.get_by_username("growing-user")) == ["a", "b", "bb", "c", "d"]
+    await http_client.aclose()
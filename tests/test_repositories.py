@@ -0,0 +1,324 @@
+# tests/test_repositories.py - repositories against a real (in-memory SQLite) database
+
+import pytest
+from sqlalchemy import event, text
+from app.models import User
+from app.data_access.repositories.user_repository import UserRepository
+from app.data_access.repositories.project_repository import ProjectRepository
+from app.data_access.leaderboard import leaderboard
+
+
+
+def count_queries(session_factory):
+    """
+    Count the SQL statements sent through the engine behind a session factory.
+    """
+    statements = []
+    event.listen(session_factory.kw["bind"].sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+# TEST CASES FOR ProjectRepository.get_by_username
+
+"""
+1. A stored user with projects is read in a single query.
+"""
+
+@pytest.mark.asyncio
+async def test_get_by_username_single_query(sqlite_session):
+    user = await UserRepository.create(User(username="joined-user"))
+    await ProjectRepository.create_projects(user.id, [
+        {"name": "one", "stargazers_count": 1},
+        {"name": "two", "stargazers_count": 2},
+    ])
+    statements = count_queries(sqlite_session)
+
+    projects = await ProjectRepository.get_by_username("joined-user")
+
+    assert sorted(p.name for p in projects) == ["one", "two"]
+    assert len(statements) == 1
+
+
+"""
+2. A stored user without projects gets an empty list, an unknown user gets None.
+"""
+
+@pytest.mark.asyncio
+async def test_get_by_username_no_projects_and_unknown_user(sqlite_session):
+    await UserRepository.create(User(username="empty-user"))
+
+    assert await ProjectRepository.get_by_username("empty-user") == []
+    assert await ProjectRepository.get_by_username("unknown-user") is None
+
+
+"""
+3. A cached user is served without touching the database, new projects invalidate it.
+"""
+
+@pytest.mark.asyncio
+async def test_get_by_username_cached(sqlite_session):
+    user = await UserRepository.create(User(username="hot-user"))
+    await ProjectRepository.get_by_username("hot-user")
+    statements = count_queries(sqlite_session)
+
+    assert await ProjectRepository.get_by_username("hot-user") == []
+    assert statements == []
+
+    await ProjectRepository.create_projects(user.id, [{"name": "new", "stargazers_count": 1}])
+    assert [p.name for p in await ProjectRepository.get_by_username("hot-user")] == ["new"]
+
+
+# TEST CASES FOR UserRepository.create_with_projects
+
+def repos(count, offset=0):
+    return [{"name": f"repo-{i}", "stargazers_count": i, "forks_count": 1} for i in range(offset, offset + count)]
+
+
+"""
+1. The user and every page of projects are written in one transaction, with one multi-row INSERT per page.
+"""
+
+@pytest.mark.asyncio
+async def test_create_with_projects_bulk_insert(sqlite_session):
+    statements = count_queries(sqlite_session)
+
+    async with UserRepository.create_with_projects(User(username="bulk-user")) as writer:
+        await writer.add(repos(100))
+        await writer.add(repos(50, offset=100))
+
+    inserts = [s for s in statements if s.startswith(("INSERT INTO user", "INSERT INTO project"))]
+    assert len(inserts) == 3 # the user, then one per page
+    assert sorted(p.stars for p in writer.projects) == list(range(150))
+    assert all(p.id is not None and p.user_id == writer.user.id for p in writer.projects)
+    assert len(await ProjectRepository.get_by_username("bulk-user")) == 150
+
+
+"""
+2. An error while adding pages rolls back the user and the projects written so far.
+"""
+
+@pytest.mark.asyncio
+async def test_create_with_projects_rolls_back(sqlite_session):
+    with pytest.raises(RuntimeError):
+        async with UserRepository.create_with_projects(User(username="half-user")) as writer:
+            await writer.add(repos(10))
+            raise RuntimeError("GitHub page failed")
+
+    assert await ProjectRepository.get_by_username("half-user") is None
+    assert await ProjectRepository.get_most_starred(5) == []
+
+
+"""
+3. A user that already exists is not written again, the stored projects are returned.
+"""
+
+@pytest.mark.asyncio
+async def test_create_with_projects_existing_user(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="raced-user")) as writer:
+        await writer.add(repos(3))
+
+    async with UserRepository.create_with_projects(User(username="raced-user")) as writer:
+        await writer.add(repos(3))
+
+    assert writer.existing
+    assert sorted(p.name for p in writer.projects) == ["repo-0", "repo-1", "repo-2"]
+    assert len(await ProjectRepository.get_by_username("raced-user")) == 3
+
+
+"""
+4. A repository stored under another user (transferred on GitHub since) moves to the new user on their first scrape,
+   and the leaderboard follows it.
+"""
+
+@pytest.mark.asyncio
+async def test_create_with_projects_moves_transferred_repository(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="old-owner")) as old:
+        await old.add([{"id": 42, "name": "moved", "stargazers_count": 100}, {"id": 1, "name": "kept", "stargazers_count": 1}])
+    assert [p.name for p in await ProjectRepository.get_by_username("old-owner")] == ["moved", "kept"]
+
+    async with UserRepository.create_with_projects(User(username="new-owner")) as new:
+        await new.add([{"id": 42, "name": "moved", "stargazers_count": 101}])
+
+    assert new.moved_from == {old.user.id: "old-owner"}
+    [project] = await ProjectRepository.get_by_username("new-owner")
+    assert (project.id, project.stars) == (old.projects[0].id, 101)
+    assert [p.name for p in await ProjectRepository.get_by_username("old-owner")] == ["kept"]
+    assert [(p.name, p.user_id) for p in await ProjectRepository.get_most_starred(2)] == [("moved", new.user.id), ("kept", old.user.id)]
+    assert await leaderboard.check()
+
+
+# TEST CASES FOR ProjectRepository.stream_by_user_id
+
+"""
+1. The projects come in batches of plain dicts from one query, in id order, with the fields of the API model.
+"""
+
+@pytest.mark.asyncio
+async def test_stream_by_user_id_batches(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="streamed-user")) as writer:
+        await writer.add(repos(5))
+    statements = count_queries(sqlite_session)
+
+    batches = [batch async for batch in ProjectRepository.stream_by_user_id(writer.user.id, batch_size=2)]
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [project["name"] for batch in batches for project in batch] == [f"repo-{i}" for i in range(5)]
+    assert set(batches[0][0]) == {"id", "name", "description", "stars", "forks", "user_id"}
+    assert len([s for s in statements if "FROM project" in s]) == 1
+    assert await UserRepository.get_id_by_username("streamed-user") == writer.user.id
+    assert await UserRepository.get_id_by_username("nobody") is None
+
+
+# TEST CASES FOR ProjectRepository.get_page
+
+"""
+1. Walking the pages of every sort returns each project once, in order, with ties broken by id.
+"""
+
+@pytest.mark.asyncio
+async def test_get_page_keyset(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="paged-user")) as writer:
+        await writer.add([{"name": f"repo-{i % 4}-{i}", "stargazers_count": i % 3, "forks_count": i % 2} for i in range(10)])
+    user_id = writer.user.id
+    projects = writer.projects
+    expected = {
+        "stars": sorted(projects, key=lambda p: (p.stars, p.id), reverse=True),
+        "forks": sorted(projects, key=lambda p: (p.forks, p.id), reverse=True),
+        "name": sorted(projects, key=lambda p: (p.name, p.id)),
+    }
+
+    for sort, field in [("stars", "stars"), ("forks", "forks"), ("name", "name")]:
+        pages, after = [], None
+        while True:
+            page = await ProjectRepository.get_page(user_id, sort, limit=3, after=after)
+            pages.append(page)
+            if len(page) < 3:
+                break
+            after = (getattr(page[-1], field), page[-1].id)
+        assert [len(page) for page in pages] == [3, 3, 3, 1]
+        assert [p.id for page in pages for p in page] == [p.id for p in expected[sort]]
+
+
+"""
+2. min_stars filters in the query, and every sort is served by its (user_id, <sort>, id) index.
+"""
+
+@pytest.mark.asyncio
+async def test_get_page_filter_and_indexes(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="filtered-user")) as writer:
+        await writer.add(repos(10))
+
+    page = await ProjectRepository.get_page(writer.user.id, "forks", limit=100, min_stars=7)
+    assert sorted(p.stars for p in page) == [7, 8, 9]
+
+    async with sqlite_session() as session:
+        for field in ["stars", "forks", "name"]:
+            plan = await session.execute(text(
+                f"EXPLAIN QUERY PLAN SELECT * FROM project WHERE user_id = 1 AND ({field}, id) < ('x', 5) "
+                f"ORDER BY {field} DESC, id DESC LIMIT 3"
+            ))
+            details = " ".join(row[-1] for row in plan.all())
+            assert f"ix_project_user_id_{field}_id" in details and "TEMP B-TREE" not in details
+
+
+# TEST CASES FOR UserRepository.refresh_projects (sync)
+
+def github_repos(*repos):
+    return [{"id": id, "name": name, "stargazers_count": stars, "forks_count": 0} for id, name, stars in repos]
+
+
+async def refresh(username, *pages, complete=True):
+    user = await UserRepository.get_by_username(username)
+    async with UserRepository.refresh_projects(user) as sync:
+        for page in pages:
+            await sync.add(page)
+        sync.complete = complete
+    return sync
+
+
+"""
+1. Only the changes are written: changed and new repositories in one upsert per page, vanished ones deleted,
+   unchanged ones untouched, and the projects keep their ids.
+"""
+
+@pytest.mark.asyncio
+async def test_refresh_syncs_changes(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="synced-user")) as writer:
+        await writer.add(github_repos((1, "same", 5), (2, "starred", 1), (3, "old-name", 2), (4, "gone", 9)))
+    ids = {p.github_id: p.id for p in writer.projects}
+    statements = count_queries(sqlite_session)
+
+    sync = await refresh("synced-user", github_repos((1, "same", 5), (2, "starred", 10)), github_repos((3, "new-name", 2), (5, "new", 0)))
+
+    writes = [s for s in statements if s.startswith(("INSERT INTO project", "UPDATE project", "DELETE FROM project"))]
+    assert len(writes) == 3 # an upsert per page, then the delete
+    assert all("ON CONFLICT (github_id) DO UPDATE" in s for s in writes[:2]) and writes[2].startswith("DELETE")
+    assert (len(sync.written), sync.deleted, sync.unchanged) == (3, 1, 1)
+    stored = {p.github_id: p for p in await ProjectRepository.get_by_username("synced-user")}
+    assert {id: (p.name, p.stars) for id, p in stored.items()} == {
+        1: ("same", 5), 2: ("starred", 10), 3: ("new-name", 2), 5: ("new", 0),
+    }
+    assert all(stored[id].id == ids[id] for id in (1, 2, 3))
+    assert [p.stars for p in await ProjectRepository.get_most_starred(2)] == [10, 5]
+    assert await leaderboard.check()
+
+
+"""
+2. An unchanged user writes no project at all, and projects stored without a GitHub repo id get theirs without duplicates.
+"""
+
+@pytest.mark.asyncio
+async def test_refresh_unchanged_and_legacy(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="legacy-user")) as writer:
+        await writer.add([{"name": "legacy", "stargazers_count": 3, "forks_count": 0}])
+
+    first = await refresh("legacy-user", github_repos((7, "legacy", 3)))
+    statements = count_queries(sqlite_session)
+    second = await refresh("legacy-user", github_repos((7, "legacy", 3)))
+
+    assert (len(first.written), first.deleted) == (1, 0)
+    assert not second.changed and second.unchanged == 1
+    assert not [s for s in statements if s.startswith(("INSERT INTO project", "UPDATE project", "DELETE FROM project"))]
+    [project] = await ProjectRepository.get_by_username("legacy-user")
+    assert (project.id, project.github_id) == (writer.projects[0].id, 7)
+
+
+"""
+3. A fetch that may have missed pages (not complete) writes the changes but deletes nothing, the projects it
+   didn't see are kept.
+"""
+
+@pytest.mark.asyncio
+async def test_incomplete_refresh_keeps_unfetched(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="short-fetch")) as writer:
+        await writer.add(github_repos((1, "a", 1), (2, "b", 2), (3, "c", 3)))
+
+    sync = await refresh("short-fetch", github_repos((1, "a", 1), (2, "b", 20)), complete=False)
+
+    assert (len(sync.written), sync.deleted, sync.kept) == (1, 0, 1)
+    assert sorted(p.name for p in sync.projects) == ["a", "b", "c"]
+    stored = await ProjectRepository.get_by_username("short-fetch")
+    assert sorted((p.name, p.stars) for p in stored) == [("a", 1), ("b", 20), ("c", 3)]
+    assert await leaderboard.check()
+
+
+"""
+4. A project stored without a GitHub repo id takes its id even if another user's project holds it (the repository
+   was transferred): the other user's copy is removed.
+"""
+
+@pytest.mark.asyncio
+async def test_refresh_legacy_takes_transferred_repository(sqlite_session):
+    async with UserRepository.create_with_projects(User(username="legacy-owner")) as writer:
+        await writer.add([{"name": "moved", "stargazers_count": 3, "forks_count": 0}])
+    async with UserRepository.create_with_projects(User(username="previous-owner")) as previous:
+        await previous.add(github_repos((7, "moved", 50)))
+
+    sync = await refresh("legacy-owner", github_repos((7, "moved", 60)))
+
+    assert sync.moved_from == {previous.user.id: "previous-owner"}
+    assert await ProjectRepository.get_by_username("previous-owner") == []
+    [project] = await ProjectRepository.get_by_username("legacy-owner")
+    assert (project.id, project.github_id, project.stars) == (writer.projects[0].id, 7, 60)
+    assert [(p.name, p.user_id) for p in await ProjectRepository.get_most_starred(5)] == [("moved", writer.user.id)]
+    assert await leaderboard.check()
@@ -0,0 +1,114 @@
+# tests/test_user_service.py
+
+import asyncio
+import pytest
+from app.models import Project
+from app.data_access.repositories.user_repository import UserRepository
+from app.data_access.repositories.project_repository import ProjectRepository
+from app.external_services.github_api import GitHubAPIClient
+from app.core.exceptions import NotFoundError
+from app.core.single_flight import SingleFlight
+from app.services.user_service import Service
+from tests.utils import mock_pages, mock_writer
+
+
+
+# TEST CASES FOR request coalescing (single-flight)
+
+"""
+1. Concurrent cold misses for the same user run one scrape and all get its result.
+"""
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_scrape(mocker):
+    username = "bursty-user"
+    github_projects = [{"name": "Repo", "description": None, "stargazers_count": 3, "forks_count": 0}]
+    started = 0
+
+    async def slow_pages(self, username, validators=None):
+        nonlocal started
+        started += 1
+        await asyncio.sleep(0.05)
+        yield github_projects
+
+    mock_create_user = mock_writer([Project(id=1, name="Repo", stars=3, user_id=1)])
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=None))
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', slow_pages)
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
+
+    results = await asyncio.gather(*[Service.get_user_projects_service(username) for _ in range(200)])
+
+    assert started == 1
+    assert mock_create_user.pages == [github_projects]
+    assert all(result == results[0] for result in results)
+    assert Service._scrapes.in_flight() == 0
+
+
+"""
+2. Every waiting caller gets the error of the shared scrape.
+"""
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_errors(mocker):
+    username = "ghost-user"
+    mock_create_user = mock_writer()
+    mocker.patch.object(ProjectRepository, 'get_by_username', mocker.AsyncMock(return_value=None))
+    mocker.patch.object(GitHubAPIClient, 'iter_user_project_pages', mock_pages(side_effect=NotFoundError("not on GitHub")))
+    mocker.patch.object(UserRepository, 'create_with_projects', mock_create_user)
+
+    results = await asyncio.gather(*[Service.get_user_projects_service(username) for _ in range(10)], return_exceptions=True)
+
+    assert all(isinstance(result, NotFoundError) for result in results)
+    assert mock_create_user.pages == []
+
+
+"""
+3. A cancelled caller does not cancel the call other callers are waiting on, and finished calls are not reused.
+"""
+
+@pytest.mark.asyncio
+async def test_single_flight_cancelled_waiter():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.02)
+        return calls
+
+    first = asyncio.create_task(flight.do("key", work))
+    second = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == 1
+    assert await flight.do("key", work) == 2
+
+
+"""
+4. The call is cancelled with its last caller: nobody is left waiting on its result.
+"""
+
+@pytest.mark.asyncio
+async def test_single_flight_cancelled_by_last_waiter():
+    flight = SingleFlight()
+    finished = False
+
+    async def work():
+        nonlocal finished
+        await asyncio.sleep(0.05)
+        finished = True
+
+    first = asyncio.create_task(flight.do("key", work))
+    second = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    assert flight.in_flight() == 1
+    second.cancel()
+    await asyncio.gather(first, second, return_exceptions=True)
+    await asyncio.sleep(0.1)
+
+    assert not finished
+    assert flight.in_flight() == 0
@@ -0,0 +1,45 @@
+# tests/utils.py - helpers shared by the test modules
+
+from contextlib import asynccontextmanager
+
+
+def mock_pages(*pages, side_effect=None):
+    """
+    Build a stand-in for GitHubAPIClient.iter_user_project_pages.
+    - yields the given pages (lists of GitHub repo dicts) in order
+    - raises side_effect before the first page if it is given (eg. NotFoundError, ExternalAPIError)
+    """
+    async def iter_user_project_pages(self, username, validators=None):
+        if side_effect is not None:
+            raise side_effect
+        for page in pages:
+            yield page
+    return iter_user_project_pages
+
+
+def mock_writer(projects=(), side_effect=None, add_side_effect=None):
+    """
+    Build a stand-in for UserRepository.create_with_projects.
+    - the writer's projects are the given projects, the pages passed to add() are recorded in .pages
+    - side_effect is raised when the user is created, add_side_effect when projects are added
+    """
+    pages = []
+
+    class MockWriter:
+        def __init__(self, user):
+            self.user = user
+            self.projects = list(projects)
+
+        async def add(self, page):
+            if add_side_effect is not None:
+                raise add_side_effect
+            pages.append(page)
+
+    @asynccontextmanager
+    async def create_with_projects(user):
+        if side_effect is not None:
+            raise side_effect
+        yield MockWriter(user)
+
+    create_with_projects.pages = pages
+    return create_with_projects